@@ -1,21 +1,24 @@
 #!/usr/bin/env python
-import ast
+import argparse
 import csv
 import os
 from pathlib import Path
+from typing import Optional
 
-import matplotlib.cm as cm
 import matplotlib.pyplot as plt
-import pandas as pd
+from pyne.services.diagnostics import plot_alignment, plot_peaks, plot_spectrum_map
+from pyne.services.feature_matrix import build_feature_matrix, write_feature_matrix
+from pyne.services.mzml_converter import convert_mzml_to_csv as convert_mzml_to_csv_file
 from pyne.services.peak_alignment import (
+    align_peaks,
     apply_loess_regression,
     find_master_spectrum,
     find_test_spectrums,
     transform_peaks,
 )
-from pyne.services.preprocessor import preprocess_data
-from pyne.services.spectrum_reader import read_spectra
-from pyteomics import mzml
+from pyne.services.preprocessor import preprocess_peaks
+from pyne.services.profiling import StageProfiler
+from pyne.services.spectrum_reader import read_spectra, read_spectrum, sample_name
 
 current_directory = Path(os.path.abspath(os.getcwd()))
 EXPERIMENT_PATH = current_directory / "src/data"
@@ -23,36 +26,15 @@ EXPERIMENT_PATH = current_directory / "src/data"
 
 def convert_mzml_to_csv():
     for path in EXPERIMENT_PATH.glob("*.mzML"):
-        entry_list = list()
-        with mzml.read(str(path)) as reader:
-            for scan in reader:
-                entry = {
-                    "RT": scan["scanList"]["scan"][0]["scan start time"],
-                    "intarray": scan["intensity array"],
-                    "mzarray": scan["m/z array"],
-                }
-                entry_list.append(entry)
-        df = pd.DataFrame(entry_list, columns=["RT", "intarray", "mzarray"])
         file_name = path.name.split(".")[0]
-        df.to_csv(f"{path.parent}/{file_name}.csv", index=False)
+        convert_mzml_to_csv_file(str(path), f"{path.parent}/{file_name}.csv")
 
 
 def plot_raw_csv():
-    _, ax = plt.subplots()
     for path in EXPERIMENT_PATH.glob("*.csv"):
-        df = pd.read_csv(path)
-
-        for _, row in df.iterrows():
-            intensity_array = ast.literal_eval(row["intensity_array"])
-            mz_array = ast.literal_eval(row["mz_array"])
-            ax.plot(mz_array, intensity_array)
-
-        ax.set_xlabel("m/z")
-        ax.set_ylabel("Intensity")
+        plot_spectrum_map(read_spectrum(str(path)), "raw_spectrum.png", peaks=False)
         break
 
-    plt.show()
-
 
 def plot_scan_functionalities():
     """
@@ -120,15 +102,7 @@ def save_preprocessor_functionalities():
         spectrum.filter_noise(sigma=20)
         spectrum.detect_peaks(thres=7000000, min_dist=60)
 
-    color_map = cm.get_cmap("tab10")
-
-    for i, spectrum in enumerate(spectrums):
-        for peak in spectrum.peaks:
-            plt.scatter(
-                peak.retention_time,
-                peak.intensity,
-                color=color_map(i),
-            )
+    plot_peaks(spectrums, "peaks.png")
     master_spectrum = find_master_spectrum(spectrum_list=spectrums)
     test_spectrums = find_test_spectrums(
         spectrum_list=spectrums, master_spectrum=master_spectrum
@@ -143,31 +117,10 @@ def save_preprocessor_functionalities():
     smoothened_peaks = sorted(
         smoothened_peaks, key=lambda peak: (peak.mz, peak.retention_time)
     )
-    transformed_csv = "transformed.csv"
-    for peak_tuple in transformed_peaks:
-        plt.scatter(
-            peak_tuple[0].retention_time,
-            peak_tuple[0].intensity,
-            color=color_map(4),
-        )
-        plt.scatter(
-            peak_tuple[1].retention_time,
-            peak_tuple[1].intensity,
-            color=color_map(4),
-        )
-
-    for peak in smoothened_peaks:
-        plt.scatter(
-            peak.retention_time,
-            peak.intensity,
-            color=color_map(5),
-        )
-
-    plt.xlabel("Retention Time")
-    plt.ylabel("Intensity")
-    plt.title("Peaks for Each Spectrum")
-    plt.show()
+    align_peaks(spectrum_list=spectrums)
+    plot_alignment(spectrums, "alignment.png")
 
+    transformed_csv = "transformed.csv"
     with open(transformed_csv, "w", newline="") as csvfile:
         fieldnames = ["Peak Index", "Retention Time", "Intensity", "m/z"]
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -211,13 +164,30 @@ def save_preprocessor_functionalities():
             )
 
 
-def run_preprocessor():
+def run_preprocessor(profile_dir: Optional[str] = None):
     file_list = list(str(path) for path in EXPERIMENT_PATH.glob("*.csv"))
-    feature_matrix = preprocess_data(source_files=file_list)
-    csv_file_path = "output.csv"
-
-    feature_matrix.to_csv(csv_file_path, index=False)
+    profiler = StageProfiler(output_dir=profile_dir)
+    clustered_peaks = preprocess_peaks(source_files=file_list, profiler=profiler)
+    profiler.dump()
+    feature_matrix = build_feature_matrix(
+        clustered_peaks_df=clustered_peaks,
+        sample_ids=[sample_name(file) for file in file_list],
+    )
+    write_feature_matrix(feature_matrix, "feature_matrix.npz")
 
 
 if __name__ == "__main__":
-    plot_spectrum_functionalities()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command", nargs="?", choices=["plot", "preprocess"], default="plot"
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Write per-stage .pstats and collapsed stack profiles of the preprocessing to this directory.",
+    )
+    args = parser.parse_args()
+
+    if args.command == "preprocess":
+        run_preprocessor(profile_dir=args.profile_dir)
+    else:
+        plot_spectrum_functionalities()
@@ -0,0 +1,541 @@
+import argparse
+import json
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from os import cpu_count
+from pathlib import Path
+from statistics import mean
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.region import RegionOfInterest
+from pyne.models.spectrum import Spectrum
+from pyne.services.baseline_correction import BASELINE_ENGINES
+from pyne.services.deconvolution import deconvolve_peaks
+from pyne.services.diagnostics import plot_alignment, plot_peaks, plot_spectrum_map
+from pyne.services.feature_grouping import collapse_feature_groups, group_features
+from pyne.services.feature_matrix import (
+    FILE_FORMATS,
+    build_feature_matrix,
+    write_feature_matrix,
+)
+from pyne.services.job_manifest import JobManifest
+from pyne.services.job_service import JobService, serve
+from pyne.services.mzml_converter import convert_mzml_to_csv
+from pyne.services.parameter_sweep import SWEEP_PARAMETERS, sweep_parameters
+from pyne.services.peak_alignment import align_peaks
+from pyne.services.peak_store import read_peaks, write_peaks
+from pyne.services.preprocessor import (
+    cluster_cohort_peaks,
+    detect_spectrum_peaks,
+    preprocess_data,
+)
+from pyne.services.profiling import StageProfiler
+from pyne.services.spectrum_reader import check_sample_names, read_spectrum, sample_name
+
+LOGGER = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return args.handler(args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pyne", description="Metabolomics LC-MS data preprocessing."
+    )
+    subparsers = parser.add_subparsers(required=True, metavar="command")
+
+    convert = subparsers.add_parser(
+        "convert", help="Convert .mzML files to .csv files."
+    )
+    convert.add_argument("inputs", nargs="+", help="Input files or glob patterns.")
+    convert.add_argument(
+        "-o", "--output-dir", required=True, help="Directory for the .csv files."
+    )
+    _add_worker_argument(convert)
+    convert.set_defaults(handler=run_convert)
+
+    preprocess = subparsers.add_parser(
+        "preprocess", help="Preprocess .csv spectra into a feature matrix."
+    )
+    preprocess.add_argument("inputs", nargs="+", help="Input files or glob patterns.")
+    preprocess.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help=f"Output file: .csv for the deconvolved feature table, or one of {FILE_FORMATS} for the wide matrix.",
+    )
+    preprocess.add_argument(
+        "--work-dir",
+        help="Directory for the per-sample peaks and the job manifest (default: <output>.work).",
+    )
+    preprocess.add_argument(
+        "--sparsify-threshold",
+        type=float,
+        help="Drop scan regions at or below this raw intensity at ingest.",
+    )
+    preprocess.add_argument(
+        "--rt-window",
+        action="append",
+        type=parse_range,
+        metavar="LOW:HIGH",
+        help="Targeted run: only process the scans in this retention time window (repeatable).",
+    )
+    preprocess.add_argument(
+        "--mz-range",
+        action="append",
+        type=parse_range,
+        metavar="LOW:HIGH",
+        help="Targeted run: only process this m/z range of the scans (repeatable).",
+    )
+    preprocess.add_argument(
+        "--baseline",
+        choices=sorted(BASELINE_ENGINES),
+        default="polynomial",
+        help="Baseline engine of the baseline alignment stage, with its default parameters. "
+        "Ignored (with a warning) for the scans sparsified by --sparsify-threshold: their baseline is the minimum "
+        "of each kept segment.",
+    )
+    preprocess.add_argument(
+        "--qc-prefilter",
+        action="store_true",
+        help="Skip the scans that cannot reach the peak threshold and the malformed scans.",
+    )
+    preprocess.add_argument(
+        "--config",
+        help="A .json file with the stage parameters (see PipelineConfig), overrides --baseline and --qc-prefilter.",
+    )
+    preprocess.add_argument(
+        "--mass-traces",
+        action="store_true",
+        help="Link the peaks of consecutive scans into mass traces and keep one peak per trace.",
+    )
+    preprocess.add_argument(
+        "--coarse-rt-alignment",
+        action="store_true",
+        help="Pre-align the samples by cross-correlating their total ion chromatograms before peak matching.",
+    )
+    preprocess.add_argument(
+        "--group-features",
+        action="store_true",
+        help="Collapse the isotopologues and adducts of the same compound into one feature (.csv output).",
+    )
+    preprocess.add_argument(
+        "--scan-workers",
+        type=int,
+        default=1,
+        help="Number of threads each sample's scan-level stages are split across.",
+    )
+    preprocess.add_argument(
+        "--intensity-dtype",
+        choices=["float64", "float32"],
+        default="float64",
+        help="Precision of the stored intensities, float32 saves about a quarter of the scan memory "
+        "(m/z values stay float64).",
+    )
+    preprocess.add_argument(
+        "--profile-dir",
+        help="Write per-stage .pstats and collapsed stack profiles to this directory "
+        "(runs everything in a single process).",
+    )
+    _add_worker_argument(preprocess)
+    preprocess.set_defaults(handler=run_preprocess)
+
+    diagnose = subparsers.add_parser(
+        "diagnose", help="Write spectrum, peak and alignment diagnostic plots (PNG)."
+    )
+    diagnose.add_argument("inputs", nargs="+", help="Input files or glob patterns.")
+    diagnose.add_argument(
+        "-o", "--output-dir", required=True, help="Directory for the .png files."
+    )
+    diagnose.set_defaults(handler=run_diagnose)
+
+    bench = subparsers.add_parser(
+        "bench", help="Time the preprocessing stages on the given spectra."
+    )
+    bench.add_argument("inputs", nargs="+", help="Input files or glob patterns.")
+    bench.add_argument("-r", "--repeat", type=int, default=3, help="Number of runs.")
+    bench.add_argument("-o", "--output", help="Write the timings to this .json file.")
+    bench.set_defaults(handler=run_bench)
+
+    sweep = subparsers.add_parser(
+        "sweep",
+        help="Preprocess the spectra with every combination of a parameter grid.",
+    )
+    sweep.add_argument("inputs", nargs="+", help="Input files or glob patterns.")
+    sweep.add_argument(
+        "--grid",
+        required=True,
+        help=f"A .json file mapping parameters to their list of values, parameters: {SWEEP_PARAMETERS}.",
+    )
+    sweep.add_argument(
+        "--config",
+        help="A .json file with the values of the parameters that are not swept.",
+    )
+    sweep.add_argument("-o", "--output", required=True, help="The .csv results table.")
+    _add_worker_argument(sweep)
+    sweep.set_defaults(handler=run_sweep)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run a local HTTP service that preprocesses the submitted jobs with warm workers.",
+    )
+    serve_parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen on."
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=8765, help="Port to listen on."
+    )
+    serve_parser.add_argument(
+        "--max-queued",
+        type=int,
+        default=100,
+        help="Maximum number of unfinished jobs, further submissions are rejected.",
+    )
+    _add_worker_argument(serve_parser)
+    serve_parser.set_defaults(handler=run_serve)
+    return parser
+
+
+def run_convert(args: argparse.Namespace) -> int:
+    source_files = expand_inputs(args.inputs)
+    try:
+        check_sample_names(source_files)
+    except ValueError as error:
+        LOGGER.error(str(error))
+        return 1
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = JobManifest(str(output_dir / "manifest.jsonl"))
+
+    tasks = {
+        source_file: (source_file, str(output_dir / f"{sample_name(source_file)}.csv"))
+        for source_file in source_files
+        if not manifest.is_done(source_file)
+    }
+    LOGGER.info(
+        f"Converting {len(tasks)} files, {len(source_files) - len(tasks)} already done."
+    )
+
+    def on_done(source_file: str, scan_count: int):
+        manifest.mark_done(source_file, tasks[source_file][1], scans=scan_count)
+
+    failures = run_tasks(_convert_file, tasks, args.workers, on_done)
+    return 1 if failures else 0
+
+
+def run_preprocess(args: argparse.Namespace) -> int:
+    source_files = expand_inputs(args.inputs)
+    try:
+        check_sample_names(source_files)
+    except ValueError as error:
+        LOGGER.error(str(error))
+        return 1
+    samples = [sample_name(source_file) for source_file in source_files]
+
+    work_dir = Path(args.work_dir or f"{args.output}.work")
+    peaks_dir = work_dir / "peaks"
+    peaks_dir.mkdir(parents=True, exist_ok=True)
+    manifest = JobManifest(str(work_dir / "manifest.jsonl"))
+    profiler = StageProfiler(output_dir=args.profile_dir)
+    workers = args.workers
+    if profiler.enabled and workers > 1:
+        # the stages only profile this process, the samples are processed here one after the other
+        LOGGER.info(
+            "Profiling runs the samples in a single process, ignoring --workers."
+        )
+        workers = 1
+    config = load_config(args)
+    region = (
+        RegionOfInterest(rt_windows=args.rt_window, mz_ranges=args.mz_range)
+        if args.rt_window or args.mz_range
+        else None
+    )
+
+    # everything that changes the peaks of a sample: a rerun with other values redoes the finished samples
+    options = {
+        "config": config.to_dict(),
+        "sparsify_threshold": args.sparsify_threshold,
+        "intensity_dtype": args.intensity_dtype,
+        "rt_window": args.rt_window,
+        "mz_range": args.mz_range,
+        "mass_traces": args.mass_traces,
+    }
+    tasks = {
+        source_file: (
+            source_file,
+            str(peaks_dir / f"{sample_name(source_file)}.csv"),
+            args.sparsify_threshold,
+            args.scan_workers,
+            args.intensity_dtype,
+            region,
+            args.mass_traces,
+            config,
+            profiler if workers <= 1 else None,
+        )
+        for source_file in source_files
+        if not manifest.is_done(source_file, options)
+    }
+    LOGGER.info(
+        f"Detecting peaks in {len(tasks)} samples, {len(source_files) - len(tasks)} already done."
+    )
+
+    def on_done(source_file: str, peak_count: int):
+        manifest.mark_done(
+            source_file, tasks[source_file][1], options, peaks=peak_count
+        )
+
+    if workers <= 1:
+        failures = run_tasks(_detect_sample_peaks, tasks, workers, on_done)
+    else:
+        # the per-sample stages run in the worker processes, only their total is timed
+        with profiler.stage("sample_peaks"):
+            failures = run_tasks(_detect_sample_peaks, tasks, workers, on_done)
+    if failures:
+        LOGGER.error(
+            f"{len(failures)} samples failed, rerun the same command to retry them."
+        )
+        return 1
+
+    spectrum_list = [
+        Spectrum.from_peaks(
+            peaks=read_peaks(
+                manifest.get(source_file, options)["output"], sample_id=sample
+            ),
+            sample_id=sample,
+        )
+        for source_file, sample in zip(source_files, samples)
+    ]
+    clustered_peaks = cluster_cohort_peaks(
+        spectrum_list=spectrum_list,
+        intensity_dtype=args.intensity_dtype,
+        cluster_workers=workers,
+        coarse_rt_alignment=args.coarse_rt_alignment,
+        profiler=profiler,
+    )
+    with profiler.stage("output"):
+        if Path(args.output).suffix.lower() == ".csv":
+            features = deconvolve_peaks(peaks_df=clustered_peaks, workers=workers)
+            if args.group_features:
+                features = collapse_feature_groups(group_features(features))
+            features.to_csv(args.output, index=False)
+        else:
+            if args.group_features:
+                LOGGER.warning(
+                    "--group-features only applies to the .csv feature table."
+                )
+            feature_matrix = build_feature_matrix(
+                clustered_peaks_df=clustered_peaks, sample_ids=samples
+            )
+            write_feature_matrix(feature_matrix, args.output)
+    profiler.dump()
+    LOGGER.info(f"Wrote {args.output}.")
+    return 0
+
+
+def run_diagnose(args: argparse.Namespace) -> int:
+    source_files = expand_inputs(args.inputs)
+    try:
+        check_sample_names(source_files)
+    except ValueError as error:
+        LOGGER.error(str(error))
+        return 1
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    spectrum_list = []
+    for source_file in source_files:
+        spectrum = read_spectrum(source_file=source_file)
+        plot_spectrum_map(
+            spectrum, str(output_dir / f"{spectrum.sample_id}.raw.png"), peaks=False
+        )
+        detect_spectrum_peaks(spectrum=spectrum)
+        plot_spectrum_map(spectrum, str(output_dir / f"{spectrum.sample_id}.peaks.png"))
+        spectrum_list.append(spectrum)
+    plot_peaks(spectrum_list, str(output_dir / "peaks.png"))
+    if len(spectrum_list) > 1:
+        align_peaks(spectrum_list=spectrum_list)
+        plot_alignment(spectrum_list, str(output_dir / "alignment.png"))
+    return 0
+
+
+def run_bench(args: argparse.Namespace) -> int:
+    source_files = expand_inputs(args.inputs)
+    runs: List[Dict[str, float]] = []
+    for _ in range(args.repeat):
+        profiler = StageProfiler()
+        start = perf_counter()
+        preprocess_data(source_files=source_files, profiler=profiler)
+        runs.append({**profiler.timings, "total": perf_counter() - start})
+
+    stages = list(runs[0])
+    summary = {
+        stage: {
+            "min": min(run[stage] for run in runs),
+            "mean": mean(run[stage] for run in runs),
+        }
+        for stage in stages
+    }
+    print(f"{'stage':<20} {'min [s]':>10} {'mean [s]':>10}")
+    for stage, timing in summary.items():
+        print(f"{stage:<20} {timing['min']:>10.3f} {timing['mean']:>10.3f}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {"files": source_files, "runs": runs, "summary": summary},
+                output_file,
+                indent=2,
+            )
+    return 0
+
+
+def run_sweep(args: argparse.Namespace) -> int:
+    with open(args.grid) as grid_file:
+        grid = json.load(grid_file)
+    config = None
+    if args.config:
+        with open(args.config) as config_file:
+            config = PipelineConfig.from_dict(json.load(config_file))
+    results = sweep_parameters(
+        source_files=expand_inputs(args.inputs),
+        grid=grid,
+        config=config,
+        workers=args.workers,
+    )
+    results.to_csv(args.output, index=False)
+    LOGGER.info(f"Wrote {len(results)} configurations to {args.output}.")
+    return 0
+
+
+def run_serve(args: argparse.Namespace) -> int:
+    serve(
+        JobService(workers=args.workers, max_queued=args.max_queued),
+        host=args.host,
+        port=args.port,
+    )
+    return 0
+
+
+def expand_inputs(inputs: List[str]) -> List[str]:
+    """
+    Expands the glob patterns among the inputs, keeping the order and dropping duplicates.
+    """
+    source_files: List[str] = []
+    for pattern in inputs:
+        matches = sorted(glob(pattern, recursive=True)) or [pattern]
+        source_files.extend(match for match in matches if match not in source_files)
+    missing = [
+        source_file for source_file in source_files if not Path(source_file).is_file()
+    ]
+    if missing:
+        raise SystemExit(f"Input files not found: {missing}")
+    return source_files
+
+
+def load_config(args: argparse.Namespace) -> PipelineConfig:
+    if args.config:
+        with open(args.config) as config_file:
+            return PipelineConfig.from_dict(json.load(config_file))
+    return PipelineConfig(baseline_engine=args.baseline, qc_prefilter=args.qc_prefilter)
+
+
+def parse_range(value: str) -> Tuple[float, float]:
+    """
+    Parses a "LOW:HIGH" command line range.
+    """
+    try:
+        low, high = (float(bound) for bound in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected LOW:HIGH, got {value!r}.")
+    if low > high:
+        raise argparse.ArgumentTypeError(f"The range {value!r} is empty.")
+    return low, high
+
+
+def run_tasks(
+    function: Callable,
+    tasks: Dict[str, Tuple],
+    workers: int,
+    on_done: Callable,
+) -> List[str]:
+    """
+    Runs function(*arguments) for every task, in a process pool when workers > 1, and calls
+    on_done(key, result) in this process as each task finishes.
+    Returns:
+        (List[str]): The keys of the failed tasks.
+    """
+    failures = []
+    if workers <= 1:
+        for key, arguments in tasks.items():
+            try:
+                on_done(key, function(*arguments))
+            except Exception:
+                LOGGER.exception(f"Failed to process {key}.")
+                failures.append(key)
+        return failures
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(function, *arguments): key
+            for key, arguments in tasks.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                on_done(key, future.result())
+            except Exception:
+                LOGGER.exception(f"Failed to process {key}.")
+                failures.append(key)
+    return failures
+
+
+def _convert_file(source_file: str, destination: str) -> int:
+    return convert_mzml_to_csv(source_file=source_file, destination=destination)
+
+
+def _detect_sample_peaks(
+    source_file: str,
+    peaks_path: str,
+    sparsify_threshold: Optional[float],
+    scan_workers: int,
+    intensity_dtype: str,
+    region: Optional[RegionOfInterest],
+    mass_traces: bool,
+    config: PipelineConfig,
+    profiler: Optional[StageProfiler] = None,
+) -> int:
+    if profiler is None:
+        profiler = StageProfiler()
+    with profiler.stage("read"):
+        spectrum = read_spectrum(
+            source_file=source_file,
+            sparsify_threshold=sparsify_threshold,
+            intensity_dtype=intensity_dtype,
+            region=region,
+        )
+    spectrum.workers = scan_workers
+    detect_spectrum_peaks(
+        spectrum=spectrum, mass_traces=mass_traces, config=config, profiler=profiler
+    )
+    write_peaks(spectrum.peaks, peaks_path)
+    return spectrum.peak_count
+
+
+def _add_worker_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=cpu_count() or 1,
+        help="Number of worker processes (default: number of CPUs).",
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
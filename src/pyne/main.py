@@ -0,0 +1,79 @@
+from logging import getLogger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List
+
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.services.preprocessor import preprocess_data
+from pyne.services.profiling import StageProfiler
+from pyne.services.spectrum_reader import check_sample_names
+
+LOGGER = getLogger(__name__)
+
+
+def handler(event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+    """
+    AWS Lambda entry point (the CMD of the Docker image): preprocesses one batch of samples.
+    The S3 endpoint can be overridden with the AWS_ENDPOINT_URL_S3 environment variable, e.g. for a local
+    S3 stand-in.
+    Args:
+        event (Dict[str, Any]): The batch:
+            - "bucket" and "keys": the .csv sample files in S3, or "source_files": local .csv files.
+            - "output_key" (optional): the S3 key the deconvolved feature table (.csv) is uploaded to,
+              or "output" for a local file.
+            - "config" (optional): PipelineConfig values.
+        context (Any): The Lambda context, unused.
+    Returns:
+        (Dict[str, Any]): The feature count, the stage timings in seconds and the output location.
+    """
+    config = PipelineConfig.from_dict(event.get("config") or {})
+    profiler = StageProfiler()
+    with TemporaryDirectory() as work_dir:
+        if "bucket" in event:
+            # rejects keys of the same sample before downloading them, preprocess_data checks local files
+            check_sample_names(event["keys"])
+            with profiler.stage("download"):
+                source_files = _download(event["bucket"], event["keys"], work_dir)
+        else:
+            source_files = event["source_files"]
+
+        features = preprocess_data(
+            source_files=source_files, config=config, profiler=profiler
+        )
+
+        output = event.get("output")
+        if "bucket" in event and event.get("output_key"):
+            with profiler.stage("upload"):
+                output_path = Path(work_dir) / "features.csv"
+                features.to_csv(output_path, index=False)
+                _s3_client().upload_file(
+                    str(output_path), event["bucket"], event["output_key"]
+                )
+            output = f"s3://{event['bucket']}/{event['output_key']}"
+        elif output:
+            features.to_csv(output, index=False)
+    return {
+        "feature_count": len(features),
+        "timings": dict(profiler.timings),
+        "output": output,
+    }
+
+
+def _download(bucket: str, keys: List[str], work_dir: str) -> List[str]:
+    client = _s3_client()
+    source_files = []
+    for index, key in enumerate(keys):
+        # one directory per key, so every downloaded file keeps its name and sample ID
+        path = Path(work_dir) / f"{index}" / Path(key).name
+        path.parent.mkdir()
+        client.download_file(bucket, key, str(path))
+        source_files.append(str(path))
+    LOGGER.info(f"Downloaded {len(keys)} files from s3://{bucket}.")
+    return source_files
+
+
+def _s3_client():
+    # imported here, so that local batches do not need boto3
+    import boto3
+
+    return boto3.client("s3")
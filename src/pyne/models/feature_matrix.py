@@ -0,0 +1,43 @@
+from typing import List
+
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+
+
+class FeatureMatrix:
+    """
+    Represents the preprocessed cohort in wide format: one row per sample, one column per feature (compound).
+    Attributes:
+        sample_ids (List[str]): The ID of the sample belonging to each row.
+        features (DataFrame): One row per column of the matrix, with columns: "label", "RT", "mz", "intensity".
+                              "RT", "mz" and "intensity" describe the deconvolved feature across the cohort.
+        values (csr_matrix): Sparse (samples x features) matrix of intensities.
+                             A missing entry means the feature was not detected in the sample.
+    """
+
+    def __init__(self, sample_ids: List[str], features: DataFrame, values: csr_matrix):
+        self.sample_ids = list(sample_ids)
+        self.features = features
+        self.values = values
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def to_dataframe(self) -> DataFrame:
+        """
+        Returns:
+            (DataFrame): Dense wide DataFrame indexed by sample ID, with one column per feature label.
+                         Features missing from a sample are 0.
+        """
+        return DataFrame(
+            self.values.toarray(),
+            index=self.sample_ids,
+            columns=[str(label) for label in self.features["label"]],
+        ).rename_axis("sample")
+
+    def __repr__(self) -> str:
+        return (
+            f"FeatureMatrix(samples={self.shape[0]}, features={self.shape[1]}, "
+            f"non_zero={self.values.nnz})"
+        )
@@ -0,0 +1,186 @@
+from typing import Callable, List, Optional, Sequence, Union
+
+from numpy import argsort as np_argsort
+from numpy import asarray as np_asarray
+from numpy import flatnonzero as np_flatnonzero
+from numpy import float64, ndarray
+from numpy import zeros as np_zeros
+from scipy.ndimage import gaussian_filter1d
+from scipy.sparse import csr_matrix, issparse
+
+from .peak import Peak
+
+
+class GriddedSpectrum:
+    """
+    Represents a spectrum resampled onto a common m/z grid: one (scans x grid points) intensity matrix, so the
+    scan-level stages run as whole-matrix operations instead of one Python call per scan.
+    The matrix is either a dense array or a scipy CSR matrix. The stages process it in blocks of block_rows
+    scans and produce a dense matrix; a sparse matrix is densified one block at a time.
+
+    Attributes:
+        retention_times (NDArray): The retention time of each scan (row).
+        mz_grid (NDArray): The ascending m/z value of each grid point (column).
+        intensities (NDArray | csr_matrix): The (scans x grid points) intensity matrix.
+        scan_ids (List[str]): The ID of the scan of each row.
+        sample_id (str): The ID of the sample the spectrum was read from.
+        peaks (List[Peak]): The detected peaks, set by detect_peaks.
+        peak_count (int): The number of Peak objects found.
+        block_rows (Optional[int]): The number of rows processed at once, None for the whole matrix.
+    """
+
+    def __init__(
+        self,
+        retention_times: Sequence[float],
+        mz_grid: ndarray,
+        intensities: Union[ndarray, csr_matrix],
+        scan_ids: Optional[List[str]] = None,
+        sample_id: Optional[str] = None,
+        block_rows: Optional[int] = None,
+    ):
+        self.retention_times = np_asarray(retention_times, dtype=float64)
+        self.mz_grid = np_asarray(mz_grid, dtype=float64)
+        self.intensities = intensities
+        self.scan_ids = (
+            list(scan_ids)
+            if scan_ids is not None
+            else [str(index) for index in range(len(self.retention_times))]
+        )
+        self.sample_id = sample_id
+        self.peaks: List[Peak] = []
+        self.peak_count = 0
+        self.block_rows = block_rows
+
+    @property
+    def shape(self):
+        return self.intensities.shape
+
+    @property
+    def is_sparse(self) -> bool:
+        return issparse(self.intensities)
+
+    @property
+    def nbytes(self) -> int:
+        if self.is_sparse:
+            return (
+                self.intensities.data.nbytes
+                + self.intensities.indices.nbytes
+                + self.intensities.indptr.nbytes
+            )
+        return self.intensities.nbytes
+
+    def to_dense(self) -> ndarray:
+        return self.intensities.toarray() if self.is_sparse else self.intensities
+
+    def align_baselines(self, baseline: Callable[[ndarray], ndarray]):
+        """
+        Subtracts the baseline of every scan, estimated for a block of rows at once.
+
+        Args:
+            baseline (Callable[[NDArray], NDArray]): Returns the baseline of each row of a 2D block, see
+                                                     services.baseline_correction.get_matrix_baseline_engine.
+        """
+
+        def subtract(block: ndarray) -> ndarray:
+            block -= baseline(block).astype(block.dtype)
+            return block
+
+        self._transform_blocks(subtract)
+
+    def filter_noise(self, sigma: float):
+        """
+        Applies Gaussian filtering along the m/z axis of every scan.
+
+        Args:
+            sigma (float): Standard deviation for Gaussian kernel, in grid points.
+        """
+        self._transform_blocks(lambda block: gaussian_filter1d(block, sigma, axis=1))
+
+    def detect_peaks(self, thres: float, min_dist: int):
+        """
+        Detects the local maxima above thres along the m/z axis of every scan, as one vectorized comparison per
+        block, then keeps the highest peak within min_dist grid points like peakutils.indexes. Unlike
+        peakutils.indexes, a flat-topped maximum (a plateau) is not a peak.
+
+        Args:
+            thres (float): The absolute intensity threshold.
+            min_dist (int): The minimum distance (in grid points) between two peaks of a scan.
+        """
+        peaks = []
+        for start, stop in self._blocks():
+            block = self.intensities[start:stop]
+            block = block.toarray() if self.is_sparse else block
+            middle = block[:, 1:-1]
+            candidates = (
+                (middle > block[:, :-2]) & (middle > block[:, 2:]) & (middle > thres)
+            )
+            rows, columns = candidates.nonzero()
+            columns = columns + 1
+            row_starts = np_flatnonzero(rows[1:] != rows[:-1]) + 1
+            for row_columns, row in zip(
+                _split(columns, row_starts), _split(rows, row_starts)
+            ):
+                if row_columns.size == 0:
+                    continue
+                row_index = int(row[0])
+                values = block[row_index, row_columns]
+                for column in _suppress_close_peaks(row_columns, values, min_dist):
+                    peaks.append(
+                        Peak(
+                            scan_id=self.scan_ids[start + row_index],
+                            peak_index=int(column),
+                            retention_time=float(
+                                self.retention_times[start + row_index]
+                            ),
+                            intensity=float(block[row_index, column]),
+                            mz=float(self.mz_grid[column]),
+                            sample_id=self.sample_id,
+                        )
+                    )
+        self.peaks = peaks
+        self.peak_count = len(peaks)
+        return peaks
+
+    def _blocks(self):
+        rows = self.shape[0]
+        step = self.block_rows or max(rows, 1)
+        for start in range(0, rows, step):
+            yield start, min(start + step, rows)
+
+    def _transform_blocks(self, function: Callable[[ndarray], ndarray]):
+        if not self.is_sparse:
+            for start, stop in self._blocks():
+                self.intensities[start:stop] = function(self.intensities[start:stop])
+            return
+        dense = np_zeros(self.shape, dtype=self.intensities.dtype)
+        for start, stop in self._blocks():
+            dense[start:stop] = function(self.intensities[start:stop].toarray())
+        self.intensities = dense
+
+    def __repr__(self) -> str:
+        return (
+            f"GriddedSpectrum(scans={self.shape[0]}, grid_points={self.shape[1]}, "
+            f"sparse={self.is_sparse}, sample_id={self.sample_id})"
+        )
+
+
+def _split(values: ndarray, starts: ndarray) -> List[ndarray]:
+    bounds = [0, *starts.tolist(), values.size]
+    return [values[low:high] for low, high in zip(bounds[:-1], bounds[1:])]
+
+
+def _suppress_close_peaks(columns: ndarray, values: ndarray, min_dist: int) -> ndarray:
+    """
+    Keeps the highest peaks, dropping every peak within min_dist of a higher kept one (see peakutils.indexes).
+    """
+    if columns.size < 2 or min_dist <= 1:
+        return columns
+    removed = np_zeros(columns.size, dtype=bool)
+    for position in np_argsort(values, kind="stable")[::-1]:
+        if removed[position]:
+            continue
+        low = columns.searchsorted(columns[position] - min_dist, side="left")
+        high = columns.searchsorted(columns[position] + min_dist, side="right")
+        removed[low:high] = True
+        removed[position] = False
+    return columns[~removed]
@@ -0,0 +1,90 @@
+from concurrent.futures import Future
+from time import time
+from typing import Any, Dict, List, Optional
+
+from .pipeline_config import PipelineConfig
+from .region import RegionOfInterest
+
+
+class Job:
+    """
+    Represents a preprocessing job submitted to the job service (see services.job_service.JobService).
+    Attributes:
+        job_id (str): The id of the job.
+        source_files (List[str]): The .csv files to preprocess.
+        output (Optional[str]): The file the result is written to: .csv for the deconvolved feature table, or a
+                                feature matrix format. When not set, the features are returned in the result.
+        config (PipelineConfig): The parameters of the per-sample stages.
+        region (Optional[RegionOfInterest]): For targeted jobs, see preprocess_data.
+        mass_traces (bool): Keep one peak per mass trace, see preprocess_data.
+        sparsify_threshold (Optional[float]): See preprocess_data.
+        submitted_at (float): The submission time (UNIX timestamp).
+        started_at (Optional[float]): The time a worker started the job.
+        finished_at (Optional[float]): The time the job finished or failed.
+        timings (Dict[str, float]): The wall time of each stage in seconds, and the "total".
+        result (Optional[Dict[str, Any]]): The output file or the features, and the feature count.
+        error (Optional[str]): The error of a failed job.
+        future (Optional[Future]): The future of the job once it is handed to a worker.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        job_id: str,
+        source_files: List[str],
+        output: Optional[str] = None,
+        config: Optional[PipelineConfig] = None,
+        region: Optional[RegionOfInterest] = None,
+        mass_traces: bool = False,
+        sparsify_threshold: Optional[float] = None,
+    ):
+        self.job_id = job_id
+        self.source_files = source_files
+        self.output = output
+        self.config = config if config is not None else PipelineConfig()
+        self.region = region
+        self.mass_traces = mass_traces
+        self.sparsify_threshold = sparsify_threshold
+        self.submitted_at = time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return self.FAILED
+        if self.finished_at is not None:
+            return self.DONE
+        if self.future is not None:
+            return self.RUNNING
+        return self.QUEUED
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "source_files": self.source_files,
+            "output": self.output,
+            "config": self.config.to_dict(),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": self.timings,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    def __repr__(self) -> str:
+        return f"Job(job_id={self.job_id}, status={self.status}, source_files={len(self.source_files)})"
@@ -0,0 +1,77 @@
+from typing import Optional
+
+from numpy import argmax as np_argmax
+from numpy import asarray as np_asarray
+from scipy.integrate import trapezoid
+
+from .peak import Peak
+
+
+class MassTrace:
+    """
+    Represents a chromatographic feature: the peaks of consecutive scans with (nearly) the same m/z, i.e. the
+    elution profile of one ion along the retention time axis.
+    Attributes:
+        peaks (List[Peak]): The linked peaks in retention time order, at most one per scan.
+        sample_id (str): The ID of the sample the trace was found in.
+        last_scan (int): The position (in retention time order) of the scan of the latest peak.
+    """
+
+    def __init__(self, peak: Peak, scan_position: int):
+        self.peaks = [peak]
+        self.sample_id = peak.sample_id
+        self.last_scan = scan_position
+        self._mz_sum = peak.mz
+
+    def extend(self, peak: Peak, scan_position: int):
+        self.peaks.append(peak)
+        self.last_scan = scan_position
+        self._mz_sum += peak.mz
+
+    @property
+    def length(self) -> int:
+        return len(self.peaks)
+
+    @property
+    def mean_mz(self) -> float:
+        return self._mz_sum / len(self.peaks)
+
+    @property
+    def apex(self) -> Peak:
+        return self.peaks[int(np_argmax([peak.intensity for peak in self.peaks]))]
+
+    @property
+    def area(self) -> float:
+        """
+        The area under the elution profile (trapezoidal rule over retention time), the apex intensity for
+        single-peak traces.
+        """
+        if len(self.peaks) == 1:
+            return float(self.peaks[0].intensity)
+        return float(
+            trapezoid(
+                np_asarray([peak.intensity for peak in self.peaks]),
+                np_asarray([peak.retention_time for peak in self.peaks]),
+            )
+        )
+
+    def to_peak(self, intensity: Optional[float] = None) -> Peak:
+        """
+        Returns the feature as a single Peak: the apex retention time and scan, the mean m/z and the area
+        as intensity (unless another intensity is given).
+        """
+        apex = self.apex
+        return Peak(
+            scan_id=apex.scan_id,
+            peak_index=apex.peak_index,
+            retention_time=apex.retention_time,
+            intensity=self.area if intensity is None else intensity,
+            mz=self.mean_mz,
+            sample_id=self.sample_id,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"MassTrace(mz={self.mean_mz}, apex_RT={self.apex.retention_time}, "
+            f"length={self.length}, area={self.area})"
+        )
@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class Peak:
     """
     Represents a single peak in a scan from mass spectrometry data.
@@ -7,6 +10,7 @@ class Peak:
         retention_time (float): Retention Time, indicating when the scan was taken.
         intensity (float): The intensity value of the given peak.
         mz (float): The mass-to-charge ratio (m/z) of a the given peak.
+        sample_id (str): The ID of the sample (Spectrum) the peak was detected in.
     """
 
     def __init__(
@@ -16,12 +20,14 @@ class Peak:
         retention_time: float,
         intensity: float,
         mz: float,
+        sample_id: Optional[str] = None,
     ):
         self.scan_id = scan_id
         self.peak_index = peak_index
         self.retention_time = retention_time
         self.intensity = intensity
         self.mz = mz
+        self.sample_id = sample_id
 
     def __repr__(self) -> str:
         return f"Peak(scan_id= {self.scan_id}, RT={self.retention_time}, intensity={self.intensity}, mz={self.mz})"
@@ -0,0 +1,73 @@
+from typing import Any, Dict, Optional
+
+
+class PipelineConfig:
+    """
+    Represents the parameters of the per-sample preprocessing stages (see detect_spectrum_peaks).
+    Attributes:
+        baseline_engine (str): The name of the baseline engine, one of services.baseline_correction.BASELINE_ENGINES.
+        baseline_params (Dict[str, Any]): The keyword parameters of the baseline engine.
+        noise_sigma (float): Standard deviation of the Gaussian kernel of the noise filter.
+        peak_threshold (float): The absolute intensity threshold of peak detection.
+        peak_min_dist (int): The minimum distance (in points) between two peaks of a scan.
+        mz_grid_resolution (Optional[float]): When set, the scans are resampled onto a common m/z grid with this
+                                              spacing, and the stages run on the (scans x grid) matrix.
+        sparse_grid (bool): Store the resampled matrix as a sparse matrix.
+        qc_prefilter (bool): Drop the scans that cannot reach peak_threshold and the malformed scans before the
+                             scan-level stages, see Spectrum.prefilter_scans.
+        saturation_intensity (Optional[float]): The detector's maximum intensity, for flagging saturated scans.
+    """
+
+    DEFAULT_BASELINE_PARAMS: Dict[str, Dict[str, Any]] = {"polynomial": {"deg": 6}}
+
+    def __init__(
+        self,
+        baseline_engine: str = "polynomial",
+        baseline_params: Optional[Dict[str, Any]] = None,
+        noise_sigma: float = 0.7,
+        peak_threshold: float = 7000000,
+        peak_min_dist: int = 60,
+        mz_grid_resolution: Optional[float] = None,
+        sparse_grid: bool = False,
+        qc_prefilter: bool = False,
+        saturation_intensity: Optional[float] = None,
+    ):
+        self.baseline_engine = baseline_engine
+        self.baseline_params = (
+            dict(baseline_params)
+            if baseline_params is not None
+            else dict(self.DEFAULT_BASELINE_PARAMS.get(baseline_engine, {}))
+        )
+        self.noise_sigma = noise_sigma
+        self.peak_threshold = peak_threshold
+        self.peak_min_dist = peak_min_dist
+        self.mz_grid_resolution = mz_grid_resolution
+        self.sparse_grid = sparse_grid
+        self.qc_prefilter = qc_prefilter
+        self.saturation_intensity = saturation_intensity
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "PipelineConfig":
+        """
+        Creates the config from a dictionary (e.g. parsed JSON), missing keys take their default value.
+        """
+        unknown = set(values) - set(cls().to_dict())
+        if unknown:
+            raise ValueError(f"Unknown pipeline config keys: {sorted(unknown)}.")
+        return cls(**values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "baseline_engine": self.baseline_engine,
+            "baseline_params": dict(self.baseline_params),
+            "noise_sigma": self.noise_sigma,
+            "peak_threshold": self.peak_threshold,
+            "peak_min_dist": self.peak_min_dist,
+            "mz_grid_resolution": self.mz_grid_resolution,
+            "sparse_grid": self.sparse_grid,
+            "qc_prefilter": self.qc_prefilter,
+            "saturation_intensity": self.saturation_intensity,
+        }
+
+    def __repr__(self) -> str:
+        return f"PipelineConfig({self.to_dict()})"
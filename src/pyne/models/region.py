@@ -0,0 +1,94 @@
+from typing import List, Optional, Sequence, Tuple
+
+from numpy import arange as np_arange
+from numpy import argsort as np_argsort
+from numpy import asarray as np_asarray
+from numpy import concatenate as np_concatenate
+from numpy import int64 as np_int64
+from numpy import ndarray
+from numpy import sort as np_sort
+
+Range = Tuple[float, float]
+
+
+class RegionOfInterest:
+    """
+    Represents the part of the data a targeted run cares about: a set of retention time windows and a set of
+    m/z ranges. Both ends of a window or range are inclusive, and None means no restriction.
+    Attributes:
+        rt_windows (Optional[List[Tuple[float, float]]]): Sorted, non-overlapping retention time windows.
+        mz_ranges (Optional[List[Tuple[float, float]]]): Sorted, non-overlapping m/z ranges.
+    """
+
+    def __init__(
+        self,
+        rt_windows: Optional[Sequence[Range]] = None,
+        mz_ranges: Optional[Sequence[Range]] = None,
+    ):
+        self.rt_windows = merge_ranges(rt_windows) if rt_windows is not None else None
+        self.mz_ranges = merge_ranges(mz_ranges) if mz_ranges is not None else None
+
+    def retention_time_indexes(self, retention_times: Sequence[float]) -> ndarray:
+        """
+        Args:
+            retention_times (Sequence[float]): The retention time of each scan, in any order.
+        Returns:
+            (NDArray): The sorted positions of the scans inside the retention time windows.
+        """
+        retention_times = np_asarray(retention_times, dtype=float)
+        if self.rt_windows is None:
+            return np_arange(retention_times.size)
+        order = np_argsort(retention_times, kind="stable")
+        positions = [
+            order[start:stop]
+            for start, stop in sorted_range_slices(
+                retention_times[order], self.rt_windows
+            )
+        ]
+        if not positions:
+            return np_asarray([], dtype=np_int64)
+        return np_sort(np_concatenate(positions))
+
+    def mz_slices(self, mz_array: ndarray) -> List[Tuple[int, int]]:
+        """
+        Args:
+            mz_array (NDArray): Ascending m/z values.
+        Returns:
+            (List[Tuple[int, int]]): The non-empty (start, stop) slices of mz_array inside the m/z ranges.
+        """
+        if self.mz_ranges is None:
+            return [(0, len(mz_array))] if len(mz_array) else []
+        return sorted_range_slices(mz_array, self.mz_ranges)
+
+    def __repr__(self) -> str:
+        return f"RegionOfInterest(rt_windows={self.rt_windows}, mz_ranges={self.mz_ranges})"
+
+
+def merge_ranges(ranges: Sequence[Range]) -> List[Range]:
+    """
+    Returns the ranges sorted, with the overlapping ones merged.
+    """
+    merged: List[Range] = []
+    for low, high in sorted((float(low), float(high)) for low, high in ranges):
+        if low > high:
+            raise ValueError(f"Invalid range: ({low}, {high}).")
+        if merged and low <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def sorted_range_slices(
+    sorted_values: ndarray, ranges: List[Range]
+) -> List[Tuple[int, int]]:
+    """
+    Returns the non-empty (start, stop) slices of the ascending values that fall into each of the sorted ranges.
+    """
+    lows = np_asarray([low for low, _ in ranges])
+    highs = np_asarray([high for _, high in ranges])
+    starts = sorted_values.searchsorted(lows, side="left")
+    stops = sorted_values.searchsorted(highs, side="right")
+    return [
+        (int(start), int(stop)) for start, stop in zip(starts, stops) if stop > start
+    ]
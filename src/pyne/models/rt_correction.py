@@ -0,0 +1,70 @@
+from typing import Hashable, Optional, Sequence, Union
+
+from numpy import asarray as np_asarray
+from numpy import interp as np_interp
+from numpy import ndarray
+
+
+class RetentionTimeCorrection:
+    """
+    Represents the retention time drift of one spectrum relative to the master spectrum.
+    The drift function is stored as a lookup table and evaluated with linear interpolation.
+    Outside the fitted range the drift at the closest knot is used.
+    Attributes:
+        rt_knots (NDArray): Sorted retention time values of the test spectrum, where the drift is known.
+        drift_knots (NDArray): Drift (master RT - test RT) for each value in rt_knots.
+        pair_count (int): The number of matched (master, test) peak pairs the model was fitted on.
+        master_spectrum_id (str): The ID of the master spectrum the model was fitted against.
+        rt_scale (float): The scale of the coarse alignment (master RT = rt_scale * test RT + rt_shift) the pairs
+                          were matched around, 1.0 without coarse alignment.
+        rt_shift (float): The shift of the coarse alignment, 0.0 without coarse alignment.
+        rt_window (Optional[float]): The retention time window the pairs were matched in.
+        fit_key (Optional[Hashable]): The fit parameters and the peak fingerprints of both spectrums the model was
+                                      fitted with, a cached model is only reused for the same key (see align_peaks).
+    """
+
+    def __init__(
+        self,
+        rt_knots: Sequence[float],
+        drift_knots: Sequence[float],
+        pair_count: int = 0,
+        master_spectrum_id: Optional[str] = None,
+        rt_scale: float = 1.0,
+        rt_shift: float = 0.0,
+        rt_window: Optional[float] = None,
+        fit_key: Optional[Hashable] = None,
+    ):
+        self.rt_knots = np_asarray(rt_knots, dtype=float)
+        self.drift_knots = np_asarray(drift_knots, dtype=float)
+        self.pair_count = pair_count
+        self.master_spectrum_id = master_spectrum_id
+        self.rt_scale = rt_scale
+        self.rt_shift = rt_shift
+        self.rt_window = rt_window
+        self.fit_key = fit_key
+
+    def drift(self, retention_time: Union[float, ndarray]) -> Union[float, ndarray]:
+        """
+        Args:
+            retention_time (float | NDArray): Retention time value(s) of the test spectrum.
+        Returns:
+            (float | NDArray): The estimated drift for the given retention time value(s).
+        """
+        if self.rt_knots.size == 0:
+            return retention_time * 0.0
+        return np_interp(retention_time, self.rt_knots, self.drift_knots)
+
+    def correct(self, retention_time: Union[float, ndarray]) -> Union[float, ndarray]:
+        """
+        Args:
+            retention_time (float | NDArray): Retention time value(s) of the test spectrum.
+        Returns:
+            (float | NDArray): The retention time value(s) mapped onto the master spectrum.
+        """
+        return retention_time + self.drift(retention_time)
+
+    def __repr__(self) -> str:
+        return (
+            f"RetentionTimeCorrection(knots={self.rt_knots.size}, "
+            f"pair_count={self.pair_count})"
+        )
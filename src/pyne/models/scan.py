@@ -1,11 +1,23 @@
-from typing import List
+from typing import Callable, Iterator, List, Optional, Tuple
 from uuid import uuid4
 
+from numpy import arange as np_arange
 from numpy import array as np_array
-from peakutils import indexes as peakutils_indexes
+from numpy import asarray as np_asarray
+from numpy import concatenate as np_concatenate
+from numpy import diff as np_diff
+from numpy import flatnonzero as np_flatnonzero
+from numpy import float64 as np_float64
+from numpy import int8 as np_int8
+from numpy import int64 as np_int64
+from numpy import ndarray
+from numpy.typing import DTypeLike
 from peakutils import baseline as peakutils_baseline
+from peakutils import indexes as peakutils_indexes
+from scipy.ndimage import binary_dilation, gaussian_filter1d
+
 from .peak import Peak
-from scipy.ndimage import gaussian_filter1d
+from .region import RegionOfInterest
 
 
 class Scan:
@@ -14,31 +26,132 @@ class Scan:
     Attributes:
         scan_id (str): A unique identifier for the scan.
         retention_time (float): Retention Time, indicating when the scan was taken.
-        mz_array (List[float]): List of mass-to-charge ratios (m/z) detected in this scan.
-        intensity_array (List[float]): List of intensities corresponding to each m/z value in mz_array.
+        mz_array (NDArray): Mass-to-charge ratios (m/z) detected in this scan, stored as float64.
+        intensity_array (NDArray): Intensities corresponding to each m/z value in mz_array, stored with the
+                                   intensity dtype of the pipeline (float64 by default). float32 halves the intensity
+                                   bytes, which saves about a quarter of the scan's memory as mz_array stays float64.
+        segment_bounds (NDArray): Start positions of the contiguous segments in mz_array and intensity_array,
+                                  followed by the length of the arrays. A profile scan is a single segment.
+        segment_offsets (NDArray): Position of each segment's first point in the original profile scan.
+        sparsified (bool): Whether the empty regions of the scan were dropped (see sparsify).
     Note:
-        Changes intensity_array attribute to type NDArray.
+        The baseline is always fitted in float64, only the stored intensities use the intensity dtype.
+        With float32 the detected peaks match the float64 path, and intensities agree within float32 rounding
+        (relative error around 1e-7 of the scan maximum), see tests/test_precision.py.
     """
 
     def __init__(
-        self, retention_time: float, mz_array: List[float], intensity_array: List[float]
+        self,
+        retention_time: float,
+        mz_array: List[float],
+        intensity_array: List[float],
+        intensity_dtype: DTypeLike = np_float64,
     ):
         self.scan_id = str(uuid4())
         self.retention_time = retention_time
-        self.mz_array = mz_array
-        self.intensity_array = np_array(intensity_array)
+        self.mz_array = np_asarray(mz_array, dtype=np_float64)
+        self.intensity_array = np_array(intensity_array, dtype=intensity_dtype)
+        self.segment_bounds = np_array([0, len(self.intensity_array)], dtype=np_int64)
+        self.segment_offsets = np_array([0], dtype=np_int64)
+        self.sparsified = False
+
+    @property
+    def is_sparse(self) -> bool:
+        """
+        Whether the scan was sparsified or holds several segments. A scan sparsified down to one segment is still
+        sparse: its segment spans only part of the profile scan.
+        """
+        return self.sparsified or len(self.segment_offsets) != 1
+
+    def segments(self) -> Iterator[Tuple[int, int]]:
+        """
+        Yields the (start, stop) positions of the contiguous segments in intensity_array.
+        """
+        for start, stop in zip(self.segment_bounds[:-1], self.segment_bounds[1:]):
+            yield int(start), int(stop)
 
-    def align_baseline(self, deg: int):
+    def sparsify(self, threshold: float, pad: int = 5):
         """
-        Aligns the baseline of the scan's intensity array.
+        Keeps only the segments of the scan where the intensity is above the threshold, extended by pad points
+        on both sides. The stages below then run on each kept segment separately, and the detected peaks keep
+        their position in the original profile scan.
 
         Args:
-            deg (int): Degree of the polynomial for fitting the baseline.
+            threshold (float): Points with intensity at or below this value are considered empty.
+            pad (int): The number of points kept around each non-empty region, as context for the stages below.
+        """
+        runs = []
+        for (start, stop), offset in zip(self.segments(), self.segment_offsets):
+            mask = self.intensity_array[start:stop] > threshold
+            if pad > 0 and mask.any():
+                mask = binary_dilation(mask, iterations=pad)
+            edges = np_diff(np_concatenate(([0], mask.astype(np_int8), [0])))
+            for run_start, run_stop in zip(
+                np_flatnonzero(edges == 1), np_flatnonzero(edges == -1)
+            ):
+                runs.append((start + run_start, start + run_stop, offset + run_start))
+        self._keep_runs(runs)
+        self.sparsified = True
+
+    def select_mz_ranges(self, region: RegionOfInterest):
         """
-        baseline = peakutils_baseline(self.intensity_array.astype(float), deg=deg)
-        self.intensity_array = self.intensity_array.astype(float) - baseline.astype(
-            float
+        Keeps only the points of the scan inside the m/z ranges of the region, found with a binary search on the
+        ascending mz_array. Each range becomes a segment of its own.
+
+        Args:
+            region (RegionOfInterest): The region whose m/z ranges are kept.
+        """
+        if region.mz_ranges is None:
+            return
+        runs = []
+        for (start, stop), offset in zip(self.segments(), self.segment_offsets):
+            for run_start, run_stop in region.mz_slices(self.mz_array[start:stop]):
+                runs.append((start + run_start, start + run_stop, offset + run_start))
+        self._keep_runs(runs)
+
+    def _keep_runs(self, runs: List[Tuple[int, int, int]]):
+        """
+        Keeps the given (start, stop, profile offset) runs of the arrays as the new segments.
+        """
+        index = (
+            np_concatenate([np_arange(start, stop) for start, stop, _ in runs])
+            if runs
+            else np_array([], dtype=np_int64)
         )
+        bounds = [0]
+        for start, stop, _ in runs:
+            bounds.append(bounds[-1] + stop - start)
+        self.mz_array = self.mz_array[index]
+        self.intensity_array = self.intensity_array[index]
+        self.segment_bounds = np_array(bounds, dtype=np_int64)
+        self.segment_offsets = np_array(
+            [offset for _, _, offset in runs], dtype=np_int64
+        )
+
+    def align_baseline(
+        self, deg: int = 6, baseline: Optional[Callable[[ndarray], ndarray]] = None
+    ):
+        """
+        Aligns the baseline of the scan's intensity array, fitting each segment separately.
+        For sparsified scans the minimum of each segment is used as its baseline: the removed regions are the
+        baseline already, and a polynomial fitted over a narrow segment would follow the peak instead.
+
+        Args:
+            deg (int): Degree of the polynomial for fitting the baseline.
+            baseline (Optional[Callable[[NDArray], NDArray]]): Estimates the baseline of a segment, replacing the
+                                                              polynomial fit (see services.baseline_correction).
+                                                              Ignored for sparsified scans, like deg.
+        """
+        for start, stop in self.segments():
+            if stop == start:
+                continue
+            segment = self.intensity_array[start:stop]
+            if self.sparsified:
+                segment -= segment.min()
+            elif baseline is not None:
+                segment -= baseline(segment).astype(segment.dtype)
+            else:
+                segment -= peakutils_baseline(segment, deg=deg).astype(segment.dtype)
 
     def filter_noise(self, sigma: float):
         """
@@ -47,7 +160,13 @@ class Scan:
         Args:
             sigma (float): Standard deviation for Gaussian kernel, controls the degree of smoothing.
         """
-        self.intensity_array = gaussian_filter1d(self.intensity_array, sigma)
+        if not self.is_sparse:
+            self.intensity_array = gaussian_filter1d(self.intensity_array, sigma)
+            return
+        for start, stop in self.segments():
+            self.intensity_array[start:stop] = gaussian_filter1d(
+                self.intensity_array[start:stop], sigma
+            )
 
     def get_peaks(self, thres: float, min_dist: int) -> List[Peak]:
         """
@@ -57,22 +176,35 @@ class Scan:
             thres (float): The threshold relative to the maximum intensity for peak detection.
             min_dist (int): The minimum distance between each detected peak.
         """
-        peak_indexes = peakutils_indexes(
-            self.intensity_array, thres=thres, min_dist=min_dist, thres_abs=True
-        ).tolist()
         peaks = []
-        for index in peak_indexes:
-            peaks.append(
-                Peak(
-                    scan_id=self.scan_id,
-                    peak_index=index,
-                    retention_time=self.retention_time,
-                    intensity=float(self.intensity_array[index]),
-                    mz=self.mz_array[index],
+        for (start, stop), offset in zip(self.segments(), self.segment_offsets):
+            if stop - start < 3:
+                continue
+            peak_indexes = peakutils_indexes(
+                self.intensity_array[start:stop],
+                thres=thres,
+                min_dist=min_dist,
+                thres_abs=True,
+            ).tolist()
+            for index in peak_indexes:
+                peaks.append(
+                    Peak(
+                        scan_id=self.scan_id,
+                        peak_index=int(offset) + index,
+                        retention_time=self.retention_time,
+                        intensity=float(self.intensity_array[start + index]),
+                        mz=float(self.mz_array[start + index]),
+                    )
                 )
-            )
         return peaks
 
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate number of bytes held by the scan's m/z and intensity values.
+        """
+        return self.intensity_array.nbytes + self.mz_array.nbytes
+
     def __repr__(self) -> str:
         return (
             f"Scan(retention_time={self.retention_time}, "
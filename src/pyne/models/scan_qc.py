@@ -0,0 +1,75 @@
+from typing import Any, Dict
+
+from numpy import ndarray
+
+
+class ScanQCReport:
+    """
+    Represents the result of the scan-level QC prefilter of a spectrum (see Spectrum.prefilter_scans).
+    All arrays have one value per scan of the spectrum before filtering, in scan order.
+    Attributes:
+        retention_times (NDArray): The retention time of each scan.
+        tic (NDArray): The total ion current (sum of intensities) of each scan.
+        max_intensity (NDArray): The highest intensity of each scan.
+        lengths (NDArray): The number of points of each scan.
+        below_threshold (NDArray): Scans whose maximum is at or below the detection threshold, so no peak can pass.
+        saturated (NDArray): Scans with a flat top at the maximum (or reaching the saturation intensity),
+                             i.e. a detector clipped signal.
+        malformed (NDArray): Scans that cannot be processed: empty, m/z and intensity lengths differ,
+                             non-finite values or m/z values that are not ascending.
+        dropped (NDArray): The scans removed from the spectrum.
+    """
+
+    def __init__(
+        self,
+        retention_times: ndarray,
+        tic: ndarray,
+        max_intensity: ndarray,
+        lengths: ndarray,
+        below_threshold: ndarray,
+        saturated: ndarray,
+        malformed: ndarray,
+        dropped: ndarray,
+    ):
+        self.retention_times = retention_times
+        self.tic = tic
+        self.max_intensity = max_intensity
+        self.lengths = lengths
+        self.below_threshold = below_threshold
+        self.saturated = saturated
+        self.malformed = malformed
+        self.dropped = dropped
+
+    @property
+    def scan_count(self) -> int:
+        return int(self.lengths.size)
+
+    @property
+    def skipped_scans(self) -> int:
+        return int(self.dropped.sum())
+
+    @property
+    def skipped_points(self) -> int:
+        return int(self.lengths[self.dropped].sum())
+
+    @property
+    def skipped_fraction(self) -> float:
+        """
+        The fraction of the points (i.e. of the scan-level work) removed by the prefilter.
+        """
+        total = int(self.lengths.sum())
+        return self.skipped_points / total if total else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "scans": self.scan_count,
+            "below_threshold": int(self.below_threshold.sum()),
+            "saturated": int(self.saturated.sum()),
+            "malformed": int(self.malformed.sum()),
+            "skipped_scans": self.skipped_scans,
+            "skipped_points": self.skipped_points,
+            "skipped_fraction": self.skipped_fraction,
+        }
+
+    def __repr__(self) -> str:
+        return f"ScanQCReport({self.summary()})"
@@ -1,5 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Callable, List, Optional, TypeVar
+from uuid import uuid4
+
+from numpy import add as np_add
+from numpy import concatenate as np_concatenate
+from numpy import cumsum as np_cumsum
+from numpy import float64
+from numpy import fromiter as np_fromiter
+from numpy import full as np_full
+from numpy import inf as np_inf
+from numpy import int64 as np_int64
+from numpy import isfinite as np_isfinite
+from numpy import maximum as np_maximum
+from numpy import ndarray
+from numpy import repeat as np_repeat
+from numpy import where as np_where
+from numpy import zeros as np_zeros
+from numpy.typing import DTypeLike
 from pandas import DataFrame
+
+from .peak import Peak
+from .region import RegionOfInterest
 from .scan import Scan
+from .scan_qc import ScanQCReport
+from .xic_index import XICIndex
+
+LOGGER = getLogger(__name__)
+
+T = TypeVar("T")
 
 
 class Spectrum:
@@ -8,12 +37,27 @@ class Spectrum:
     a Sample in the API layer, however the internals here are different, thus the different name.
 
     Attributes:
+        spectrum_id (str): A unique identifier for the spectrum.
+        sample_id (str): The ID of the sample the spectrum was read from, defaults to spectrum_id.
         scans (List[Scan]): A list of Scan objects representing the individual scans in the spectrum.
         peaks (List[Peak]): A list of Peak objects representing all peaks found across scans in the spectrum.
         peak_count (int): The number of Peak objects found.
+        rt_correction (RetentionTimeCorrection): The retention time drift model relative to the master spectrum,
+                                                 set during peak alignment.
+        xic_index (XICIndex): The extracted-ion chromatogram index of the spectrum, set by build_xic_index.
+        qc_report (ScanQCReport): The result of the scan-level QC prefilter, set by prefilter_scans.
+        workers (int): The number of threads the scan-level stages (baseline alignment, noise filtering and
+                       peak detection) are split across. The heavy numpy/scipy parts release the GIL, so this
+                       lowers the latency of a single large spectrum.
     """
 
-    def __init__(self, df: DataFrame):
+    def __init__(
+        self,
+        df: DataFrame,
+        sample_id: Optional[str] = None,
+        workers: int = 1,
+        intensity_dtype: DTypeLike = float64,
+    ):
         """
         Initializes the Spectrum object from a pandas DataFrame.
 
@@ -24,27 +68,188 @@ class Spectrum:
 
         Args:
             df (pd.DataFrame): DataFrame containing mass spectrometry scan data.
+            sample_id (Optional[str]): The ID of the sample, e.g. the name of the source file.
+            workers (int): The number of threads used by the scan-level stages.
+            intensity_dtype (DTypeLike): The dtype the scans store their intensities in, see Scan.
         """
+        self.spectrum_id = str(uuid4())
+        self.sample_id = sample_id if sample_id is not None else self.spectrum_id
         self.scans = [
             Scan(
                 retention_time=row["RT"],
                 mz_array=row["mz_array"],
                 intensity_array=row["intensity_array"],
+                intensity_dtype=intensity_dtype,
             )
             for _, row in df.iterrows()
         ]
         self.peaks = []
         self.peak_count = 0
+        self.rt_correction = None
+        self.xic_index = None
+        self.qc_report = None
+        self.workers = workers
+
+    @classmethod
+    def from_peaks(cls, peaks: List[Peak], sample_id: str) -> "Spectrum":
+        """
+        Creates a Spectrum without scans from already detected peaks, e.g. peaks stored by an earlier run.
+
+        Args:
+            peaks (List[Peak]): The detected peaks of the sample.
+            sample_id (str): The ID of the sample.
+        """
+        spectrum = cls(
+            DataFrame(columns=["RT", "mz_array", "intensity_array"]),
+            sample_id=sample_id,
+        )
+        spectrum.peaks = list(peaks)
+        spectrum.peak_count = len(spectrum.peaks)
+        return spectrum
+
+    def build_xic_index(self, bin_width: float = 0.01) -> XICIndex:
+        """
+        Builds the m/z-binned index of the spectrum's points, for extracted-ion chromatogram queries.
+        The index holds a copy of the current intensities, it is not updated by the later stages.
+
+        Args:
+            bin_width (float): The width of the m/z bins, see XICIndex.
+        """
+        self.xic_index = XICIndex(self.scans, bin_width=bin_width)
+        return self.xic_index
+
+    def prefilter_scans(
+        self,
+        thres: float,
+        saturation_intensity: Optional[float] = None,
+        saturation_run: int = 3,
+        drop_saturated: bool = False,
+    ) -> ScanQCReport:
+        """
+        A vectorized QC pass over all scans at once (one reduceat per statistic over the concatenated arrays),
+        run before the scan-level stages. Drops the scans that cannot produce a peak, because their maximum is at
+        or below the absolute detection threshold, and the malformed scans; flags the saturated ones.
+        The baseline and the noise filter do not raise the maximum of a scan as long as the fitted baseline is
+        not negative, so with the minimum (sparsified), rolling minimum and morphological baselines the detected
+        peaks are unchanged; a polynomial overshooting below zero could in rare cases lift a point above thres.
+
+        Args:
+            thres (float): The absolute intensity threshold of peak detection.
+            saturation_intensity (Optional[float]): The detector's maximum, scans reaching it are saturated.
+            saturation_run (int): A scan whose maximum value occurs at least this many times (a clipped, flat top)
+                                  is saturated.
+            drop_saturated (bool): Drop the saturated scans too, instead of only flagging them.
+        Returns:
+            (ScanQCReport): The per-scan statistics and flags, also stored as qc_report.
+        """
+        count = len(self.scans)
+        lengths = np_fromiter(
+            (scan.intensity_array.size for scan in self.scans),
+            dtype=np_int64,
+            count=count,
+        )
+        mz_lengths = np_fromiter(
+            (scan.mz_array.size for scan in self.scans), dtype=np_int64, count=count
+        )
+        tic = np_zeros(count)
+        max_intensity = np_full(count, -np_inf)
+        invalid = np_zeros(count, dtype=np_int64)
+        at_max = np_zeros(count, dtype=np_int64)
+        nonempty = lengths > 0
+        if nonempty.any():
+            intensities = np_concatenate([scan.intensity_array for scan in self.scans])
+            finite = np_isfinite(intensities)
+            starts = (np_cumsum(lengths) - lengths)[nonempty]
+            tic[nonempty] = np_add.reduceat(
+                np_where(finite, intensities, 0.0), starts, dtype=float64
+            )
+            max_intensity[nonempty] = np_maximum.reduceat(
+                np_where(finite, intensities, -np_inf), starts
+            )
+            invalid[nonempty] = np_add.reduceat(~finite, starts, dtype=np_int64)
+            at_max[nonempty] = np_add.reduceat(
+                intensities == np_repeat(max_intensity, lengths), starts, dtype=np_int64
+            )
+
+            mz = np_concatenate([scan.mz_array for scan in self.scans])
+            mz_nonempty = mz_lengths > 0
+            mz_starts = (np_cumsum(mz_lengths) - mz_lengths)[mz_nonempty]
+            descending = np_zeros(mz.size, dtype=bool)
+            descending[1:] = mz[1:] < mz[:-1]
+            # the first point of a scan is not compared with the last point of the previous one
+            descending[mz_starts] = False
+            invalid[mz_nonempty] += np_add.reduceat(
+                descending | ~np_isfinite(mz), mz_starts, dtype=np_int64
+            )
+
+        malformed = ~nonempty | (lengths != mz_lengths) | (invalid > 0)
+        below_threshold = ~malformed & (max_intensity <= thres)
+        saturated = ~malformed & (max_intensity > 0) & (at_max >= saturation_run)
+        if saturation_intensity is not None:
+            saturated |= ~malformed & (max_intensity >= saturation_intensity)
+        dropped = malformed | below_threshold | (saturated & drop_saturated)
 
-    def align_baselines(self, deg: int):
+        self.qc_report = ScanQCReport(
+            retention_times=np_fromiter(
+                (scan.retention_time for scan in self.scans), dtype=float64, count=count
+            ),
+            tic=tic,
+            max_intensity=max_intensity,
+            lengths=lengths,
+            below_threshold=below_threshold,
+            saturated=saturated,
+            malformed=malformed,
+            dropped=dropped,
+        )
+        self.scans = [
+            scan for scan, drop in zip(self.scans, dropped.tolist()) if not drop
+        ]
+        return self.qc_report
+
+    def select_region(self, region: RegionOfInterest):
+        """
+        Keeps only the scans inside the retention time windows of the region, and slices their arrays to the
+        region's m/z ranges, so that the later stages only process the region of interest.
+
+        Args:
+            region (RegionOfInterest): The region to keep.
+        """
+        retention_times = [scan.retention_time for scan in self.scans]
+        self.scans = [
+            self.scans[index]
+            for index in region.retention_time_indexes(retention_times)
+        ]
+        self._map_scans(lambda scan: scan.select_mz_ranges(region))
+
+    def sparsify(self, threshold: float, pad: int = 5):
+        """
+        Drops the empty regions of all scans in the spectrum, keeping the non-empty segments and their offsets.
+        See Scan.sparsify.
+
+        Args:
+            threshold (float): Points with intensity at or below this value are considered empty.
+            pad (int): The number of points kept around each non-empty region.
+        """
+        self._map_scans(lambda scan: scan.sparsify(threshold, pad))
+
+    def align_baselines(
+        self, deg: int = 6, baseline: Optional[Callable[[ndarray], ndarray]] = None
+    ):
         """
         Aligns the baselines of the intensity arrays of all scans in the spectrum.
 
         Args:
             deg (int): Degree of the polynomial for fitting the baseline.
+            baseline (Optional[Callable[[NDArray], NDArray]]): Estimates the baseline of a segment, replacing the
+                                                              polynomial fit, see Scan.align_baseline. Sparsified
+                                                              scans ignore it (and deg), with a warning.
         """
-        for scan in self.scans:
-            scan.align_baseline(deg)
+        if baseline is not None and any(scan.sparsified for scan in self.scans):
+            LOGGER.warning(
+                f"The scans of {self.sample_id} are sparsified, their baselines are the segment minimums: "
+                "the baseline engine is ignored."
+            )
+        self._map_scans(lambda scan: scan.align_baseline(deg, baseline))
 
     def filter_noise(self, sigma: float):
         """
@@ -53,8 +258,7 @@ class Spectrum:
         Args:
             sigma (float): Standard deviation for Gaussian kernel, controls the degree of smoothing.
         """
-        for scan in self.scans:
-            scan.filter_noise(sigma)
+        self._map_scans(lambda scan: scan.filter_noise(sigma))
 
     def detect_peaks(self, thres: float, min_dist: int):
         """
@@ -64,11 +268,39 @@ class Spectrum:
             thres (float): The threshold relative to the maximum intensity for peak detection.
             min_dist (int): The minimum distance between each detected peak.
         """
-        for scan in self.scans:
-            scan_peaks = scan.get_peaks(thres, min_dist)
+        for scan_peaks in self._map_scans(lambda scan: scan.get_peaks(thres, min_dist)):
+            for peak in scan_peaks:
+                peak.sample_id = self.sample_id
             self.peaks.extend(scan_peaks)
 
         self.peak_count = len(self.peaks)
 
+    def _map_scans(self, function: Callable[[Scan], T]) -> List[T]:
+        """
+        Applies the function to every scan and returns the results in scan order.
+        With more than one worker the scans are split into contiguous chunks processed on a thread pool.
+        """
+        if self.workers <= 1 or len(self.scans) < 2:
+            return [function(scan) for scan in self.scans]
+
+        chunk_count = min(len(self.scans), self.workers * 4)
+        chunk_size = -(-len(self.scans) // chunk_count)
+        chunks = [
+            self.scans[start : start + chunk_size]
+            for start in range(0, len(self.scans), chunk_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            chunk_results = executor.map(
+                lambda chunk: [function(scan) for scan in chunk], chunks
+            )
+            return [result for results in chunk_results for result in results]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate number of bytes held by the m/z and intensity values of all scans in the spectrum.
+        """
+        return sum(scan.nbytes for scan in self.scans)
+
     def __repr__(self) -> str:
         return f"SpectrumData(scans_count={len(self.scans)})"
@@ -0,0 +1,154 @@
+from typing import List, Tuple
+
+from numpy import add as np_add
+from numpy import argsort as np_argsort
+from numpy import asarray as np_asarray
+from numpy import concatenate as np_concatenate
+from numpy import diff as np_diff
+from numpy import empty as np_empty
+from numpy import flatnonzero as np_flatnonzero
+from numpy import float64
+from numpy import floor as np_floor
+from numpy import full as np_full
+from numpy import int32 as np_int32
+from numpy import int64 as np_int64
+from numpy import maximum as np_maximum
+from numpy import ndarray
+from numpy import unique as np_unique
+
+from .scan import Scan
+
+AGGREGATES = ("sum", "max")
+
+
+class XICIndex:
+    """
+    An m/z-binned inverted index over the points of a spectrum, for extracted-ion chromatogram (XIC) queries.
+    The points of all scans are grouped into m/z bins of bin_width; the postings of a bin are stored contiguously,
+    sorted by (scan, position), in compact parallel arrays (CSR-style: bin_keys + bin_starts). A query only touches
+    the bins overlapping its m/z window, so it runs in time proportional to the size of the result.
+    The intensities are copied when the index is built, so build it after the stages whose output should be queried.
+
+    Attributes:
+        bin_width (float): The width of the m/z bins.
+        retention_times (NDArray): The retention time of each scan.
+        bin_keys (NDArray): The sorted IDs (floor(mz / bin_width)) of the non-empty bins.
+        bin_starts (NDArray): The start of each bin's postings, with the total posting count appended.
+        scan_indexes (NDArray): The scan of each posting (int32).
+        positions (NDArray): The position of each posting inside its scan's arrays (int32).
+        mz (NDArray): The m/z value of each posting.
+        intensities (NDArray): The intensity of each posting.
+    """
+
+    def __init__(self, scans: List[Scan], bin_width: float = 0.01):
+        """
+        Builds the index over the given scans.
+
+        Args:
+            scans (List[Scan]): The scans of the spectrum, e.g. Spectrum.scans.
+            bin_width (float): The width of the m/z bins. Queries are fastest when the tolerance is close to it.
+        """
+        if bin_width <= 0:
+            raise ValueError(f"bin_width must be positive, got {bin_width}.")
+        self.bin_width = float(bin_width)
+        self.retention_times = np_asarray(
+            [scan.retention_time for scan in scans], dtype=float64
+        )
+
+        sizes = [len(scan.mz_array) for scan in scans]
+        total = sum(sizes)
+        scan_indexes = np_empty(total, dtype=np_int32)
+        positions = np_empty(total, dtype=np_int32)
+        start = 0
+        for scan_index, size in enumerate(sizes):
+            scan_indexes[start : start + size] = scan_index
+            positions[start : start + size] = range(size)
+            start += size
+        mz = (
+            np_concatenate([scan.mz_array for scan in scans])
+            if scans
+            else np_empty(0, dtype=float64)
+        )
+        intensities = (
+            np_concatenate([scan.intensity_array for scan in scans])
+            if scans
+            else np_empty(0, dtype=float64)
+        )
+
+        # The points are already in (scan, position) order, a stable sort keeps it inside each bin
+        bins = np_floor(mz / self.bin_width).astype(np_int64)
+        order = np_argsort(bins, kind="stable")
+        bins = bins[order]
+        self.scan_indexes = scan_indexes[order]
+        self.positions = positions[order]
+        self.mz = mz[order]
+        self.intensities = intensities[order]
+
+        starts = (
+            np_flatnonzero(np_diff(bins)) + 1 if total else np_empty(0, dtype=np_int64)
+        )
+        self.bin_keys = bins[np_concatenate(([0], starts))] if total else bins
+        self.bin_starts = np_concatenate(([0], starts, [total])).astype(np_int64)
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.scan_indexes.nbytes
+            + self.positions.nbytes
+            + self.mz.nbytes
+            + self.intensities.nbytes
+            + self.bin_keys.nbytes
+            + self.bin_starts.nbytes
+        )
+
+    def postings(self, mz: float, tolerance: float) -> ndarray:
+        """
+        Args:
+            mz (float): The m/z value of the ion.
+            tolerance (float): The half width of the m/z window.
+        Returns:
+            (NDArray): The indexes of the postings within mz ± tolerance, sorted by (bin, scan, position).
+        """
+        low, high = mz - tolerance, mz + tolerance
+        first = self.bin_keys.searchsorted(np_floor(low / self.bin_width), side="left")
+        last = self.bin_keys.searchsorted(np_floor(high / self.bin_width), side="right")
+        start, stop = self.bin_starts[first], self.bin_starts[last]
+        window = self.mz[start:stop]
+        return start + np_flatnonzero((window >= low) & (window <= high))
+
+    def chromatogram(
+        self, mz: float, tolerance: float, aggregate: str = "sum"
+    ) -> Tuple[ndarray, ndarray]:
+        """
+        Extracts the ion chromatogram of mz ± tolerance.
+
+        Args:
+            mz (float): The m/z value of the ion.
+            tolerance (float): The half width of the m/z window.
+            aggregate (str): How the points of one scan inside the window are combined, "sum" or "max".
+        Returns:
+            (Tuple[NDArray, NDArray]): The retention times of the scans with at least one point in the window,
+                                       in scan order, and the aggregated intensity of each.
+        """
+        if aggregate not in AGGREGATES:
+            raise ValueError(
+                f"Unknown aggregate: {aggregate!r}, expected one of {AGGREGATES}."
+            )
+        postings = self.postings(mz, tolerance)
+        scan_indexes, inverse = np_unique(
+            self.scan_indexes[postings], return_inverse=True
+        )
+        intensities = self.intensities[postings].astype(float64)
+        if aggregate == "sum":
+            result = np_full(scan_indexes.size, 0.0)
+            np_add.at(result, inverse, intensities)
+        else:
+            result = np_full(scan_indexes.size, -float("inf"))
+            np_maximum.at(result, inverse, intensities)
+        return self.retention_times[scan_indexes], result
+
+    def __repr__(self) -> str:
+        return (
+            f"XICIndex(scans={self.retention_times.size}, bins={self.bin_keys.size}, "
+            f"postings={self.scan_indexes.size}, bin_width={self.bin_width})"
+        )
@@ -0,0 +1,183 @@
+from functools import partial
+from typing import Callable, Dict
+
+import numpy as np
+from numpy import ndarray
+from peakutils import baseline as peakutils_baseline
+from scipy.linalg import solveh_banded
+from scipy.ndimage import grey_opening, minimum_filter1d, uniform_filter1d
+
+BaselineEngine = Callable[..., ndarray]
+
+BASELINE_ENGINES: Dict[str, BaselineEngine] = {}
+MATRIX_BASELINE_ENGINES: Dict[str, BaselineEngine] = {}
+
+
+def register_baseline_engine(
+    name: str, matrix: bool = False
+) -> Callable[[BaselineEngine], BaselineEngine]:
+    """
+    Registers a baseline engine under the given name. An engine takes the intensities of one scan segment
+    (plus its keyword parameters) and returns the estimated baseline, with the same length.
+    A matrix engine takes a 2D (scans x points) block and returns the baseline of every row, see GriddedSpectrum.
+    """
+
+    def register(engine: BaselineEngine) -> BaselineEngine:
+        (MATRIX_BASELINE_ENGINES if matrix else BASELINE_ENGINES)[name] = engine
+        return engine
+
+    return register
+
+
+def get_baseline_engine(name: str, **params) -> Callable[[ndarray], ndarray]:
+    """
+    Args:
+        name (str): The name of a registered engine, one of BASELINE_ENGINES.
+        params: The keyword parameters of the engine, e.g. deg for "polynomial".
+    Returns:
+        (Callable[[NDArray], NDArray]): The engine with its parameters bound, see Scan.align_baseline.
+    """
+    if name not in BASELINE_ENGINES:
+        raise ValueError(
+            f"Unknown baseline engine: {name!r}, expected one of {sorted(BASELINE_ENGINES)}."
+        )
+    return partial(BASELINE_ENGINES[name], **params)
+
+
+def get_matrix_baseline_engine(name: str, **params) -> Callable[[ndarray], ndarray]:
+    """
+    Args:
+        name (str): The name of a registered engine, one of BASELINE_ENGINES.
+        params: The keyword parameters of the engine.
+    Returns:
+        (Callable[[NDArray], NDArray]): Returns the baseline of each row of a 2D block. Engines without a
+                                        vectorized matrix version are applied row by row.
+    """
+    if name in MATRIX_BASELINE_ENGINES:
+        return partial(MATRIX_BASELINE_ENGINES[name], **params)
+    engine = get_baseline_engine(name, **params)
+    return (
+        lambda block: np.stack([engine(row) for row in block]) if len(block) else block
+    )
+
+
+@register_baseline_engine("polynomial")
+def polynomial_baseline(intensities: ndarray, deg: int = 6) -> ndarray:
+    """
+    The iterative polynomial fit of peakutils. Each iteration is a least squares fit of degree deg, so the cost
+    grows with both deg and the segment length.
+    """
+    return peakutils_baseline(intensities, deg=deg)
+
+
+@register_baseline_engine("polynomial", matrix=True)
+def polynomial_baseline_matrix(
+    block: ndarray, deg: int = 6, max_it: int = 100, tol: float = 1e-3
+) -> ndarray:
+    """
+    The iterative polynomial fit of peakutils for every row of the block at once: the rows share the same
+    Vandermonde pseudo-inverse, so each iteration is one matrix product, and a row stops being updated once its
+    coefficients converge. The convergence test is done on the coefficients scaled like peakutils scales each row,
+    so every row takes the same number of iterations as peakutils.baseline would. All-zero rows (e.g. empty scans
+    on a sparse grid) have a zero baseline and are not fitted.
+    """
+    values = np.array(block, dtype=np.float64)
+    rows, size = values.shape
+    order = deg + 1
+    vander = np.vander(np.linspace(0.0, 1.0, size), order)
+    vander_pinv = np.linalg.pinv(vander)
+    # peakutils fits over x in [0, max(|row|) ** (1 / order)], i.e. with coefficient k scaled by cond ** -power
+    conds = np.abs(values).max(axis=1) ** (1.0 / order) if size else np.zeros(rows)
+    active = np.flatnonzero(conds > 0)
+    scales = np.where(conds > 0, conds, 1.0)[:, None] ** -np.arange(
+        deg, -1, -1, dtype=np.float64
+    )
+    coeffs = np.ones((rows, order)) / scales
+    base = values.copy()
+    base[conds == 0] = 0.0
+    for _ in range(max_it):
+        coeffs_new = values[active] @ vander_pinv.T
+        change = np.linalg.norm(
+            (coeffs_new - coeffs[active]) * scales[active], axis=1
+        ) / np.linalg.norm(coeffs[active] * scales[active], axis=1)
+        converged = change < tol
+        if converged.any():
+            active, coeffs_new = active[~converged], coeffs_new[~converged]
+            if active.size == 0:
+                break
+        coeffs[active] = coeffs_new
+        base[active] = coeffs_new @ vander.T
+        values[active] = np.minimum(values[active], base[active])
+    return base
+
+
+@register_baseline_engine("als")
+def als_baseline(
+    intensities: ndarray, lam: float = 1e5, p: float = 0.01, iterations: int = 10
+) -> ndarray:
+    """
+    Asymmetric least squares (Eilers & Boelens): a smooth curve that points above it (the peaks) pull with
+    weight p and points below it with weight 1 - p. The smoothness penalty is the second difference, so every
+    iteration solves a pentadiagonal symmetric positive definite system, in O(n) with a banded Cholesky solver.
+
+    Args:
+        intensities (NDArray): The intensities of the segment.
+        lam (float): The smoothness of the baseline, larger values give a stiffer curve.
+        p (float): The asymmetry, the weight of the points above the baseline.
+        iterations (int): The number of reweighting iterations.
+    """
+    values = np.asarray(intensities, dtype=np.float64)
+    size = values.size
+    if size < 3:
+        return np.full(size, values.min() if size else 0.0)
+
+    # Upper banded form of lam * D'D, D being the (size - 2) x size second difference matrix
+    penalty = np.zeros((3, size))
+    penalty[0, 2:] = 1.0
+    penalty[1, 1:] = -4.0
+    penalty[1, 1] = penalty[1, -1] = -2.0
+    penalty[2, :] = 6.0
+    penalty[2, 0] = penalty[2, -1] = 1.0
+    penalty[2, 1] = penalty[2, -2] = 5.0
+    if size == 3:
+        penalty[2, 1] = 4.0
+    penalty *= lam
+
+    weights = np.ones(size)
+    baseline = values
+    for _ in range(iterations):
+        system = penalty.copy()
+        system[2] += weights
+        baseline = solveh_banded(system, weights * values, check_finite=False)
+        new_weights = np.where(values > baseline, p, 1.0 - p)
+        if np.array_equal(new_weights, weights):
+            break
+        weights = new_weights
+    return baseline
+
+
+@register_baseline_engine("rolling_min")
+@register_baseline_engine("rolling_min", matrix=True)
+def rolling_min_baseline(intensities: ndarray, window: int = 101) -> ndarray:
+    """
+    The minimum over a sliding window of the given number of points, smoothed with a moving average of the same
+    width. Peaks narrower than the window do not lift the baseline. Runs in O(n) for any window.
+    Works along the last axis, so it also takes a 2D block of rows.
+    """
+    values = np.asarray(intensities, dtype=np.float64)
+    baseline = uniform_filter1d(
+        minimum_filter1d(values, size=window, axis=-1), size=window, axis=-1
+    )
+    return np.minimum(baseline, values)
+
+
+@register_baseline_engine("morphological")
+@register_baseline_engine("morphological", matrix=True)
+def morphological_baseline(intensities: ndarray, window: int = 101) -> ndarray:
+    """
+    The morphological opening (erosion followed by dilation) with a flat structuring element of the given number
+    of points: removes every peak narrower than the window while following the slower background.
+    Works along the last axis, so it also takes a 2D block of rows.
+    """
+    values = np.asarray(intensities, dtype=np.float64)
+    return grey_opening(values, size=(1,) * (values.ndim - 1) + (window,))
@@ -0,0 +1,82 @@
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy import ndarray
+from pandas import DataFrame
+from pyne.models.spectrum import Spectrum
+
+
+def extract_chromatograms(
+    spectrum_list: List[Spectrum],
+    mz: float,
+    tolerance: float,
+    aggregate: str = "sum",
+    bin_width: float = 0.01,
+) -> DataFrame:
+    """
+    Extracts the ion chromatogram of mz ± tolerance in every sample of the cohort, using the XIC index of each
+    spectrum (built with bin_width when missing). When a spectrum has a retention time correction (set by
+    align_peaks), its retention times are mapped onto the master spectrum, so the chromatograms are comparable.
+    Args:
+        spectrum_list (List[Spectrum]): The spectrums of the cohort.
+        mz (float): The m/z value of the ion.
+        tolerance (float): The half width of the m/z window.
+        aggregate (str): How the points of one scan inside the window are combined, "sum" or "max".
+        bin_width (float): The m/z bin width of the indexes built here.
+    Returns:
+        DataFrame: A pandas DataFrame containing sample, RT and intensity columns, one row per scan with signal.
+    """
+    frames = []
+    for spectrum in spectrum_list:
+        xic_index = spectrum.xic_index or spectrum.build_xic_index(bin_width=bin_width)
+        retention_times, intensities = xic_index.chromatogram(
+            mz=mz, tolerance=tolerance, aggregate=aggregate
+        )
+        if spectrum.rt_correction is not None:
+            retention_times = spectrum.rt_correction.correct(retention_times)
+        frames.append(
+            DataFrame(
+                {
+                    "sample": np.full(
+                        retention_times.size, spectrum.sample_id, dtype=object
+                    ),
+                    "RT": retention_times,
+                    "intensity": intensities,
+                }
+            )
+        )
+    if not frames:
+        return DataFrame(columns=["sample", "RT", "intensity"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def total_ion_chromatogram(spectrum: Spectrum) -> Tuple[ndarray, ndarray]:
+    """
+    Sums the intensities of every scan of the spectrum. A spectrum without scans (see Spectrum.from_peaks) sums the
+    intensities of its peaks per retention time instead, which keeps the shape of the chromatogram's main peaks.
+    Args:
+        spectrum (Spectrum): The spectrum of one sample.
+    Returns:
+        (Tuple[NDArray, NDArray]): The ascending retention times and the total intensity at each of them.
+    """
+    if spectrum.scans:
+        retention_times = np.array(
+            [scan.retention_time for scan in spectrum.scans], dtype=float
+        )
+        intensities = np.array(
+            [scan.intensity_array.sum(dtype=np.float64) for scan in spectrum.scans],
+            dtype=float,
+        )
+        order = np.argsort(retention_times, kind="stable")
+        return retention_times[order], intensities[order]
+    retention_times, inverse = np.unique(
+        np.array([peak.retention_time for peak in spectrum.peaks], dtype=float),
+        return_inverse=True,
+    )
+    intensities = np.bincount(
+        inverse,
+        weights=np.array([peak.intensity for peak in spectrum.peaks], dtype=float),
+        minlength=retention_times.size,
+    )
+    return retention_times, intensities
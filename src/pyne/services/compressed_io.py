@@ -0,0 +1,60 @@
+import bz2
+import gzip
+import lzma
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+
+# The leading bytes of each supported compression format
+MAGIC_BYTES = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+}
+COMPRESSIONS = tuple(MAGIC_BYTES)
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """
+    Detects the compression of a file from its first bytes, regardless of its extension.
+    Returns:
+        (Optional[str]): One of COMPRESSIONS, or None for an uncompressed file.
+    """
+    with open(path, "rb") as source:
+        head = source.read(max(len(magic) for magic in MAGIC_BYTES.values()))
+    for compression, magic in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+@contextmanager
+def open_source(path: str) -> Iterator[BinaryIO]:
+    """
+    Opens a source file for reading as a binary stream, decompressing it on the fly when it is compressed
+    (see detect_compression), so compressed inputs are parsed without writing a decompressed copy.
+    zstd needs the zstandard package to be installed.
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        stream = open(path, "rb")
+    elif compression == "gzip":
+        stream = gzip.open(path, "rb")
+    elif compression == "bz2":
+        stream = bz2.open(path, "rb")
+    elif compression == "xz":
+        stream = lzma.open(path, "rb")
+    else:
+        stream = _open_zstd(path)
+    with stream:
+        yield stream
+
+
+def _open_zstd(path: str) -> BinaryIO:
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            f"{path} is zstd compressed, reading it needs the zstandard package."
+        )
+    return zstandard.open(path, "rb")
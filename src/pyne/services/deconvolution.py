@@ -1,7 +1,10 @@
-from pandas import DataFrame
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+from pandas import DataFrame, concat
 
-def deconvolve_peaks(peaks_df: DataFrame) -> DataFrame:
+
+def deconvolve_peaks(peaks_df: DataFrame, workers: int = 1) -> DataFrame:
     """
     Receives a DataFrame with peaks and their assigned label and returns the deconvolved (or filtered out) DataFrame.
     Steps
@@ -9,16 +12,39 @@ def deconvolve_peaks(peaks_df: DataFrame) -> DataFrame:
         - For each group, it identifies the highest "intensity" value (this will be the highest peak).
         - It saves the "intensity" and "RT" value of the highest peak, and calculates the average for the "mz" value for this group.
         - Finally it puts together the "intensity", "RT", and the calculated "mz" values.
+    With more than one worker the labels are split into contiguous ranges which are deconvolved in a process pool,
+    and the results are concatenated in label order, the same as the single process result.
     Args
         peaks_df (DataFrame): A pandas DataFrame with the following columns: "RT", "mz", "intensity", "label".
                               Each row of this DataFrame represents one peak, and their label.
                               Peaks with the same label, most likely represent the same compound.
+        workers (int): The number of worker processes.
     Returns
         (DataFrame): A pandas DataFrame with the deconvolved data, with the following columns: "RT", "mz", "intensity"
     """
-    center_peaks_df = peaks_df.loc[peaks_df.groupby("label")["intensity"].idxmax()]
+    if workers > 1 and len(peaks_df):
+        return _deconvolve_label_ranges(peaks_df, workers)
+    center_peaks_df = peaks_df.loc[
+        peaks_df.groupby("label")["intensity"].idxmax()
+    ].copy()
 
-    average_mz = peaks_df.groupby("label")["m/z"].mean()
-    center_peaks_df["m/z"] = center_peaks_df["label"].map(average_mz)
-    center_peaks_df = center_peaks_df[["RT", "intensity", "m/z"]].reset_index(drop=True)
+    average_mz = peaks_df.groupby("label")["mz"].mean()
+    center_peaks_df["mz"] = center_peaks_df["label"].map(average_mz)
+    center_peaks_df = center_peaks_df[["RT", "intensity", "mz"]].reset_index(drop=True)
     return center_peaks_df
+
+
+def _deconvolve_label_ranges(peaks_df: DataFrame, workers: int) -> DataFrame:
+    labels = np.unique(peaks_df["label"].to_numpy())
+    # contiguous label ranges, so the results concatenate in label order
+    bounds = [
+        range_labels[0]
+        for range_labels in np.array_split(labels, min(workers * 4, labels.size))
+    ]
+    partitions = [
+        peaks_df[(peaks_df["label"] >= low) & (peaks_df["label"] < high)]
+        for low, high in zip(bounds, bounds[1:] + [labels[-1] + 1])
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(deconvolve_peaks, partitions))
+    return concat(results, ignore_index=True)
@@ -0,0 +1,219 @@
+from logging import getLogger
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+from numpy import ndarray
+from pyne.models.peak import Peak
+from pyne.models.scan import Scan
+from pyne.models.spectrum import Spectrum
+
+from .peak_alignment import find_master_spectrum, match_peak_pairs
+
+LOGGER = getLogger(__name__)
+
+# Above this many points a scatter is drawn as a 2D histogram instead
+MAX_SCATTER_POINTS = 50000
+
+
+def decimate_min_max(x: ndarray, y: ndarray, bins: int) -> Tuple[ndarray, ndarray]:
+    """
+    Reduces a line with ascending x to at most 2 * bins points: the minimum and the maximum of y in each of
+    bins equal-count chunks (the last one may be shorter), in x order. Drawn as a line it looks the same as the full one at the figure's
+    resolution, since every extremum (e.g. a peak apex) is kept.
+    Args:
+        x (NDArray): The ascending x values.
+        y (NDArray): The y values.
+        bins (int): The number of chunks, about the width of the plot in pixels.
+    Returns:
+        (Tuple[NDArray, NDArray]): The decimated x and y values.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if x.size <= 2 * bins:
+        return x, y
+    chunk = -(-x.size // bins)
+    full = x.size // chunk
+    offsets = np.arange(full) * chunk
+    rows = y[: full * chunk].reshape(full, chunk)
+    picked = [offsets + rows.argmin(axis=1), offsets + rows.argmax(axis=1)]
+    if full * chunk < x.size:
+        tail = y[full * chunk :]
+        picked.append(full * chunk + np.array([tail.argmin(), tail.argmax()]))
+    picked = np.unique(np.concatenate(picked))
+    return x[picked], y[picked]
+
+
+def plot_scan(
+    scan: Scan,
+    path: str,
+    peaks: Optional[Sequence[Peak]] = None,
+    width: int = 1600,
+):
+    """
+    Writes a PNG of one scan's intensity profile (min/max decimated to the figure width), with its peaks.
+    """
+    figure, axes = _figure(width)
+    for start, stop in scan.segments():
+        axes.plot(
+            *decimate_min_max(
+                scan.mz_array[start:stop], scan.intensity_array[start:stop], width
+            ),
+            linewidth=0.6,
+            color="tab:blue",
+        )
+    if peaks:
+        axes.scatter(
+            [peak.mz for peak in peaks],
+            [peak.intensity for peak in peaks],
+            marker="x",
+            color="tab:red",
+            label="Peaks",
+        )
+        axes.legend(loc="upper right")
+    axes.set_xlabel("m/z")
+    axes.set_ylabel("Intensity")
+    axes.set_title(f"Scan at RT {scan.retention_time}")
+    _save(figure, path)
+
+
+def plot_spectrum_map(
+    spectrum: Spectrum,
+    path: str,
+    bins: Tuple[int, int] = (1000, 400),
+    peaks: bool = True,
+):
+    """
+    Writes a PNG of the whole spectrum as an (m/z x retention time) intensity map: every point of every scan
+    is accumulated into a 2D histogram in one call, so its cost does not depend on the figure.
+    Args:
+        spectrum (Spectrum): The spectrum to draw.
+        path (str): The PNG file to write.
+        bins (Tuple[int, int]): The number of m/z and retention time bins.
+        peaks (bool): Overlay the detected peaks of the spectrum.
+    """
+    mz = np.concatenate([scan.mz_array for scan in spectrum.scans] or [np.empty(0)])
+    intensity = np.concatenate(
+        [scan.intensity_array for scan in spectrum.scans] or [np.empty(0)]
+    )
+    retention_times = np.repeat(
+        [scan.retention_time for scan in spectrum.scans],
+        [scan.mz_array.size for scan in spectrum.scans],
+    )
+    figure, axes = _figure(1600)
+    if mz.size:
+        weights = np.clip(intensity, 0.0, None)
+        histogram, mz_edges, rt_edges = np.histogram2d(
+            mz, retention_times, bins=bins, weights=weights
+        )
+        positive = histogram[histogram > 0]
+        image = axes.pcolormesh(
+            mz_edges,
+            rt_edges,
+            histogram.T,
+            norm=LogNorm(vmin=max(positive.min(), 1.0)) if positive.size else None,
+            cmap="viridis",
+            rasterized=True,
+        )
+        figure.colorbar(image, ax=axes, label="Summed intensity")
+    if peaks and spectrum.peaks:
+        axes.scatter(
+            [peak.mz for peak in spectrum.peaks],
+            [peak.retention_time for peak in spectrum.peaks],
+            s=6,
+            marker="x",
+            color="tab:red",
+            label="Peaks",
+        )
+        axes.legend(loc="upper right")
+    axes.set_xlabel("m/z")
+    axes.set_ylabel("Retention time")
+    axes.set_title(f"Spectrum {spectrum.sample_id}")
+    _save(figure, path)
+
+
+def plot_peaks(spectrum_list: List[Spectrum], path: str):
+    """
+    Writes a PNG of the detected peaks (retention time x intensity) of every spectrum, one scatter call per
+    spectrum, or one 2D histogram per spectrum above MAX_SCATTER_POINTS peaks.
+    """
+    figure, axes = _figure(1600)
+    for index, spectrum in enumerate(spectrum_list):
+        retention_times = np.fromiter(
+            (peak.retention_time for peak in spectrum.peaks), dtype=float
+        )
+        intensities = np.fromiter(
+            (peak.intensity for peak in spectrum.peaks), dtype=float
+        )
+        _scatter(
+            axes, retention_times, intensities, f"C{index % 10}", spectrum.sample_id
+        )
+    axes.set_xlabel("Retention time")
+    axes.set_ylabel("Intensity")
+    axes.set_title("Peaks for each spectrum")
+    axes.legend(markerscale=3, loc="upper right")
+    _save(figure, path)
+
+
+def plot_alignment(
+    spectrum_list: List[Spectrum],
+    path: str,
+    mz_adj_win: float = 0.2,
+    rt_adj_win: float = 20,
+):
+    """
+    Writes a PNG of the retention time alignment of every test spectrum against the master spectrum: the drift
+    (master RT - test RT) of the matched peak pairs, and the fitted correction curve (set by align_peaks).
+    """
+    master_spectrum = find_master_spectrum(spectrum_list=spectrum_list)
+    figure, axes = _figure(1600)
+    index = 0
+    for spectrum in spectrum_list:
+        if spectrum is master_spectrum:
+            continue
+        color = f"C{index % 10}"
+        index += 1
+        master_rt, test_rt = match_peak_pairs(
+            mz_adj_win=mz_adj_win,
+            rt_adj_win=rt_adj_win,
+            master_spectrum=master_spectrum,
+            test_spectrum=spectrum,
+        )
+        _scatter(
+            axes, test_rt, master_rt - test_rt, color, f"{spectrum.sample_id} pairs"
+        )
+        correction = spectrum.rt_correction
+        if correction is not None and correction.rt_knots.size:
+            axes.plot(
+                correction.rt_knots,
+                correction.drift_knots,
+                color=color,
+                linewidth=1.5,
+                label=f"{spectrum.sample_id} correction",
+            )
+    axes.axhline(0.0, color="grey", linewidth=0.5)
+    axes.set_xlabel("Retention time (test spectrum)")
+    axes.set_ylabel("Drift (master RT - test RT)")
+    axes.set_title(f"Retention time alignment against {master_spectrum.sample_id}")
+    axes.legend(markerscale=3, loc="upper right")
+    _save(figure, path)
+
+
+def _scatter(axes, x: ndarray, y: ndarray, color: str, label: str):
+    if x.size > MAX_SCATTER_POINTS:
+        # a density map of the points: color scales with the count, single color per series
+        axes.hist2d(x, y, bins=(800, 400), cmin=1, cmap="Greys", rasterized=True)
+        axes.plot([], [], color=color, label=f"{label} (density)")
+        return
+    axes.scatter(x, y, s=4, color=color, label=label, rasterized=True)
+
+
+def _figure(width: int):
+    figure = Figure(figsize=(width / 100, width / 200), dpi=100)
+    return figure, figure.add_subplot()
+
+
+def _save(figure: Figure, path: str):
+    figure.tight_layout()
+    figure.savefig(path, format="png")
+    LOGGER.info(f"Wrote {path}.")
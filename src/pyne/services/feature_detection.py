@@ -0,0 +1,136 @@
+from itertools import groupby
+from logging import getLogger
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from numpy import asarray as np_asarray
+from numpy import sort as np_sort
+from pyne.models.mass_trace import MassTrace
+from pyne.models.peak import Peak
+
+LOGGER = getLogger(__name__)
+
+
+def detect_mass_traces(
+    peaks: List[Peak],
+    mz_tolerance: float = 0.05,
+    max_gap: int = 1,
+    min_length: int = 2,
+    scan_retention_times: Optional[Sequence[float]] = None,
+) -> List[MassTrace]:
+    """
+    Links the peaks of one sample into mass traces, in a single pass over the scans in retention time order.
+    The open traces are kept sorted by m/z, so the candidate trace of a peak is found with a binary search.
+    Each peak extends the closest open trace within mz_tolerance, and each trace takes at most one peak per scan
+    (the closest one); the remaining peaks start new traces. A trace is closed once max_gap scans pass without
+    a peak being added to it.
+    Args:
+        peaks (List[Peak]): The detected peaks of one sample (e.g. Spectrum.peaks).
+        mz_tolerance (float): The largest m/z difference between a peak and the latest peak of its trace.
+        max_gap (int): The number of consecutive scans a trace may miss and still be extended.
+        min_length (int): Traces with fewer peaks are dropped.
+        scan_retention_times (Optional[Sequence[float]]): The retention times of all scans of the sample, so that
+                                                          scans without peaks count towards max_gap too.
+                                                          Without them only the scans with peaks are counted.
+    Returns:
+        List[MassTrace]: The mass traces, sorted by m/z.
+    """
+    ordered_peaks = sorted(peaks, key=lambda peak: peak.retention_time)
+    open_traces: List[MassTrace] = []
+    closed_traces: List[MassTrace] = []
+
+    scan_retention_times = (
+        np_sort(np_asarray(scan_retention_times, dtype=float))
+        if scan_retention_times is not None
+        else None
+    )
+    for group_position, (retention_time, scan_peaks) in enumerate(
+        groupby(ordered_peaks, key=lambda peak: peak.retention_time)
+    ):
+        scan_position = (
+            int(scan_retention_times.searchsorted(retention_time))
+            if scan_retention_times is not None
+            else group_position
+        )
+        still_open = []
+        for trace in open_traces:
+            if scan_position - trace.last_scan > max_gap + 1:
+                closed_traces.append(trace)
+            else:
+                still_open.append(trace)
+        open_traces = still_open
+
+        scan_peaks = sorted(scan_peaks, key=lambda peak: peak.mz)
+        claims = _match_open_traces(open_traces, scan_peaks, mz_tolerance)
+        claimed_peaks = set()
+        for trace_index, (_, peak_index) in claims.items():
+            open_traces[trace_index].extend(scan_peaks[peak_index], scan_position)
+            claimed_peaks.add(peak_index)
+        for peak_index, peak in enumerate(scan_peaks):
+            if peak_index not in claimed_peaks:
+                open_traces.append(MassTrace(peak, scan_position))
+        open_traces.sort(key=lambda trace: trace.peaks[-1].mz)
+
+    traces = [
+        trace for trace in closed_traces + open_traces if trace.length >= min_length
+    ]
+    traces.sort(key=lambda trace: trace.mean_mz)
+    LOGGER.info(f"Linked {len(peaks)} peaks into {len(traces)} mass traces.")
+    return traces
+
+
+def mass_trace_peaks(
+    peaks: List[Peak],
+    mz_tolerance: float = 0.05,
+    max_gap: int = 1,
+    min_length: int = 2,
+    scan_retention_times: Optional[Sequence[float]] = None,
+) -> List[Peak]:
+    """
+    Replaces the per-scan peaks of one sample with one peak per mass trace (apex retention time, mean m/z and
+    area as intensity, see MassTrace.to_peak), so the cohort-wide stages process one item per feature.
+    Args:
+        See detect_mass_traces.
+    Returns:
+        List[Peak]: One peak per mass trace, in retention time order.
+    """
+    traces = detect_mass_traces(
+        peaks,
+        mz_tolerance=mz_tolerance,
+        max_gap=max_gap,
+        min_length=min_length,
+        scan_retention_times=scan_retention_times,
+    )
+    return sorted(
+        (trace.to_peak() for trace in traces), key=lambda peak: peak.retention_time
+    )
+
+
+def _match_open_traces(
+    open_traces: List[MassTrace], scan_peaks: List[Peak], mz_tolerance: float
+) -> Dict[int, Tuple[float, int]]:
+    """
+    Matches the m/z sorted peaks of one scan to the m/z sorted open traces.
+    Returns:
+        (Dict[int, Tuple[float, int]]): The index of the claimed peak and its distance, for each matched trace.
+    """
+    claims: Dict[int, Tuple[float, int]] = {}
+    if not open_traces or not scan_peaks:
+        return claims
+    trace_mz = np_asarray([trace.peaks[-1].mz for trace in open_traces])
+    peak_mz = np_asarray([peak.mz for peak in scan_peaks])
+    positions = trace_mz.searchsorted(peak_mz)
+    for peak_index, position in enumerate(positions.tolist()):
+        candidates = [
+            trace_index
+            for trace_index in (position - 1, position)
+            if 0 <= trace_index < len(open_traces)
+        ]
+        trace_index = min(
+            candidates, key=lambda index: abs(trace_mz[index] - peak_mz[peak_index])
+        )
+        distance = abs(trace_mz[trace_index] - peak_mz[peak_index])
+        if distance > mz_tolerance:
+            continue
+        if trace_index not in claims or distance < claims[trace_index][0]:
+            claims[trace_index] = (distance, peak_index)
+    return claims
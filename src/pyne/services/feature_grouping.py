@@ -0,0 +1,121 @@
+from logging import getLogger
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from numpy import ndarray
+from pandas import DataFrame
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+LOGGER = getLogger(__name__)
+
+# The m/z difference between the 13C and 12C isotopologues of a singly charged ion
+ISOTOPE_SPACING = 1.003355
+# The m/z difference of common positive mode adducts from [M+H]+
+ADDUCT_DELTAS: Dict[str, float] = {
+    "[M+NH4]+": 17.026549,
+    "[M+Na]+": 21.981943,
+    "[M+K]+": 37.955882,
+}
+
+
+def group_features(
+    features: DataFrame,
+    mz_tolerance: float = 0.01,
+    rt_tolerance: float = 2.0,
+    max_isotopes: int = 3,
+    charges: Sequence[int] = (1,),
+    adduct_deltas: Optional[Dict[str, float]] = None,
+) -> DataFrame:
+    """
+    Groups the features that are isotopologues or adducts of the same compound.
+    Two features are related when they co-elute (their RT differs by at most rt_tolerance) and their m/z differs
+    by an expected mass difference (k * ISOTOPE_SPACING / charge for k up to max_isotopes, or an adduct delta)
+    within mz_tolerance. The features are sorted by m/z once, and the partners of every feature are found with
+    one searchsorted call per mass difference for all features at once, so no pairwise comparison is needed.
+    The groups are the connected components of the relations.
+    Args:
+        features (DataFrame): The deconvolved features, with "RT", "mz" and "intensity" columns (see deconvolve_peaks).
+        mz_tolerance (float): The largest deviation from an expected mass difference.
+        rt_tolerance (float): The largest retention time difference of related features.
+        max_isotopes (int): The number of isotopologues looked for above each feature.
+        charges (Sequence[int]): The charge states of the isotope spacings.
+        adduct_deltas (Optional[Dict[str, float]]): The adduct mass differences, ADDUCT_DELTAS by default.
+    Returns:
+        (DataFrame): The features with a "group" column: the same id for related features, numbered in the
+                     order of their first feature.
+    """
+    if adduct_deltas is None:
+        adduct_deltas = ADDUCT_DELTAS
+    deltas = [
+        isotope * ISOTOPE_SPACING / charge
+        for charge in charges
+        for isotope in range(1, max_isotopes + 1)
+    ] + list(adduct_deltas.values())
+
+    mz = features["mz"].to_numpy(dtype=float)
+    retention_times = features["RT"].to_numpy(dtype=float)
+    order = np.argsort(mz, kind="stable")
+    sorted_mz = mz[order]
+    sorted_rt = retention_times[order]
+
+    sources, targets = [], []
+    for delta in deltas:
+        source, target = _related_pairs(
+            sorted_mz, sorted_rt, delta, mz_tolerance, rt_tolerance
+        )
+        sources.append(order[source])
+        targets.append(order[target])
+    sources = np.concatenate(sources) if sources else np.empty(0, dtype=np.intp)
+    targets = np.concatenate(targets) if targets else np.empty(0, dtype=np.intp)
+
+    feature_count = len(features)
+    graph = coo_matrix(
+        (np.ones(sources.size, dtype=np.int8), (sources, targets)),
+        shape=(feature_count, feature_count),
+    )
+    group_count, labels = connected_components(graph, directed=False)
+
+    grouped = features.copy()
+    grouped["group"] = labels
+    if feature_count:
+        LOGGER.info(
+            f"Grouped {feature_count} features into {group_count} isotope/adduct groups "
+            f"({1 - group_count / feature_count:.1%} fewer features)."
+        )
+    return grouped
+
+
+def collapse_feature_groups(grouped: DataFrame) -> DataFrame:
+    """
+    Keeps the most intense feature of each group (see group_features), with the size of its group.
+    Returns:
+        (DataFrame): One row per group, in group order: "RT", "intensity", "mz", "group" and "group_size".
+    """
+    representatives = grouped.loc[grouped.groupby("group")["intensity"].idxmax()].copy()
+    representatives["group_size"] = (
+        representatives["group"].map(grouped["group"].value_counts()).to_numpy()
+    )
+    return representatives.reset_index(drop=True)
+
+
+def _related_pairs(
+    sorted_mz: ndarray,
+    sorted_rt: ndarray,
+    delta: float,
+    mz_tolerance: float,
+    rt_tolerance: float,
+):
+    """
+    Returns the (lighter, heavier) positions in the m/z sorted features whose m/z differ by delta within
+    mz_tolerance and whose retention times differ by at most rt_tolerance.
+    """
+    starts = sorted_mz.searchsorted(sorted_mz + delta - mz_tolerance, side="left")
+    stops = sorted_mz.searchsorted(sorted_mz + delta + mz_tolerance, side="right")
+    counts = stops - starts
+    sources = np.repeat(np.arange(sorted_mz.size), counts)
+    # the candidates of each feature are the consecutive positions starts[i] .. stops[i] - 1
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    targets = np.repeat(starts, counts) + offsets
+    keep = np.abs(sorted_rt[targets] - sorted_rt[sources]) <= rt_tolerance
+    return sources[keep], targets[keep]
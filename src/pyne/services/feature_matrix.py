@@ -0,0 +1,163 @@
+from logging import getLogger
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from pyne.models.feature_matrix import FeatureMatrix
+from scipy.sparse import csr_matrix
+
+from .deconvolution import deconvolve_peaks
+
+LOGGER = getLogger(__name__)
+
+FILE_FORMATS = ("npz", "parquet", "feather")
+
+
+def build_feature_matrix(
+    clustered_peaks_df: DataFrame, sample_ids: Optional[List[str]] = None
+) -> FeatureMatrix:
+    """
+    Pivots the clustered peaks into a sparse samples x features matrix.
+    Each cluster label becomes one feature, described by the deconvolved peak of the cluster (see deconvolve_peaks).
+    The value of a (sample, feature) cell is the highest intensity among the sample's peaks in the cluster.
+    Args
+        clustered_peaks_df (DataFrame): A pandas DataFrame with columns: "sample", "RT", "mz", "intensity", "label".
+        sample_ids (Optional[List[str]]): The samples (rows) of the matrix, in order. Defaults to the sorted samples
+                                          found in clustered_peaks_df. Samples without any peak get an empty row.
+    Returns
+        (FeatureMatrix): The wide feature matrix.
+    """
+    if sample_ids is None:
+        sample_ids = sorted(clustered_peaks_df["sample"].unique())
+    labels = np.sort(clustered_peaks_df["label"].unique())
+
+    features = deconvolve_peaks(peaks_df=clustered_peaks_df)
+    features.insert(0, "label", labels)
+
+    rows = pd.Index(sample_ids).get_indexer(clustered_peaks_df["sample"])
+    if (rows < 0).any():
+        raise ValueError("The clustered peaks contain samples missing from sample_ids.")
+    columns = np.searchsorted(labels, clustered_peaks_df["label"].to_numpy())
+    cells = (
+        DataFrame(
+            {
+                "row": rows,
+                "column": columns,
+                "intensity": clustered_peaks_df["intensity"].to_numpy(),
+            }
+        )
+        .groupby(["row", "column"])["intensity"]
+        .max()
+    )
+    values = csr_matrix(
+        (
+            cells.to_numpy(),
+            (
+                cells.index.get_level_values("row"),
+                cells.index.get_level_values("column"),
+            ),
+        ),
+        shape=(len(sample_ids), len(labels)),
+    )
+    LOGGER.info(
+        f"Built feature matrix with {len(sample_ids)} samples and {len(labels)} features."
+    )
+    return FeatureMatrix(sample_ids=sample_ids, features=features, values=values)
+
+
+def write_feature_matrix(
+    feature_matrix: FeatureMatrix, path: str, file_format: Optional[str] = None
+):
+    """
+    Writes the feature matrix to disk.
+    Formats:
+        - "npz": one uncompressed NumPy archive holding the sparse matrix (CSR arrays), the sample IDs and the features.
+        - "parquet", "feather": the dense wide table (a "sample" column plus one column per feature label), and the
+          features table next to it as <name>.features.<format>. Feather is written uncompressed, so it can be
+          memory-mapped. Both need pyarrow to be installed.
+    Args
+        feature_matrix (FeatureMatrix): The feature matrix to write.
+        path (str): The destination file.
+        file_format (Optional[str]): One of FILE_FORMATS, defaults to the extension of path.
+    """
+    file_format = _resolve_format(path, file_format)
+    if file_format == "npz":
+        values = feature_matrix.values
+        features = feature_matrix.features
+        np.savez(
+            path,
+            data=values.data,
+            indices=values.indices,
+            indptr=values.indptr,
+            shape=np.array(values.shape),
+            sample_ids=np.array(feature_matrix.sample_ids, dtype=str),
+            **{
+                f"feature_{column}": features[column].to_numpy()
+                for column in features.columns
+            },
+        )
+        return
+
+    wide_df = feature_matrix.to_dataframe().reset_index()
+    if file_format == "parquet":
+        wide_df.to_parquet(path, index=False)
+        feature_matrix.features.to_parquet(_features_path(path), index=False)
+    else:
+        wide_df.to_feather(path, compression="uncompressed")
+        feature_matrix.features.to_feather(
+            _features_path(path), compression="uncompressed"
+        )
+
+
+def read_feature_matrix(path: str, file_format: Optional[str] = None) -> FeatureMatrix:
+    """
+    Reads a feature matrix written by write_feature_matrix.
+    Args
+        path (str): The file to read.
+        file_format (Optional[str]): One of FILE_FORMATS, defaults to the extension of path.
+    Returns
+        (FeatureMatrix): The feature matrix.
+    """
+    file_format = _resolve_format(path, file_format)
+    if file_format == "npz":
+        with np.load(path) as archive:
+            values = csr_matrix(
+                (archive["data"], archive["indices"], archive["indptr"]),
+                shape=tuple(archive["shape"]),
+            )
+            features = DataFrame(
+                {
+                    key[len("feature_") :]: archive[key]
+                    for key in archive.files
+                    if key.startswith("feature_")
+                }
+            )
+            sample_ids = archive["sample_ids"].tolist()
+        return FeatureMatrix(sample_ids=sample_ids, features=features, values=values)
+
+    if file_format == "parquet":
+        wide_df = pd.read_parquet(path)
+        features = pd.read_parquet(_features_path(path))
+    else:
+        wide_df = pd.read_feather(path)
+        features = pd.read_feather(_features_path(path))
+    sample_ids = wide_df.pop("sample").tolist()
+    return FeatureMatrix(
+        sample_ids=sample_ids, features=features, values=csr_matrix(wide_df.to_numpy())
+    )
+
+
+def _resolve_format(path: str, file_format: Optional[str]) -> str:
+    file_format = (file_format or Path(path).suffix.lstrip(".")).lower()
+    if file_format not in FILE_FORMATS:
+        raise ValueError(
+            f"Unsupported feature matrix format: {file_format!r}, expected one of {FILE_FORMATS}."
+        )
+    return file_format
+
+
+def _features_path(path: str) -> str:
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}.features{path.suffix}"))
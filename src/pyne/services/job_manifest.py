@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional
+
+
+class JobManifest:
+    """
+    Keeps track of the source files a batch job has already finished, so that an interrupted job can be resumed.
+    The manifest is a JSON lines file with one record per finished source file; a record is appended (and flushed)
+    as soon as the file is done. A source file counts as finished while its size and modification time match the
+    record, it was processed with the same options (stored as a hash) and its output still exists.
+
+    Attributes:
+        path (Path): The manifest file.
+        records (Dict[str, dict]): The latest record of each finished source file, keyed by its absolute path.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.records: Dict[str, dict] = {}
+        self._lock = Lock()
+        if self.path.exists():
+            with open(self.path) as manifest_file:
+                for line in manifest_file:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record["source"]] = record
+
+    def is_done(
+        self, source_file: str, options: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        record = self.get(source_file, options)
+        return record is not None and Path(record["output"]).exists()
+
+    def get(
+        self, source_file: str, options: Optional[Dict[str, Any]] = None
+    ) -> Optional[dict]:
+        """
+        Args:
+            source_file (str): The source file.
+            options (Optional[Dict[str, Any]]): The options the source file is processed with now.
+        Returns:
+            (Optional[dict]): The record of the source file, if it is finished with the same options and unchanged
+                              since.
+        """
+        record = self.records.get(_key(source_file))
+        if (
+            record is None
+            or record["fingerprint"] != _fingerprint(source_file)
+            or record.get("options") != options_hash(options)
+        ):
+            return None
+        return record
+
+    def mark_done(
+        self,
+        source_file: str,
+        output: str,
+        options: Optional[Dict[str, Any]] = None,
+        **details,
+    ):
+        """
+        Records a finished source file.
+        Args:
+            source_file (str): The processed source file.
+            output (str): The file the result was written to.
+            options (Optional[Dict[str, Any]]): The JSON serializable options that determine the output, e.g.
+                                                PipelineConfig.to_dict() and the ingest settings.
+            details: Additional JSON serializable values stored in the record.
+        """
+        record = {
+            "source": _key(source_file),
+            "fingerprint": _fingerprint(source_file),
+            "options": options_hash(options),
+            "output": str(output),
+            **details,
+        }
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as manifest_file:
+                manifest_file.write(json.dumps(record) + "\n")
+                manifest_file.flush()
+                os.fsync(manifest_file.fileno())
+            self.records[record["source"]] = record
+
+
+def _key(source_file: str) -> str:
+    return str(Path(source_file).resolve())
+
+
+def _fingerprint(source_file: str) -> str:
+    stat = os.stat(source_file)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def options_hash(options: Optional[Dict[str, Any]]) -> str:
+    """
+    Returns a hash of the options, independent of the order of their keys.
+    """
+    encoded = json.dumps(options or {}, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
@@ -0,0 +1,391 @@
+import json
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from pathlib import Path
+from threading import Event, Lock
+from time import perf_counter, time
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
+from pandas import DataFrame
+from pyne.models.job import Job
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.region import RegionOfInterest
+
+from .deconvolution import deconvolve_peaks
+from .feature_matrix import build_feature_matrix, write_feature_matrix
+from .peak_clustering import apply_dbscan_clustering
+from .preprocessor import preprocess_peaks
+from .profiling import StageProfiler
+from .spectrum_reader import check_sample_names, sample_name
+
+LOGGER = getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobService:
+    """
+    Runs preprocessing jobs in a pool of long-lived worker processes, so that the imports and the warm-up of the
+    pipeline are paid once when the service starts instead of once per job.
+    At most `workers` jobs run at the same time, the others wait in the service's queue (at most `max_queued` of
+    them) and are handed to the pool in submission order as workers become free. When a worker process dies, the
+    jobs running in the pool fail and the pool is replaced by a new one, which runs the queued jobs.
+    Attributes:
+        workers (int): The number of worker processes, i.e. the number of jobs running at the same time.
+        max_queued (int): The maximum number of unfinished jobs, further submissions are rejected.
+        max_finished (int): The number of finished jobs kept for lookup, the oldest ones are forgotten.
+        jobs (Dict[str, Job]): The known jobs, in submission order.
+    """
+
+    def __init__(
+        self, workers: int = 1, max_queued: int = 100, max_finished: int = 1000
+    ):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.jobs: Dict[str, Job] = {}
+        self._lock = Lock()
+        self._finished: Dict[str, Event] = {}
+        self._queue: Deque[Job] = deque()
+        self._running = 0
+        self._executor = self._start_executor()
+        # start every worker now, so the first jobs do not pay the warm-up
+        for future in [self._executor.submit(_ready) for _ in range(workers)]:
+            future.result()
+        LOGGER.info(f"Job service started with {workers} warm workers.")
+
+    def submit(self, request: Dict[str, Any]) -> Job:
+        """
+        Queues a preprocessing job.
+        Args:
+            request (Dict[str, Any]): The job: "source_files" (list of paths), and optionally "output" (path),
+                                      "config" (PipelineConfig values), "mass_traces", "sparsify_threshold",
+                                      "rt_windows" and "mz_ranges" (lists of [low, high]).
+        Returns:
+            (Job): The queued job.
+        Raises:
+            ValueError: The request is invalid.
+            JobQueueFull: There are already max_queued unfinished jobs.
+        """
+        job = parse_job_request(uuid4().hex, request)
+        with self._lock:
+            if self.pending_count >= self.max_queued:
+                raise JobQueueFull(f"{self.pending_count} jobs are waiting already.")
+            self.jobs[job.job_id] = job
+            self._finished[job.job_id] = Event()
+            self._queue.append(job)
+        LOGGER.info(f"Queued job {job.job_id} with {len(job.source_files)} files.")
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job]:
+        """
+        Returns the known jobs in submission order, taken under the lock since finished jobs are forgotten while
+        other jobs finish.
+        """
+        with self._lock:
+            return list(self.jobs.values())
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> Job:
+        """
+        Waits at most timeout seconds for the job to finish.
+        """
+        finished = self._finished.get(job.job_id)
+        if finished is not None:
+            finished.wait(timeout=timeout)
+        return job
+
+    @property
+    def pending_count(self) -> int:
+        return sum(not job.finished for job in self.jobs.values())
+
+    def summary(self) -> Dict[str, Any]:
+        statuses = [job.status for job in self.list_jobs()]
+        return {
+            "workers": self.workers,
+            **{
+                status: statuses.count(status)
+                for status in (Job.QUEUED, Job.RUNNING, Job.DONE, Job.FAILED)
+            },
+        }
+
+    def shutdown(self):
+        with self._lock:
+            self._queue.clear()
+        self._executor.shutdown(wait=True)
+
+    def _dispatch(self):
+        started = []
+        with self._lock:
+            while self._queue and self._running < self.workers:
+                job = self._queue[0]
+                try:
+                    future = self._submit(job)
+                except BrokenProcessPool:
+                    # a worker died while the pool was idle, the job has not run yet
+                    self._restart_executor(self._executor)
+                    future = self._submit(job)
+                self._queue.popleft()
+                job.future = future
+                self._running += 1
+                started.append((job, self._executor))
+        for job, executor in started:
+            job.future.add_done_callback(
+                lambda future, job=job, executor=executor: self._finish(
+                    job, future, executor
+                )
+            )
+
+    def _submit(self, job: Job) -> Future:
+        return self._executor.submit(
+            run_job,
+            job.source_files,
+            job.output,
+            job.config,
+            job.region,
+            job.mass_traces,
+            job.sparsify_threshold,
+        )
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+
+    def _restart_executor(self, broken: ProcessPoolExecutor):
+        """
+        Replaces the broken pool by a new one, unless that already happened. Must be called under the lock.
+        """
+        if broken is not self._executor:
+            return
+        LOGGER.error("A worker process died, restarting the worker pool.")
+        broken.shutdown(wait=False)
+        self._executor = self._start_executor()
+
+    def _finish(self, job: Job, future: Future, executor: ProcessPoolExecutor):
+        with self._lock:
+            if future.cancelled():
+                job.error = "Cancelled."
+            elif future.exception() is not None:
+                job.error = repr(future.exception())
+                LOGGER.error(f"Job {job.job_id} failed: {job.error}")
+                if isinstance(future.exception(), BrokenProcessPool):
+                    self._restart_executor(executor)
+            else:
+                outcome = future.result()
+                job.started_at = outcome["started_at"]
+                job.timings = outcome["timings"]
+                job.result = outcome["result"]
+                LOGGER.info(
+                    f"Job {job.job_id} finished in {job.timings['total']:.3f} s."
+                )
+            job.finished_at = time()
+            self._running -= 1
+            self._finished.pop(job.job_id).set()
+            finished = [job_id for job_id, known in self.jobs.items() if known.finished]
+            for job_id in finished[: max(len(finished) - self.max_finished, 0)]:
+                del self.jobs[job_id]
+        self._dispatch()
+
+
+def parse_job_request(job_id: str, request: Dict[str, Any]) -> Job:
+    """
+    Validates a job request (see JobService.submit) and creates its job.
+    Raises:
+        ValueError: The request is invalid.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("The job request must be a JSON object.")
+    unknown = set(request) - {
+        "source_files",
+        "output",
+        "config",
+        "mass_traces",
+        "sparsify_threshold",
+        "rt_windows",
+        "mz_ranges",
+    }
+    if unknown:
+        raise ValueError(f"Unknown job request keys: {sorted(unknown)}.")
+    source_files = request.get("source_files")
+    if not isinstance(source_files, list) or not source_files:
+        raise ValueError("source_files must be a non-empty list of paths.")
+    missing = [
+        source_file for source_file in source_files if not Path(source_file).is_file()
+    ]
+    if missing:
+        raise ValueError(f"Input files not found: {missing}")
+    check_sample_names(source_files)
+
+    rt_windows = request.get("rt_windows")
+    mz_ranges = request.get("mz_ranges")
+    region = (
+        RegionOfInterest(
+            rt_windows=[tuple(window) for window in rt_windows] if rt_windows else None,
+            mz_ranges=[tuple(mz_range) for mz_range in mz_ranges]
+            if mz_ranges
+            else None,
+        )
+        if rt_windows or mz_ranges
+        else None
+    )
+    return Job(
+        job_id=job_id,
+        source_files=[str(source_file) for source_file in source_files],
+        output=request.get("output"),
+        config=PipelineConfig.from_dict(request.get("config") or {}),
+        region=region,
+        mass_traces=bool(request.get("mass_traces", False)),
+        sparsify_threshold=request.get("sparsify_threshold"),
+    )
+
+
+def run_job(
+    source_files: List[str],
+    output: Optional[str],
+    config: PipelineConfig,
+    region: Optional[RegionOfInterest],
+    mass_traces: bool,
+    sparsify_threshold: Optional[float],
+) -> Dict[str, Any]:
+    """
+    Preprocesses the source files in a worker process, like the preprocess command.
+    Returns:
+        (Dict[str, Any]): The start time, the stage timings and the result: the output file, or the features as
+                          a list of records when no output is given, and the feature count.
+    """
+    started_at = time()
+    start = perf_counter()
+    profiler = StageProfiler()
+    clustered_peaks = preprocess_peaks(
+        source_files=source_files,
+        prefetch=0,
+        sparsify_threshold=sparsify_threshold,
+        region=region,
+        mass_traces=mass_traces,
+        config=config,
+        profiler=profiler,
+    )
+    result: Dict[str, Any] = {"output": output}
+    with profiler.stage("output"):
+        if output is None or Path(output).suffix.lower() == ".csv":
+            features = deconvolve_peaks(peaks_df=clustered_peaks)
+            result["feature_count"] = len(features)
+            if output is None:
+                result["features"] = features.to_dict(orient="records")
+            else:
+                features.to_csv(output, index=False)
+        else:
+            feature_matrix = build_feature_matrix(
+                clustered_peaks_df=clustered_peaks,
+                sample_ids=[sample_name(source_file) for source_file in source_files],
+            )
+            write_feature_matrix(feature_matrix, output)
+            result["feature_count"] = int(clustered_peaks["label"].nunique())
+    return {
+        "started_at": started_at,
+        "timings": {**profiler.timings, "total": perf_counter() - start},
+        "result": result,
+    }
+
+
+def warm_up():
+    """
+    Initializes a worker process: runs the lazily initialized parts of the pipeline (e.g. the clustering) once
+    on a tiny input, so that the first job of the worker does not pay for them.
+    """
+    peaks_df = DataFrame(
+        {
+            "RT": [1.0, 1.1, 2.0],
+            "mz": [100.0, 100.01, 300.0],
+            "intensity": [1.0, 2.0, 3.0],
+        }
+    )
+    deconvolve_peaks(peaks_df=apply_dbscan_clustering(peaks_df=peaks_df))
+
+
+def _ready() -> bool:
+    return True
+
+
+def serve(service: JobService, host: str = "127.0.0.1", port: int = 8765):
+    """
+    Serves the job service over HTTP until interrupted:
+        - POST /jobs with a JSON job request (see JobService.submit): 202 and the job.
+        - GET /jobs: the known jobs, without their features.
+        - GET /jobs/<job_id>[?wait=<seconds>]: the job, waiting at most that long for it to finish.
+        - GET /health: the worker count and the number of jobs per status.
+    """
+    server = ThreadingHTTPServer((host, port), _handler_class(service))
+    LOGGER.info(f"Serving preprocessing jobs on http://{host}:{server.server_port}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def _handler_class(service: JobService):
+    class JobRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["health"]:
+                self._reply(HTTPStatus.OK, {"status": "ok", **service.summary()})
+            elif parts == ["jobs"]:
+                jobs = [
+                    {**job.to_dict(), "result": None} for job in service.list_jobs()
+                ]
+                self._reply(HTTPStatus.OK, {"jobs": jobs})
+            elif len(parts) == 2 and parts[0] == "jobs" and service.get(parts[1]):
+                job = service.get(parts[1])
+                wait = parse_qs(url.query).get("wait")
+                if wait:
+                    try:
+                        job = service.wait(job, timeout=float(wait[0]))
+                    except ValueError:
+                        self._reply(
+                            HTTPStatus.BAD_REQUEST, {"error": "wait must be a number."}
+                        )
+                        return
+                self._reply(HTTPStatus.OK, job.to_dict())
+            else:
+                self._reply(HTTPStatus.NOT_FOUND, {"error": f"Not found: {url.path}"})
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip("/") != "/jobs":
+                self._reply(HTTPStatus.NOT_FOUND, {"error": f"Not found: {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                job = service.submit(json.loads(self.rfile.read(length) or b"null"))
+            except (ValueError, TypeError) as error:
+                self._reply(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            except JobQueueFull as error:
+                self._reply(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+            else:
+                self._reply(HTTPStatus.ACCEPTED, job.to_dict())
+
+        def _reply(self, status: HTTPStatus, body: Dict[str, Any]):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args):
+            LOGGER.debug(format % args)
+
+    return JobRequestHandler
@@ -0,0 +1,131 @@
+from logging import getLogger
+from typing import List, Optional
+
+import numpy as np
+from numpy import ndarray
+from pyne.models.gridded_spectrum import GriddedSpectrum
+from pyne.models.spectrum import Spectrum
+from scipy.sparse import csr_matrix
+
+LOGGER = getLogger(__name__)
+
+
+def build_mz_grid(mz_min: float, mz_max: float, resolution: float) -> ndarray:
+    """
+    Returns the multiples of resolution covering [mz_min, mz_max]. Grids of the same resolution built for
+    different ranges are aligned, so spectrums resampled one at a time still share their grid points.
+    """
+    if resolution <= 0:
+        raise ValueError(f"The m/z grid resolution must be positive, got {resolution}.")
+    first = int(np.floor(mz_min / resolution))
+    last = int(np.ceil(mz_max / resolution))
+    return np.arange(first, last + 1, dtype=np.float64) * resolution
+
+
+def resample_spectrum(
+    spectrum: Spectrum,
+    resolution: Optional[float] = None,
+    mz_grid: Optional[ndarray] = None,
+    sparse: bool = False,
+    block_rows: Optional[int] = None,
+) -> GriddedSpectrum:
+    """
+    Resamples every scan of the spectrum onto one m/z grid by linear interpolation. Each segment of a scan is
+    interpolated separately and grid points outside the segments are 0, so sparsified scans stay sparse.
+    Args:
+        spectrum (Spectrum): The spectrum to resample, it is not modified.
+        resolution (Optional[float]): The grid spacing, the grid then covers the m/z range of the spectrum.
+        mz_grid (Optional[NDArray]): An explicit ascending grid, e.g. one shared by a cohort (see resample_cohort).
+        sparse (bool): Store the (scans x grid points) matrix as a CSR matrix instead of a dense array.
+        block_rows (Optional[int]): The number of rows the matrix stages process at once, see GriddedSpectrum.
+    Returns:
+        (GriddedSpectrum): The resampled spectrum.
+    """
+    if mz_grid is None:
+        if resolution is None:
+            raise ValueError("Either resolution or mz_grid is required.")
+        mz_min, mz_max = _mz_range([spectrum])
+        mz_grid = build_mz_grid(mz_min, mz_max, resolution)
+    mz_grid = np.asarray(mz_grid, dtype=np.float64)
+    dtype = spectrum.scans[0].intensity_array.dtype if spectrum.scans else np.float64
+
+    row_columns: List[ndarray] = []
+    row_values: List[ndarray] = []
+    for scan in spectrum.scans:
+        columns, values = [], []
+        for start, stop in scan.segments():
+            if stop == start:
+                continue
+            mz_array = scan.mz_array[start:stop]
+            low = mz_grid.searchsorted(mz_array[0], side="left")
+            high = mz_grid.searchsorted(mz_array[-1], side="right")
+            columns.append(np.arange(low, high))
+            values.append(
+                np.interp(mz_grid[low:high], mz_array, scan.intensity_array[start:stop])
+            )
+        row_columns.append(
+            np.concatenate(columns) if columns else np.empty(0, dtype=np.int64)
+        )
+        row_values.append(np.concatenate(values) if values else np.empty(0))
+
+    shape = (len(spectrum.scans), mz_grid.size)
+    if sparse:
+        indptr = np.concatenate(
+            ([0], np.cumsum([len(columns) for columns in row_columns]))
+        )
+        intensities = csr_matrix(
+            (
+                np.concatenate(row_values or [np.empty(0)]).astype(dtype),
+                np.concatenate(row_columns or [np.empty(0, dtype=np.int64)]),
+                indptr,
+            ),
+            shape=shape,
+        )
+    else:
+        intensities = np.zeros(shape, dtype=dtype)
+        for row, (columns, values) in enumerate(zip(row_columns, row_values)):
+            intensities[row, columns] = values
+
+    return GriddedSpectrum(
+        retention_times=[scan.retention_time for scan in spectrum.scans],
+        mz_grid=mz_grid,
+        intensities=intensities,
+        scan_ids=[scan.scan_id for scan in spectrum.scans],
+        sample_id=spectrum.sample_id,
+        block_rows=block_rows,
+    )
+
+
+def resample_cohort(
+    spectrum_list: List[Spectrum],
+    resolution: float,
+    sparse: bool = False,
+    block_rows: Optional[int] = None,
+) -> List[GriddedSpectrum]:
+    """
+    Resamples every spectrum of the cohort onto the same m/z grid, covering the m/z range of all of them,
+    so their matrices can be stacked or compared column by column.
+    """
+    mz_min, mz_max = _mz_range(spectrum_list)
+    mz_grid = build_mz_grid(mz_min, mz_max, resolution)
+    LOGGER.info(
+        f"Resampling {len(spectrum_list)} spectrums onto {mz_grid.size} m/z grid points."
+    )
+    return [
+        resample_spectrum(
+            spectrum, mz_grid=mz_grid, sparse=sparse, block_rows=block_rows
+        )
+        for spectrum in spectrum_list
+    ]
+
+
+def _mz_range(spectrum_list: List[Spectrum]):
+    bounds = [
+        (scan.mz_array.min(), scan.mz_array.max())
+        for spectrum in spectrum_list
+        for scan in spectrum.scans
+        if scan.mz_array.size
+    ]
+    if not bounds:
+        return 0.0, 0.0
+    return min(low for low, _ in bounds), max(high for _, high in bounds)
@@ -0,0 +1,37 @@
+from typing import Iterable
+
+from pandas import DataFrame
+from pyteomics import mzml
+
+from .compressed_io import open_source
+
+
+def convert_mzml_to_csv(source_file: str, destination: str) -> int:
+    """
+    Converts an .mzML file to the .csv format read by read_spectra (columns: 'RT', 'intarray', 'mzarray').
+    The arrays are written in full, as space separated values between square brackets.
+    A compressed source file (see detect_compression) is decompressed while it is parsed.
+    Args:
+        source_file (str): The .mzML file to convert, optionally gzip, zstd, bz2 or xz compressed.
+        destination (str): The .csv file to write.
+    Returns:
+        (int): The number of converted scans.
+    """
+    entry_list = list()
+    with open_source(source_file) as source, mzml.read(source) as reader:
+        for scan in reader:
+            entry_list.append(
+                {
+                    "RT": scan["scanList"]["scan"][0]["scan start time"],
+                    "intarray": format_float_list(scan["intensity array"]),
+                    "mzarray": format_float_list(scan["m/z array"]),
+                }
+            )
+    DataFrame(entry_list, columns=["RT", "intarray", "mzarray"]).to_csv(
+        destination, index=False
+    )
+    return len(entry_list)
+
+
+def format_float_list(values: Iterable[float]) -> str:
+    return "[" + " ".join(repr(float(value)) for value in values) + "]"
@@ -0,0 +1,279 @@
+import json
+from concurrent.futures import Future, ProcessPoolExecutor
+from copy import deepcopy
+from itertools import product
+from logging import getLogger
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from numpy import float64
+from numpy.typing import DTypeLike
+from pandas import DataFrame
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.spectrum import Spectrum
+
+from .baseline_correction import get_baseline_engine
+from .deconvolution import deconvolve_peaks
+from .peak_alignment import align_peaks
+from .peak_clustering import EPS, apply_dbscan_clustering
+from .peak_normalization import normalize_peaks
+from .preprocessor import retrieve_feature_matrix
+from .spectrum_reader import read_spectra
+
+LOGGER = getLogger(__name__)
+
+# The stages of a sweep in pipeline order, with the parameters each one depends on.
+# A stage is computed once per distinct combination of its own and all upstream parameters.
+SWEEP_STAGES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("baseline_alignment", ("baseline_engine", "baseline_params")),
+    ("noise_filtering", ("noise_sigma",)),
+    ("peak_detection", ("peak_threshold", "peak_min_dist")),
+    ("peak_alignment", ("mz_adj_win", "rt_adj_win", "frac")),
+    ("clustering", ("eps",)),
+]
+SWEEP_PARAMETERS = [name for _, names in SWEEP_STAGES for name in names]
+ALIGNMENT_DEFAULTS = {"mz_adj_win": 0.2, "rt_adj_win": 20, "frac": 0.3}
+STAGE_COLUMNS = ["read"] + [stage for stage, _ in SWEEP_STAGES] + ["deconvolution"]
+
+
+def sweep_parameters(
+    source_files: List[str],
+    grid: Dict[str, Sequence[Any]],
+    config: Optional[PipelineConfig] = None,
+    workers: int = 1,
+    intensity_dtype: DTypeLike = float64,
+    keep_features: bool = False,
+) -> DataFrame:
+    """
+    Preprocesses the source files with every combination of the parameter grid, sharing the upstream stages.
+    The configurations form a tree of stages (see SWEEP_STAGES): the files are read once, and each stage is
+    computed once for each distinct combination of its parameters and those of the stages before it, e.g. a
+    grid over noise_sigma and eps runs baseline alignment once, noise filtering, peak detection and peak
+    alignment once per sigma, and only clustering and deconvolution once per configuration. The tree is
+    walked depth first, so only one branch of spectrum copies is held in memory, and the clustering and
+    deconvolution leaves run in a process pool while the walk goes on.
+    Args:
+        source_files (List[str]): The .csv files to preprocess.
+        grid (Dict[str, Sequence[Any]]): The values of each swept parameter, one of SWEEP_PARAMETERS: the
+                                         PipelineConfig stage parameters, the peak alignment windows and
+                                         LOESS frac (see align_peaks), and the DBSCAN eps.
+        config (Optional[PipelineConfig]): The values of the parameters that are not swept.
+        workers (int): The number of processes running the leaves.
+        intensity_dtype (DTypeLike): The dtype intensities are stored and processed in.
+        keep_features (bool): Add the deconvolved features of each configuration in a "feature_table" column.
+    Returns:
+        (DataFrame): One row per configuration, in grid order: the swept parameters, the feature count, and the
+                     wall time of each stage in seconds. A shared stage's time is repeated in every configuration
+                     that uses it, "total" is the time the configuration would take on its own.
+    """
+    if config is None:
+        config = PipelineConfig()
+    unknown = set(grid) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}.")
+    if config.mz_grid_resolution is not None or config.qc_prefilter:
+        raise ValueError(
+            "Sweeps run the scan-level stages, without mz_grid_resolution and qc_prefilter."
+        )
+
+    configurations = [
+        _resolve_parameters(dict(zip(grid, values)), config)
+        for values in product(*grid.values())
+    ]
+    start = perf_counter()
+    spectrum_list = read_spectra(
+        source_files=source_files, intensity_dtype=intensity_dtype
+    )
+    read_time = perf_counter() - start
+
+    rows: List[Optional[Dict[str, Any]]] = [None] * len(configurations)
+    leaves: List[Tuple[List[int], Dict[str, float], Future]] = []
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    stage_runs = {"read": 1}
+    try:
+        _fan_out(
+            stage_index=0,
+            indexes=list(range(len(configurations))),
+            configurations=configurations,
+            value=spectrum_list,
+            timings={"read": read_time},
+            leaves=leaves,
+            executor=executor,
+            intensity_dtype=intensity_dtype,
+            stage_runs=stage_runs,
+        )
+        for indexes, timings, future in leaves:
+            features, leaf_timings = future.result()
+            for index in indexes:
+                row = {name: configurations[index][name] for name in grid}
+                row["features"] = len(features)
+                row.update(timings)
+                row.update(leaf_timings)
+                row["total"] = sum(row[name] for name in STAGE_COLUMNS)
+                if keep_features:
+                    row["feature_table"] = features
+                rows[index] = row
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    LOGGER.info(
+        f"Swept {len(configurations)} configurations: "
+        + ", ".join(f"{stage} ran {count} times" for stage, count in stage_runs.items())
+        + "."
+    )
+    return DataFrame(rows)
+
+
+def _fan_out(
+    stage_index: int,
+    indexes: List[int],
+    configurations: List[Dict[str, Any]],
+    value: Any,
+    timings: Dict[str, float],
+    leaves: List,
+    executor: Optional[ProcessPoolExecutor],
+    intensity_dtype: DTypeLike,
+    stage_runs: Dict[str, int],
+):
+    stage, names = SWEEP_STAGES[stage_index]
+    groups: Dict[str, List[int]] = {}
+    for index in indexes:
+        key = json.dumps(
+            [configurations[index][name] for name in names], sort_keys=True
+        )
+        groups.setdefault(key, []).append(index)
+    stage_runs[stage] = stage_runs.get(stage, 0) + len(groups)
+
+    for group_number, group in enumerate(groups.values()):
+        parameters = {name: configurations[group[0]][name] for name in names}
+        if stage == "clustering":
+            arguments = (value, parameters["eps"])
+            if executor is None:
+                future = Future()
+                future.set_result(_cluster_and_deconvolve(*arguments))
+            else:
+                future = executor.submit(_cluster_and_deconvolve, *arguments)
+            leaves.append((group, dict(timings), future))
+            continue
+
+        # the spectrum stages work in place: every branch but the last one gets a copy
+        last = group_number == len(groups) - 1
+        stage_input = value if last or stage not in IN_PLACE_STAGES else deepcopy(value)
+        start = perf_counter()
+        output = STAGE_FUNCTIONS[stage](
+            stage_input, intensity_dtype=intensity_dtype, **parameters
+        )
+        _fan_out(
+            stage_index=stage_index + 1,
+            indexes=group,
+            configurations=configurations,
+            value=output,
+            timings={**timings, stage: perf_counter() - start},
+            leaves=leaves,
+            executor=executor,
+            intensity_dtype=intensity_dtype,
+            stage_runs=stage_runs,
+        )
+
+
+def _align_baselines(
+    spectrum_list: List[Spectrum],
+    baseline_engine: str,
+    baseline_params: Dict[str, Any],
+    **_,
+) -> List[Spectrum]:
+    baseline = get_baseline_engine(baseline_engine, **baseline_params)
+    for spectrum in spectrum_list:
+        spectrum.align_baselines(baseline=baseline)
+    return spectrum_list
+
+
+def _filter_noise(
+    spectrum_list: List[Spectrum], noise_sigma: float, **_
+) -> List[Spectrum]:
+    for spectrum in spectrum_list:
+        spectrum.filter_noise(sigma=noise_sigma)
+    return spectrum_list
+
+
+def _detect_peaks(
+    spectrum_list: List[Spectrum], peak_threshold: float, peak_min_dist: int, **_
+) -> List[Tuple[str, list]]:
+    # only the peaks are passed on, so that the branches below do not share mutable spectrums
+    detected = []
+    for spectrum in spectrum_list:
+        # detect_peaks extends the peak list, the spectrum may already hold the peaks of another branch
+        spectrum.peaks = []
+        spectrum.detect_peaks(thres=peak_threshold, min_dist=peak_min_dist)
+        detected.append((spectrum.sample_id, spectrum.peaks))
+    return detected
+
+
+def _align_peaks(
+    detected: List[Tuple[str, list]],
+    mz_adj_win: float,
+    rt_adj_win: float,
+    frac: float,
+    intensity_dtype: DTypeLike,
+) -> DataFrame:
+    aligned_peaks = align_peaks(
+        spectrum_list=[
+            Spectrum.from_peaks(peaks, sample_id=sample_id)
+            for sample_id, peaks in detected
+        ],
+        mz_adj_win=mz_adj_win,
+        rt_adj_win=rt_adj_win,
+        frac=frac,
+    )
+    return retrieve_feature_matrix(
+        normalize_peaks(peaks=aligned_peaks, dtype=intensity_dtype)
+    )
+
+
+def _cluster_and_deconvolve(
+    peak_df: DataFrame, eps: float
+) -> Tuple[DataFrame, Dict[str, float]]:
+    start = perf_counter()
+    clustered_peaks = apply_dbscan_clustering(peaks_df=peak_df.copy(), eps=eps)
+    clustered = perf_counter()
+    features = deconvolve_peaks(peaks_df=clustered_peaks)
+    return features, {
+        "clustering": clustered - start,
+        "deconvolution": perf_counter() - clustered,
+    }
+
+
+STAGE_FUNCTIONS: Dict[str, Callable] = {
+    "baseline_alignment": _align_baselines,
+    "noise_filtering": _filter_noise,
+    "peak_detection": _detect_peaks,
+    "peak_alignment": _align_peaks,
+}
+IN_PLACE_STAGES = {"baseline_alignment", "noise_filtering"}
+
+
+def _resolve_parameters(
+    swept: Dict[str, Any], config: PipelineConfig
+) -> Dict[str, Any]:
+    baseline_engine = swept.get("baseline_engine", config.baseline_engine)
+    if "baseline_params" in swept:
+        baseline_params = swept["baseline_params"]
+    elif baseline_engine == config.baseline_engine:
+        baseline_params = config.baseline_params
+    else:
+        baseline_params = PipelineConfig(
+            baseline_engine=baseline_engine
+        ).baseline_params
+    return {
+        "baseline_engine": baseline_engine,
+        "baseline_params": baseline_params,
+        "noise_sigma": swept.get("noise_sigma", config.noise_sigma),
+        "peak_threshold": swept.get("peak_threshold", config.peak_threshold),
+        "peak_min_dist": swept.get("peak_min_dist", config.peak_min_dist),
+        **{
+            name: swept.get(name, default)
+            for name, default in ALIGNMENT_DEFAULTS.items()
+        },
+        "eps": swept.get("eps", EPS),
+    }
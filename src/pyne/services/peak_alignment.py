@@ -1,31 +1,83 @@
+import hashlib
 from logging import getLogger
-from typing import List, Tuple
+from typing import Hashable, List, Tuple
 
+from numpy import abs as np_abs
+from numpy import arange as np_arange
+from numpy import argmax as np_argmax
+from numpy import argsort as np_argsort
 from numpy import array as np_array
+from numpy import ceil as np_ceil
+from numpy import cumsum as np_cumsum
+from numpy import diff as np_diff
+from numpy import full as np_full
+from numpy import inf as np_inf
+from numpy import interp as np_interp
+from numpy import isfinite as np_isfinite
+from numpy import linspace as np_linspace
+from numpy import maximum as np_maximum
+from numpy import median as np_median
+from numpy import minimum as np_minimum
+from numpy import ndarray
+from numpy import repeat as np_repeat
+from numpy import sqrt as np_sqrt
+from numpy import unique as np_unique
 from pyne.models.peak import Peak
+from pyne.models.rt_correction import RetentionTimeCorrection
 from pyne.models.spectrum import Spectrum
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.ndimage import gaussian_filter1d
 from statsmodels.nonparametric.smoothers_lowess import lowess
 
+from .chromatograms import total_ion_chromatogram
+
 LOGGER = getLogger(__name__)
 
+# The largest relative stretch of a test retention time axis searched by the coarse alignment
+MAX_SCALE_DEVIATION = 0.02
+# The largest number of candidate scales of the coarse alignment
+MAX_SCALE_COUNT = 201
+# The coarse alignment is only trusted above this correlation of the standardized chromatograms
+MIN_COARSE_CORRELATION = 0.5
+# The largest number of retention time points of the cross-correlated chromatograms
+MAX_TIC_POINTS = 4096
+# The adaptive matching window after the coarse alignment, in robust standard deviations of the residual drift
+ADAPTIVE_WINDOW_FACTOR = 4.0
+
 
-def align_peaks(spectrum_list: List[Spectrum]) -> List[Peak]:
+def align_peaks(
+    spectrum_list: List[Spectrum],
+    mz_adj_win: float = 0.2,
+    rt_adj_win: float = 20,
+    frac: float = 0.3,
+    knot_count: int = 100,
+    coarse_alignment: bool = False,
+) -> List[Peak]:
     """
     Performs the peak alignment steps.
     Steps:
         - A Spectrum with the highest number of peaks across samples is selected called Master Data (master_spectrum).
         - The rest of the spectrums that have peaks are selected and called Test Data (test_spectrums).
-        - Peaks in Test Data are transformed:
-            - Each peak from the Test Data is compared to peaks from the Master Data
-            - If a Test Data peak m/z and RT values are within a pre-defined m/z (mz_adj_win) and RT (rt_adj_win) range from
-                the Master Data Peak, then we perform transformation
-            - By transformation, two new peaks get generated
-            - The first peak will have RT value of (Master Data peak RT + Test Data peak RT) / 2
-            - The second peak will have RT value of (Master Data peak RT - Test Data peak RT)
-        - The LOESS regression algorithm is used to smooth the transformed peaks.
+        - For each Test Data spectrum a retention time drift model is fitted once:
+            - Each peak from the Master Data is paired with the Test Data peaks whose m/z and RT values are within a
+                pre-defined m/z (mz_adj_win) and RT (rt_adj_win) range from it
+            - The drift (Master Data peak RT - Test Data peak RT) of the pairs is smoothed with the LOESS regression
+                algorithm as a function of the Test Data peak RT, and stored as a lookup table
+        - Every peak of the Test Data spectrum (matched or not) is shifted by the drift interpolated at its RT.
+        - The Master Data peaks are kept as they are, since they define the reference retention time axis.
+    Drift models are cached on the spectrums (Spectrum.rt_correction) and reused while the master spectrum, the peaks
+    of both spectrums and the fit parameters stay the same.
     Args
         spectrum_list (List[Spectrum]): The list of Spectrums and their peaks which will be aligned.
-        return_transformed_flag (bool): Flag to indicate whether the transformed peaks should also be returned.
+        mz_adj_win (float): Restriction for the mz value of a Peak pair.
+        rt_adj_win (float): Restriction for the retention_time value of a Peak pair.
+        frac (float): The fraction of the matched pairs used when estimating each LOESS value. The default is 0.3,
+                      the per-pair regression of apply_loess_regression used 0.01: a single fit over all pairs of a
+                      spectrum needs a wider span to smooth out the wrong pairs.
+        knot_count (int): The maximum number of knots in a drift lookup table.
+        coarse_alignment (bool): Estimate the global drift of each Test Data spectrum from its total ion
+                                 chromatogram first, and match the pairs in a narrower adaptive window
+                                 (see fit_rt_correction).
     Returns
         (List[Peak]): The list of aligned peaks.
     """
@@ -34,15 +86,35 @@ def align_peaks(spectrum_list: List[Spectrum]) -> List[Peak]:
     test_spectrums = find_test_spectrums(
         spectrum_list=spectrum_list, master_spectrum=master_spectrum
     )
-    transformed_peaks = transform_peaks(
-        mz_adj_win=0.2,
-        rt_adj_win=20,
-        master_spectrum=master_spectrum,
-        test_spectrums=test_spectrums,
-    )
-    smoothened_peaks = apply_loess_regression(transformed_peaks=transformed_peaks)
-    smoothened_peaks = sorted(smoothened_peaks, key=lambda peak: (peak.retention_time))
-    return smoothened_peaks
+    aligned_peaks = list(master_spectrum.peaks)
+    parameters = (mz_adj_win, rt_adj_win, frac, knot_count, coarse_alignment)
+    master_fingerprint = _peak_fingerprint(master_spectrum)
+    for spectrum in test_spectrums:
+        fit_key = (
+            master_spectrum.spectrum_id,
+            master_fingerprint,
+            _peak_fingerprint(spectrum),
+            parameters,
+        )
+        correction = spectrum.rt_correction
+        if correction is None or correction.fit_key != fit_key:
+            correction = fit_rt_correction(
+                mz_adj_win=mz_adj_win,
+                rt_adj_win=rt_adj_win,
+                master_spectrum=master_spectrum,
+                test_spectrum=spectrum,
+                frac=frac,
+                knot_count=knot_count,
+                coarse_alignment=coarse_alignment,
+            )
+            correction.fit_key = fit_key
+            spectrum.rt_correction = correction
+        aligned_peaks.extend(
+            apply_rt_correction(peaks=spectrum.peaks, rt_correction=correction)
+        )
+
+    LOGGER.info(f"Aligned {len(aligned_peaks)} peaks.")
+    return sorted(aligned_peaks, key=lambda peak: (peak.retention_time))
 
 
 def find_master_spectrum(spectrum_list: List[Spectrum]) -> Spectrum:
@@ -138,6 +210,7 @@ def transform_spectrum_peaks(
                     retention_time=(peak.retention_time + test_peak.retention_time) / 2,
                     intensity=peak.intensity,
                     mz=peak.mz,
+                    sample_id=peak.sample_id,
                 )
                 t = Peak(
                     scan_id=test_peak.scan_id,
@@ -145,6 +218,7 @@ def transform_spectrum_peaks(
                     retention_time=peak.retention_time - test_peak.retention_time,
                     intensity=test_peak.intensity,
                     mz=test_peak.mz,
+                    sample_id=test_peak.sample_id,
                 )
                 transformed_peaks.append((m, t))
 
@@ -180,6 +254,7 @@ def apply_loess_regression(transformed_peaks: List[Tuple[Peak, Peak]]) -> List[P
             retention_time=float(y_smoothened[i]),
             intensity=test_peak.intensity,
             mz=test_peak.mz,
+            sample_id=test_peak.sample_id,
         )
 
         smoothened_peaks.append(updated_test_peak)
@@ -187,3 +262,355 @@ def apply_loess_regression(transformed_peaks: List[Tuple[Peak, Peak]]) -> List[P
     LOGGER.info("Finished regression algorithm.")
 
     return smoothened_peaks
+
+
+def match_peak_pairs(
+    mz_adj_win: float,
+    rt_adj_win: float,
+    master_spectrum: Spectrum,
+    test_spectrum: Spectrum,
+) -> Tuple[ndarray, ndarray]:
+    """
+    Finds every (Master Data peak, Test Data peak) pair within the m/z and RT windows, the same pairs
+    transform_spectrum_peaks generates. The Test Data peaks are sorted by m/z once, so that the candidates
+    for each Master Data peak are looked up with a binary search instead of a full scan.
+    Args
+        mz_adj_win (float): Restriction for the mz value of a Peak.
+        rt_adj_win (float): Restriction for the retention_time value of a Peak.
+        master_spectrum (Spectrum): The Spectrum with the highest number of peaks from all samples (Master Data).
+        test_spectrum (Spectrum): A spectrum that has peaks, except the master spectrum (Test Data).
+    Returns
+        (Tuple[NDArray, NDArray]): The retention time values of the Master Data and the Test Data peak of each pair.
+    """
+    master_mz, master_rt = _peak_arrays(master_spectrum)
+    test_mz, test_rt = _peak_arrays(test_spectrum)
+    master_index, test_index = _pair_indexes(
+        master_mz, master_rt, test_mz, test_rt, mz_adj_win, rt_adj_win
+    )
+    return master_rt[master_index], test_rt[test_index]
+
+
+def estimate_coarse_rt_alignment(
+    master_spectrum: Spectrum,
+    test_spectrum: Spectrum,
+    max_shift: float,
+    max_scale_deviation: float = MAX_SCALE_DEVIATION,
+) -> Tuple[float, float]:
+    """
+    Estimates the global retention time drift of a Test Data spectrum as master RT = scale * test RT + shift, by
+    cross-correlating its total ion chromatogram with the Master Data's. Both chromatograms are interpolated on a
+    common retention time grid (one master scan interval apart, at most MAX_TIC_POINTS points), and for every candidate
+    scale the correlation at all shifts is computed at once with the FFT. Consecutive candidate scales stretch the test
+    run by one grid step, so no scale between them can move a chromatographic peak further. The best shift is refined
+    between grid points with a parabola through the correlation peak.
+    Args
+        master_spectrum (Spectrum): The Spectrum with the highest number of peaks from all samples (Master Data).
+        test_spectrum (Spectrum): The spectrum whose drift is estimated (Test Data).
+        max_shift (float): The largest shift searched, in retention time units.
+        max_scale_deviation (float): The largest relative deviation of the scale from 1 searched.
+    Returns
+        (Tuple[float, float]): The scale and the shift, (1.0, 0.0) when a chromatogram has less than 3 points or the
+                               best correlation is below MIN_COARSE_CORRELATION.
+    """
+    master_rt, master_tic = total_ion_chromatogram(master_spectrum)
+    test_rt, test_tic = total_ion_chromatogram(test_spectrum)
+    if master_rt.size < 3 or test_rt.size < 3:
+        return 1.0, 0.0
+
+    scale_bounds = np_array([1 - max_scale_deviation, 1 + max_scale_deviation])
+    start = min(master_rt[0], float((scale_bounds * test_rt[0]).min()))
+    stop = max(master_rt[-1], float((scale_bounds * test_rt[-1]).max()))
+    step = max(float(np_median(np_diff(master_rt))), (stop - start) / MAX_TIC_POINTS)
+    if not step > 0:
+        return 1.0, 0.0
+    test_span = max(abs(test_rt[0]), abs(test_rt[-1]))
+    scale_steps = min(
+        int(np_ceil(max_scale_deviation * test_span / step)), MAX_SCALE_COUNT // 2
+    )
+    scales = 1 + max_scale_deviation * np_linspace(-1, 1, 2 * scale_steps + 1)
+    point_count = int(np_ceil((stop - start) / step)) + 1
+    grid = start + step * np_arange(point_count)
+    max_lag = min(int(np_ceil(max_shift / step)), point_count - 1)
+    lags = np_arange(-max_lag, max_lag + 1)
+    size = next_fast_len(2 * point_count)
+
+    master_signal = _standardized_chromatogram(master_rt, master_tic, grid)
+    master_fft = rfft(master_signal, size)
+    best_score, best_scale, best_shift = -np_inf, 1.0, 0.0
+    for scale in scales:
+        test_signal = _standardized_chromatogram(scale * test_rt, test_tic, grid)
+        correlation = irfft(master_fft * rfft(test_signal, size).conj(), size)[
+            lags % size
+        ]
+        peak = int(np_argmax(correlation))
+        if correlation[peak] <= best_score:
+            continue
+        offset = 0.0
+        if 0 < peak < lags.size - 1:
+            left, middle, right = correlation[peak - 1 : peak + 2]
+            curvature = left - 2 * middle + right
+            if curvature < 0:
+                offset = 0.5 * (left - right) / curvature
+        best_score, best_scale, best_shift = (
+            float(correlation[peak]),
+            float(scale),
+            float((lags[peak] + offset) * step),
+        )
+    if best_score < MIN_COARSE_CORRELATION:
+        LOGGER.warning(
+            f"The total ion chromatograms correlate at most {best_score:.2f}, skipping the coarse alignment."
+        )
+        return 1.0, 0.0
+    LOGGER.info(
+        f"Estimated a coarse retention time shift of {best_shift:.3f} with scale {best_scale:.4f} "
+        f"(correlation {best_score:.2f})."
+    )
+    return best_scale, best_shift
+
+
+def match_adaptive_peak_pairs(
+    mz_adj_win: float,
+    rt_adj_win: float,
+    master_spectrum: Spectrum,
+    test_spectrum: Spectrum,
+    scale: float,
+    shift: float,
+) -> Tuple[ndarray, ndarray, float]:
+    """
+    Finds the (Master Data peak, Test Data peak) pairs after a coarse alignment (see estimate_coarse_rt_alignment),
+    with a retention time window adapted to what the coarse alignment leaves: the test retention times are first
+    mapped with scale and shift, then the closest candidate of each Master Data peak within rt_adj_win gives the
+    residual drift, and the window becomes ADAPTIVE_WINDOW_FACTOR times its robust standard deviation (1.4826 times
+    the median absolute residual). The window is at least one master scan interval and at most rt_adj_win.
+    Args
+        mz_adj_win (float): Restriction for the mz value of a Peak pair.
+        rt_adj_win (float): The widest retention time window.
+        master_spectrum (Spectrum): The Spectrum with the highest number of peaks from all samples (Master Data).
+        test_spectrum (Spectrum): A spectrum that has peaks, except the master spectrum (Test Data).
+        scale (float): The coarse scale of the test retention time axis.
+        shift (float): The coarse shift of the test retention time axis.
+    Returns
+        (Tuple[NDArray, NDArray, float]): The retention time values (unmapped) of the Master Data and the Test Data
+                                          peak of each pair, and the retention time window used.
+    """
+    master_mz, master_rt = _peak_arrays(master_spectrum)
+    test_mz, test_rt = _peak_arrays(test_spectrum)
+    predicted_rt = scale * test_rt + shift
+    master_index, test_index = _pair_indexes(
+        master_mz, master_rt, test_mz, predicted_rt, mz_adj_win, rt_adj_win
+    )
+    residuals = np_abs(master_rt[master_index] - predicted_rt[test_index])
+
+    window = float(rt_adj_win)
+    if residuals.size:
+        closest = np_full(master_rt.size, np_inf)
+        np_minimum.at(closest, master_index, residuals)
+        scan_intervals = np_diff(np_unique(master_rt))
+        min_window = float(np_median(scan_intervals)) if scan_intervals.size else 0.0
+        spread = 1.4826 * float(np_median(closest[np_isfinite(closest)]))
+        window = min(max(ADAPTIVE_WINDOW_FACTOR * spread, min_window), window)
+    keep = residuals <= window
+    return master_rt[master_index[keep]], test_rt[test_index[keep]], window
+
+
+def fit_rt_correction(
+    mz_adj_win: float,
+    rt_adj_win: float,
+    master_spectrum: Spectrum,
+    test_spectrum: Spectrum,
+    frac: float = 0.3,
+    knot_count: int = 100,
+    coarse_alignment: bool = False,
+) -> RetentionTimeCorrection:
+    """
+    Fits the retention time drift of a Test Data spectrum relative to the Master Data with one LOESS regression.
+    With coarse_alignment, the global shift and scale are estimated first from the total ion chromatograms, and
+    the pairs are matched in a narrower adaptive window around the coarsely aligned retention times (see
+    match_adaptive_peak_pairs), so fewer wrong pairs reach the regression. rt_adj_win then only bounds the drift.
+    Args
+        mz_adj_win (float): Restriction for the mz value of a Peak pair.
+        rt_adj_win (float): Restriction for the retention_time value of a Peak pair.
+        master_spectrum (Spectrum): The Spectrum with the highest number of peaks from all samples (Master Data).
+        test_spectrum (Spectrum): The spectrum whose drift is estimated (Test Data).
+        frac (float): The fraction of the matched pairs used when estimating each LOESS value.
+        knot_count (int): The maximum number of knots in the drift lookup table.
+        coarse_alignment (bool): Pre-align the spectrums by TIC cross-correlation (see estimate_coarse_rt_alignment).
+    Returns
+        (RetentionTimeCorrection): The drift model of the Test Data spectrum.
+    """
+    scale, shift, window = 1.0, 0.0, float(rt_adj_win)
+    if coarse_alignment:
+        scale, shift = estimate_coarse_rt_alignment(
+            master_spectrum=master_spectrum,
+            test_spectrum=test_spectrum,
+            max_shift=rt_adj_win,
+        )
+        master_rt, test_rt, window = match_adaptive_peak_pairs(
+            mz_adj_win=mz_adj_win,
+            rt_adj_win=rt_adj_win,
+            master_spectrum=master_spectrum,
+            test_spectrum=test_spectrum,
+            scale=scale,
+            shift=shift,
+        )
+    else:
+        master_rt, test_rt = match_peak_pairs(
+            mz_adj_win=mz_adj_win,
+            rt_adj_win=rt_adj_win,
+            master_spectrum=master_spectrum,
+            test_spectrum=test_spectrum,
+        )
+    drift = master_rt - test_rt
+    pair_count = int(drift.size)
+
+    if pair_count < 3:
+        if coarse_alignment:
+            LOGGER.warning(
+                f"Only {pair_count} peak pairs found, using the coarse retention time alignment."
+            )
+            _, peak_rt = _peak_arrays(test_spectrum)
+            rt_knots = (
+                np_array([peak_rt.min(), peak_rt.max()])
+                if peak_rt.size
+                else np_array([])
+            )
+            drift_knots = (scale - 1) * rt_knots + shift
+        else:
+            LOGGER.warning(
+                f"Only {pair_count} peak pairs found, using a constant retention time drift."
+            )
+            rt_knots, drift_knots = [], []
+            if pair_count:
+                rt_knots = [float(test_rt.min()), float(test_rt.max())]
+                drift_knots = [float(np_median(drift))] * 2
+        return RetentionTimeCorrection(
+            rt_knots=rt_knots,
+            drift_knots=drift_knots,
+            pair_count=pair_count,
+            master_spectrum_id=master_spectrum.spectrum_id,
+            rt_scale=scale,
+            rt_shift=shift,
+            rt_window=window,
+        )
+
+    fitted = lowess(drift, test_rt, frac=frac, return_sorted=True)
+    fitted = fitted[np_isfinite(fitted[:, 1])]
+    rt_knots, first_index = np_unique(fitted[:, 0], return_index=True)
+    drift_knots = fitted[first_index, 1]
+
+    if rt_knots.size > knot_count:
+        grid = np_linspace(rt_knots[0], rt_knots[-1], knot_count)
+        drift_knots = np_interp(grid, rt_knots, drift_knots)
+        rt_knots = grid
+
+    LOGGER.info(
+        f"Fitted retention time drift on {pair_count} peak pairs (window {window:.3g}) with {rt_knots.size} knots."
+    )
+    return RetentionTimeCorrection(
+        rt_knots=rt_knots,
+        drift_knots=drift_knots,
+        pair_count=pair_count,
+        master_spectrum_id=master_spectrum.spectrum_id,
+        rt_scale=scale,
+        rt_shift=shift,
+        rt_window=window,
+    )
+
+
+def apply_rt_correction(
+    peaks: List[Peak], rt_correction: RetentionTimeCorrection
+) -> List[Peak]:
+    """
+    Maps the retention_time values of the given peaks onto the master spectrum using the drift model.
+    Args
+        peaks (List[Peak]): The peaks of a Test Data spectrum.
+        rt_correction (RetentionTimeCorrection): The drift model of the same spectrum.
+    Returns
+        (List[Peak]): The list of peaks with corrected retention_time values.
+    """
+    corrected_rt = rt_correction.correct(
+        np_array([peak.retention_time for peak in peaks], dtype=float)
+    )
+    return [
+        Peak(
+            scan_id=peak.scan_id,
+            peak_index=peak.peak_index,
+            retention_time=float(corrected_rt[i]),
+            intensity=peak.intensity,
+            mz=peak.mz,
+            sample_id=peak.sample_id,
+        )
+        for i, peak in enumerate(peaks)
+    ]
+
+
+def _peak_arrays(spectrum: Spectrum) -> Tuple[ndarray, ndarray]:
+    """
+    Returns the m/z and the retention time values of the spectrum's peaks.
+    """
+    return (
+        np_array([peak.mz for peak in spectrum.peaks], dtype=float),
+        np_array([peak.retention_time for peak in spectrum.peaks], dtype=float),
+    )
+
+
+def _peak_fingerprint(spectrum: Spectrum) -> Hashable:
+    """
+    Returns a digest of the m/z, retention time and intensity values of the spectrum's peaks, which changes when
+    the peaks are detected again with other results.
+    """
+    digest = hashlib.sha1()
+    for values in (
+        *_peak_arrays(spectrum),
+        np_array([peak.intensity for peak in spectrum.peaks], dtype=float),
+    ):
+        digest.update(values.tobytes())
+    return len(spectrum.peaks), digest.hexdigest()
+
+
+def _pair_indexes(
+    master_mz: ndarray,
+    master_rt: ndarray,
+    test_mz: ndarray,
+    test_rt: ndarray,
+    mz_adj_win: float,
+    rt_adj_win: float,
+) -> Tuple[ndarray, ndarray]:
+    """
+    Returns the master and test positions of every pair within the m/z and RT windows, see match_peak_pairs.
+    """
+    order = np_argsort(test_mz, kind="stable")
+    sorted_mz = test_mz[order]
+
+    # the search window is widened slightly so rounding never drops a pair, the exact check happens below
+    search_win = mz_adj_win * (1 + 1e-9) + 1e-12
+    lower = sorted_mz.searchsorted(master_mz - search_win, side="left")
+    upper = sorted_mz.searchsorted(master_mz + search_win, side="right")
+    counts = upper - lower
+
+    master_index = np_repeat(np_arange(master_mz.size), counts)
+    offsets = np_arange(counts.sum()) - np_repeat(np_cumsum(counts) - counts, counts)
+    test_index = order[np_repeat(lower, counts) + offsets]
+
+    keep = (np_abs(master_mz[master_index] - test_mz[test_index]) <= mz_adj_win) & (
+        np_abs(master_rt[master_index] - test_rt[test_index]) <= rt_adj_win
+    )
+    return master_index[keep], test_index[keep]
+
+
+def _standardized_chromatogram(
+    retention_times: ndarray, intensities: ndarray, grid: ndarray
+) -> ndarray:
+    """
+    Removes the background of the chromatogram (its median, clipped at zero), so the edges of the retention time
+    range do not dominate the correlation, interpolates it on the grid (zero outside its retention time range),
+    smooths it over one grid step, and scales it to zero mean and unit norm, so that cross-correlation values are
+    comparable across scales.
+    """
+    foreground = np_maximum(intensities - np_median(intensities), 0.0)
+    values = gaussian_filter1d(
+        np_interp(grid, retention_times, foreground, left=0.0, right=0.0), 1.0
+    )
+    values -= values.mean()
+    norm = np_sqrt((values**2).sum())
+    return values / norm if norm > 0 else values
@@ -1,22 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+from numpy import ndarray
+from pandas import DataFrame
 from sklearn.cluster import DBSCAN
 from sklearn.preprocessing import StandardScaler
-from pandas import DataFrame
+
+EPS = 0.16
+MIN_SAMPLES = 2
 
 
-def apply_dbscan_clustering(peaks_df: DataFrame) -> DataFrame:
+def apply_dbscan_clustering(
+    peaks_df: DataFrame, workers: int = 1, eps: float = EPS
+) -> DataFrame:
     """
     Applies the DBSCAN classification algorithm.
+    With more than one worker the peaks are split into m/z partitions and clustered in a process pool,
+    see apply_partitioned_dbscan_clustering. The result is the same.
     Args
         peaks_df (DataFrame): A pandas DataFrame with peak data. Columns: "RT", "mz", "intensity"
                               Each row represents one peak.
+        workers (int): The number of worker processes.
+        eps (float): The DBSCAN neighborhood radius, in standardized m/z units.
     Returns
         (DataFrame): A pandas DataFrame with columns: "RT", "mz", "intensity", "label".
                      Each row represents one peak and its' corresponding label.
                      Peaks that were assigned the same label most likely belong to the same compound.
     """
+    if workers > 1:
+        return apply_partitioned_dbscan_clustering(peaks_df, workers=workers, eps=eps)
     X = StandardScaler().fit_transform(peaks_df[["mz"]])
-    dbscan = DBSCAN(eps=0.16, min_samples=2)
+    dbscan = DBSCAN(eps=eps, min_samples=MIN_SAMPLES)
 
     peaks_df["label"] = dbscan.fit_predict(X)
     peaks_df = peaks_df[peaks_df["label"] != -1]
     return peaks_df
+
+
+def apply_partitioned_dbscan_clustering(
+    peaks_df: DataFrame, workers: int = 2, chunks_per_worker: int = 4, eps: float = EPS
+) -> DataFrame:
+    """
+    Applies the same DBSCAN clustering as apply_dbscan_clustering, partitioned along m/z.
+    Clustering runs on the standardized m/z only, so two peaks further apart than eps can only share a cluster
+    through a chain of peaks bridging the gap: at every gap wider than eps in the sorted m/z values the table
+    splits into independent partitions. Partitions are grouped into chunks of similar size, clustered in a process
+    pool, and the local labels are stitched into global ones in the order of each cluster's first core peak,
+    which is the order in which DBSCAN numbers the clusters of the whole table, so the labels are identical.
+    Args
+        peaks_df (DataFrame): A pandas DataFrame with peak data. Columns: "RT", "mz", "intensity"
+        workers (int): The number of worker processes.
+        chunks_per_worker (int): The number of chunks per worker, more chunks balance the load better.
+        eps (float): The DBSCAN neighborhood radius, in standardized m/z units.
+    Returns
+        (DataFrame): See apply_dbscan_clustering.
+    """
+    X = StandardScaler().fit_transform(peaks_df[["mz"]])[:, 0]
+    chunks = partition_chunks(
+        X, eps=eps, chunk_count=max(workers * chunks_per_worker, 1)
+    )
+    labels = np.full(X.size, -1, dtype=np.int64)
+    if chunks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _cluster_partition,
+                    [X[indexes] for indexes in chunks],
+                    [eps] * len(chunks),
+                )
+            )
+        labels = stitch_labels(X.size, chunks, results)
+
+    peaks_df["label"] = labels
+    peaks_df = peaks_df[peaks_df["label"] != -1]
+    return peaks_df
+
+
+def partition_chunks(values: ndarray, eps: float, chunk_count: int) -> List[ndarray]:
+    """
+    Splits the 1D values at every gap wider than eps in their sorted order, and groups consecutive partitions
+    into at most chunk_count chunks of similar size. Partitions are never split.
+    Returns:
+        (List[NDArray]): The ascending row indexes of each chunk.
+    """
+    if values.size == 0:
+        return []
+    order = np.argsort(values, kind="stable")
+    gaps = np.flatnonzero(np.diff(values[order]) > eps) + 1
+    bounds = np.concatenate(([0], gaps, [values.size]))
+
+    target = values.size / chunk_count
+    chunk_bounds = [0]
+    for bound in bounds[1:-1]:
+        if bound - chunk_bounds[-1] >= target:
+            chunk_bounds.append(int(bound))
+    chunk_bounds.append(values.size)
+    return [
+        np.sort(order[start:stop])
+        for start, stop in zip(chunk_bounds[:-1], chunk_bounds[1:])
+    ]
+
+
+def stitch_labels(
+    size: int, chunks: List[ndarray], results: List[Tuple[ndarray, ndarray]]
+) -> ndarray:
+    """
+    Maps the local labels of each chunk to global ones, numbering the clusters by their first core sample in the
+    whole table like DBSCAN does.
+    Args:
+        size (int): The number of rows of the table.
+        chunks (List[NDArray]): The ascending row indexes of each chunk.
+        results (List[Tuple[NDArray, NDArray]]): The local labels and core sample indexes of each chunk.
+    Returns:
+        (NDArray): The global label of every row, -1 for noise.
+    """
+    first_cores, offsets = [], [0]
+    for indexes, (local_labels, core_indexes) in zip(chunks, results):
+        cluster_count = int(local_labels.max()) + 1 if local_labels.size else 0
+        first_core = np.full(cluster_count, size, dtype=np.int64)
+        np.minimum.at(first_core, local_labels[core_indexes], indexes[core_indexes])
+        first_cores.append(first_core)
+        offsets.append(offsets[-1] + cluster_count)
+
+    first_cores = np.concatenate(first_cores)
+    global_ids = np.empty(first_cores.size, dtype=np.int64)
+    global_ids[np.argsort(first_cores, kind="stable")] = np.arange(first_cores.size)
+
+    labels = np.full(size, -1, dtype=np.int64)
+    for offset, indexes, (local_labels, _) in zip(offsets, chunks, results):
+        clustered = local_labels >= 0
+        labels[indexes[clustered]] = global_ids[offset + local_labels[clustered]]
+    return labels
+
+
+def _cluster_partition(values: ndarray, eps: float) -> Tuple[ndarray, ndarray]:
+    dbscan = DBSCAN(eps=eps, min_samples=MIN_SAMPLES).fit(values.reshape(-1, 1))
+    return dbscan.labels_.astype(np.int64), dbscan.core_sample_indices_
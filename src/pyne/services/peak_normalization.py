@@ -2,21 +2,24 @@ from logging import getLogger
 from typing import List
 
 from numpy import array as np_array
+from numpy import float64
+from numpy.typing import DTypeLike
 from pyne.models.peak import Peak
 from sklearn.preprocessing import quantile_transform
 
 LOGGER = getLogger(__name__)
 
 
-def normalize_peaks(peaks: List[Peak]) -> List[Peak]:
+def normalize_peaks(peaks: List[Peak], dtype: DTypeLike = float64) -> List[Peak]:
     """
     Uses the quantile normalization technique to normalize the peaks' intensity values.
     Args:
         peaks (List[Peak]): A list of peaks that will be normalized.
+        dtype (DTypeLike): The dtype the intensity values are normalized in.
     Returns:
         List[Peak]: A list of peaks that normalization was performed on.
     """
-    x_values = np_array([peak.intensity for peak in peaks]).reshape(-1, 1)
+    x_values = np_array([peak.intensity for peak in peaks], dtype=dtype).reshape(-1, 1)
     normalized_values = quantile_transform(x_values)
     normalized_values = np_array(normalized_values).flatten()
     normalized_peaks = []
@@ -26,8 +29,9 @@ def normalize_peaks(peaks: List[Peak]) -> List[Peak]:
             scan_id=peak.scan_id,
             peak_index=peak.peak_index,
             retention_time=peak.retention_time,
-            intensity=normalized_values[i],
+            intensity=float(normalized_values[i]),
             mz=peak.mz,
+            sample_id=peak.sample_id,
         )
 
         normalized_peaks.append(updated_peak)
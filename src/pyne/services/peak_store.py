@@ -0,0 +1,50 @@
+from typing import List
+
+import pandas as pd
+from pandas import DataFrame
+from pyne.models.peak import Peak
+
+PEAK_COLUMNS = ["scan_id", "peak_index", "RT", "intensity", "mz"]
+
+
+def write_peaks(peaks: List[Peak], path: str):
+    """
+    Writes the detected peaks of one sample to a .csv file, so that the cohort stages can be rerun without
+    repeating the per-sample stages.
+    Args:
+        peaks (List[Peak]): The peaks to store.
+        path (str): The destination .csv file.
+    """
+    DataFrame(
+        {
+            "scan_id": [peak.scan_id for peak in peaks],
+            "peak_index": [peak.peak_index for peak in peaks],
+            "RT": [peak.retention_time for peak in peaks],
+            "intensity": [peak.intensity for peak in peaks],
+            "mz": [peak.mz for peak in peaks],
+        },
+        columns=PEAK_COLUMNS,
+    ).to_csv(path, index=False)
+
+
+def read_peaks(path: str, sample_id: str) -> List[Peak]:
+    """
+    Reads the peaks written by write_peaks.
+    Args:
+        path (str): The .csv file to read.
+        sample_id (str): The ID of the sample the peaks belong to.
+    Returns:
+        (List[Peak]): The stored peaks.
+    """
+    peaks_df = pd.read_csv(path, dtype={"scan_id": str})
+    return [
+        Peak(
+            scan_id=row.scan_id,
+            peak_index=int(row.peak_index),
+            retention_time=float(row.RT),
+            intensity=float(row.intensity),
+            mz=float(row.mz),
+            sample_id=sample_id,
+        )
+        for row in peaks_df.itertuples(index=False)
+    ]
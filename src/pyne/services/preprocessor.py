@@ -1,60 +1,313 @@
 import logging
-from typing import List
+from typing import List, Optional
 
+from numpy import float64
+from numpy import fromiter as np_fromiter
+from numpy.typing import DTypeLike
 from pandas import DataFrame
 from pyne.models.peak import Peak
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.region import RegionOfInterest
+from pyne.models.spectrum import Spectrum
 
+from .baseline_correction import get_baseline_engine, get_matrix_baseline_engine
 from .deconvolution import deconvolve_peaks
+from .feature_detection import mass_trace_peaks
+from .feature_grouping import collapse_feature_groups, group_features
+from .mz_grid import resample_spectrum
 from .peak_alignment import align_peaks
 from .peak_clustering import apply_dbscan_clustering
 from .peak_normalization import normalize_peaks
-from .spectrum_reader import read_spectra
+from .profiling import StageProfiler
+from .spectrum_reader import iter_spectra
 
 logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
 
 
-def preprocess_data(source_files: List[str]) -> DataFrame:
+def preprocess_data(
+    source_files: List[str],
+    prefetch: int = 2,
+    max_buffered_bytes: Optional[int] = None,
+    read_workers: int = 1,
+    sparsify_threshold: Optional[float] = None,
+    scan_workers: int = 1,
+    intensity_dtype: DTypeLike = float64,
+    region: Optional[RegionOfInterest] = None,
+    mass_traces: bool = False,
+    config: Optional[PipelineConfig] = None,
+    cluster_workers: int = 1,
+    coarse_rt_alignment: bool = False,
+    feature_grouping: bool = False,
+    profile_dir: Optional[str] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> DataFrame:
     """
     Performs the preprocessing steps.
+    The source files are read in the background while the already read spectrums are processed.
+    Each stage is timed, and in profiling mode (profile_dir) profiled as well, see StageProfiler.
     Args:
         source_files (List[str]): A list of .csv files to perform data preprocessing on.
+        prefetch (int): The number of spectrums read ahead of the one being processed (0 disables prefetching).
+        max_buffered_bytes (Optional[int]): Memory ceiling for the spectrums read ahead.
+        read_workers (int): The number of source files read (and decompressed) at the same time when prefetching.
+                            These are threads: they overlap the file reads and the decompression, not the parsing.
+                            The source files may be gzip, zstd, bz2 or xz compressed, see read_spectra.
+        sparsify_threshold (Optional[float]): When set, scan regions at or below this raw intensity are dropped
+                                              at ingest, and the later stages run on the remaining segments only.
+        scan_workers (int): The number of threads each spectrum's scan-level stages are split across.
+        intensity_dtype (DTypeLike): The dtype intensities are stored and processed in, from ingest through
+                                     normalization. float32 saves about a quarter of the scan memory, since
+                                     the m/z values stay float64.
+        region (Optional[RegionOfInterest]): For targeted runs: only the scans inside its retention time windows
+                                             are parsed, and only its m/z ranges are processed.
+        mass_traces (bool): Link the peaks of consecutive scans into mass traces and keep one peak per trace
+                            (see mass_trace_peaks), so the cohort-wide stages run on far fewer items.
+        config (Optional[PipelineConfig]): The parameters of the per-sample stages, e.g. the baseline engine.
+        cluster_workers (int): The number of processes clustering and deconvolution are split across, by m/z
+                               partitions (see apply_partitioned_dbscan_clustering). The result is the same.
+        coarse_rt_alignment (bool): Pre-align each sample on the master sample by cross-correlating their total ion
+                                    chromatograms, then match the peak pairs in a narrower adaptive retention time
+                                    window (see fit_rt_correction).
+        feature_grouping (bool): Collapse the isotopologues and adducts of the same compound into one feature
+                                 (see group_features), adding "group" and "group_size" columns.
+        profile_dir (Optional[str]): When set, per-stage .pstats and collapsed stack files are written here.
+                                     Prefetching is turned off in profiling mode, so that reading is profiled too.
+        profiler (Optional[StageProfiler]): Collects the stage timings, a new one is created when not given.
     Returns:
         DataFrame: A pandas DataFrame containing RT, mz, and intensity columns.
     """
-    spectrum_list = read_spectra(source_files=source_files)
-    for spectrum in spectrum_list:
-        spectrum.align_baselines(deg=6)
-        spectrum.filter_noise(sigma=0.7)
-        spectrum.detect_peaks(thres=7000000, min_dist=60)
+    if profiler is None:
+        profiler = StageProfiler(output_dir=profile_dir)
+    clustered_peaks = preprocess_peaks(
+        source_files=source_files,
+        prefetch=prefetch,
+        max_buffered_bytes=max_buffered_bytes,
+        read_workers=read_workers,
+        sparsify_threshold=sparsify_threshold,
+        scan_workers=scan_workers,
+        intensity_dtype=intensity_dtype,
+        region=region,
+        mass_traces=mass_traces,
+        config=config,
+        cluster_workers=cluster_workers,
+        coarse_rt_alignment=coarse_rt_alignment,
+        profiler=profiler,
+    )
+    with profiler.stage("deconvolution"):
+        features = deconvolve_peaks(peaks_df=clustered_peaks, workers=cluster_workers)
+    if feature_grouping:
+        with profiler.stage("feature_grouping"):
+            features = collapse_feature_groups(group_features(features))
+    profiler.dump()
+    return features
+
+
+def preprocess_peaks(
+    source_files: List[str],
+    prefetch: int = 2,
+    max_buffered_bytes: Optional[int] = None,
+    read_workers: int = 1,
+    sparsify_threshold: Optional[float] = None,
+    scan_workers: int = 1,
+    intensity_dtype: DTypeLike = float64,
+    region: Optional[RegionOfInterest] = None,
+    mass_traces: bool = False,
+    config: Optional[PipelineConfig] = None,
+    cluster_workers: int = 1,
+    coarse_rt_alignment: bool = False,
+    profiler: Optional[StageProfiler] = None,
+) -> DataFrame:
+    """
+    Performs the preprocessing steps up to (and including) clustering, keeping every peak and its sample.
+    The result can be deconvolved (deconvolve_peaks) or pivoted into a wide feature matrix (build_feature_matrix).
+    Args:
+        See preprocess_data.
+    Returns:
+        DataFrame: A pandas DataFrame containing sample, RT, mz, intensity and label columns.
+    """
+    if profiler is None:
+        profiler = StageProfiler()
+    if profiler.enabled:
+        prefetch = 0
+
+    spectrum_list = list()
+    spectrums = iter_spectra(
+        source_files=source_files,
+        prefetch=prefetch,
+        max_buffered_bytes=max_buffered_bytes,
+        sparsify_threshold=sparsify_threshold,
+        intensity_dtype=intensity_dtype,
+        region=region,
+        read_workers=read_workers,
+    )
+    while True:
+        with profiler.stage("read"):
+            spectrum = next(spectrums, None)
+        if spectrum is None:
+            break
+        spectrum.workers = scan_workers
+        spectrum_list.append(
+            detect_spectrum_peaks(
+                spectrum=spectrum,
+                mass_traces=mass_traces,
+                config=config,
+                profiler=profiler,
+            )
+        )
 
     LOGGER.info(
         "Finished baseline alignment, noise filtering and peak detection for each spectrum."
     )
-    aligned_peaks = align_peaks(spectrum_list=spectrum_list)
-    normalized_peaks = normalize_peaks(peaks=aligned_peaks)
+    return cluster_cohort_peaks(
+        spectrum_list=spectrum_list,
+        intensity_dtype=intensity_dtype,
+        cluster_workers=cluster_workers,
+        coarse_rt_alignment=coarse_rt_alignment,
+        profiler=profiler,
+    )
+
+
+def detect_spectrum_peaks(
+    spectrum: Spectrum,
+    mass_traces: bool = False,
+    config: Optional[PipelineConfig] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> Spectrum:
+    """
+    Performs the per-sample preprocessing steps: baseline alignment, noise filtering, peak detection
+    and optionally feature detection along the retention time axis.
+    Args:
+        spectrum (Spectrum): The spectrum to process, it is modified in place.
+        mass_traces (bool): Replace the peaks with one peak per mass trace, see mass_trace_peaks.
+        config (Optional[PipelineConfig]): The stage parameters, the defaults when not given.
+        profiler (Optional[StageProfiler]): Collects the stage timings.
+    Returns:
+        Spectrum: The same spectrum, with its peaks detected.
+    """
+    if profiler is None:
+        profiler = StageProfiler()
+    if config is None:
+        config = PipelineConfig()
+    if config.qc_prefilter:
+        with profiler.stage("qc_prefilter"):
+            report = spectrum.prefilter_scans(
+                thres=config.peak_threshold,
+                saturation_intensity=config.saturation_intensity,
+            )
+        LOGGER.info(
+            f"QC prefilter of {spectrum.sample_id}: skipped {report.skipped_scans} of {report.scan_count} scans "
+            f"({report.skipped_fraction:.1%} of the points), {int(report.malformed.sum())} malformed, "
+            f"{int(report.saturated.sum())} saturated."
+        )
+    if config.mz_grid_resolution is not None:
+        detect_gridded_peaks(spectrum=spectrum, config=config, profiler=profiler)
+    else:
+        baseline = get_baseline_engine(config.baseline_engine, **config.baseline_params)
+        with profiler.stage("baseline_alignment"):
+            spectrum.align_baselines(baseline=baseline)
+        with profiler.stage("noise_filtering"):
+            spectrum.filter_noise(sigma=config.noise_sigma)
+        with profiler.stage("peak_detection"):
+            spectrum.detect_peaks(
+                thres=config.peak_threshold, min_dist=config.peak_min_dist
+            )
+    if mass_traces:
+        with profiler.stage("feature_detection"):
+            spectrum.peaks = mass_trace_peaks(
+                spectrum.peaks,
+                scan_retention_times=[scan.retention_time for scan in spectrum.scans],
+            )
+            spectrum.peak_count = len(spectrum.peaks)
+    return spectrum
+
+
+def detect_gridded_peaks(
+    spectrum: Spectrum, config: PipelineConfig, profiler: Optional[StageProfiler] = None
+) -> Spectrum:
+    """
+    Runs baseline alignment, noise filtering and peak detection as whole-matrix operations, on the spectrum
+    resampled onto the m/z grid of config.mz_grid_resolution. The peaks (with their m/z on the grid) are stored
+    on the spectrum, its scans are left untouched. The point-based parameters (e.g. peak_min_dist) count grid points.
+    """
+    if profiler is None:
+        profiler = StageProfiler()
+    with profiler.stage("grid_resampling"):
+        gridded = resample_spectrum(
+            spectrum, resolution=config.mz_grid_resolution, sparse=config.sparse_grid
+        )
+    baseline = get_matrix_baseline_engine(
+        config.baseline_engine, **config.baseline_params
+    )
+    with profiler.stage("baseline_alignment"):
+        gridded.align_baselines(baseline=baseline)
+    with profiler.stage("noise_filtering"):
+        gridded.filter_noise(sigma=config.noise_sigma)
+    with profiler.stage("peak_detection"):
+        spectrum.peaks = gridded.detect_peaks(
+            thres=config.peak_threshold, min_dist=config.peak_min_dist
+        )
+        spectrum.peak_count = len(spectrum.peaks)
+    return spectrum
 
-    peak_df = retrieve_feature_matrix(normalized_peaks)
-    clustered_peaks = apply_dbscan_clustering(peaks_df=peak_df)
-    return deconvolve_peaks(peaks_df=clustered_peaks)
+
+def cluster_cohort_peaks(
+    spectrum_list: List[Spectrum],
+    intensity_dtype: DTypeLike = float64,
+    cluster_workers: int = 1,
+    coarse_rt_alignment: bool = False,
+    profiler: Optional[StageProfiler] = None,
+) -> DataFrame:
+    """
+    Performs the cohort-wide preprocessing steps on spectrums whose peaks are already detected:
+    peak alignment, normalization and clustering.
+    Args:
+        spectrum_list (List[Spectrum]): The spectrums of the cohort.
+        intensity_dtype (DTypeLike): The dtype the intensities are normalized in.
+        cluster_workers (int): The number of processes clustering is split across.
+        coarse_rt_alignment (bool): Pre-align the spectrums by TIC cross-correlation, see align_peaks.
+        profiler (Optional[StageProfiler]): Collects the stage timings.
+    Returns:
+        DataFrame: A pandas DataFrame containing sample, RT, mz, intensity and label columns.
+    """
+    if profiler is None:
+        profiler = StageProfiler()
+    with profiler.stage("peak_alignment"):
+        aligned_peaks = align_peaks(
+            spectrum_list=spectrum_list, coarse_alignment=coarse_rt_alignment
+        )
+    with profiler.stage("normalization"):
+        normalized_peaks = normalize_peaks(peaks=aligned_peaks, dtype=intensity_dtype)
+    with profiler.stage("feature_table"):
+        peak_df = retrieve_feature_matrix(normalized_peaks)
+    with profiler.stage("clustering"):
+        clustered_peaks = apply_dbscan_clustering(
+            peaks_df=peak_df, workers=cluster_workers
+        )
+    return clustered_peaks
 
 
 def retrieve_feature_matrix(peaks: List[Peak]) -> DataFrame:
     """
     Convert preprocessed data (peaks we get after the preprocessing steps) to a feature matrix.
-    The feature matrix is in the form of a pandas Dataframe.
+    The feature matrix is in the form of a pandas Dataframe, with one row per peak (long format).
 
     Args:
         peaks (List[Peak]): A list of peak objects which will transformed to a DataFrame.
 
     Returns:
-        DataFrame: A pandas DataFrame containing RT, mz, and intensity columns.
+        DataFrame: A pandas DataFrame containing sample, RT, mz, and intensity columns.
     """
-    matrix = {"RT": [], "mz": [], "intensity": []}
-
-    for peak in peaks:
-        matrix["RT"].append(peak.retention_time)
-        matrix["mz"].append(peak.mz)
-        matrix["intensity"].append(peak.intensity)
-
-    return DataFrame(matrix)
+    count = len(peaks)
+    return DataFrame(
+        {
+            "sample": [peak.sample_id for peak in peaks],
+            "RT": np_fromiter(
+                (peak.retention_time for peak in peaks), dtype=float, count=count
+            ),
+            "mz": np_fromiter((peak.mz for peak in peaks), dtype=float, count=count),
+            "intensity": np_fromiter(
+                (peak.intensity for peak in peaks), dtype=float, count=count
+            ),
+        }
+    )
@@ -0,0 +1,127 @@
+import json
+import sys
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from cProfile import Profile
+from logging import getLogger
+from pathlib import Path
+from threading import Event, Thread, get_ident
+from time import perf_counter
+from typing import Dict, Iterator, Optional
+
+LOGGER = getLogger(__name__)
+
+
+class StageProfiler:
+    """
+    Measures the wall time of each pipeline stage. When an output directory is given, every stage is also
+    profiled with cProfile and with a stack sampler, and the results are written by dump():
+        - <stage>.pstats: cProfile statistics, for pstats / snakeviz.
+        - <stage>.collapsed: sampled call stacks in the collapsed format ("frame;frame;frame count") used by
+          py-spy and flamegraph.pl, for flame graphs.
+        - timings.json: the wall time of each stage in seconds.
+    A stage entered several times (e.g. once per spectrum) is accumulated under the same name.
+    Only the thread that enters a stage is profiled.
+
+    Attributes:
+        output_dir (Optional[Path]): The directory the profiles are written to. None disables profiling.
+        sample_interval (float): The time between two stack samples in seconds.
+        timings (Dict[str, float]): The accumulated wall time of each stage in seconds.
+    """
+
+    def __init__(
+        self, output_dir: Optional[str] = None, sample_interval: float = 0.005
+    ):
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.sample_interval = sample_interval
+        self.timings: Dict[str, float] = defaultdict(float)
+        self._profiles: Dict[str, Profile] = {}
+        self._stacks: Dict[str, Counter] = defaultdict(Counter)
+
+    @property
+    def enabled(self) -> bool:
+        return self.output_dir is not None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Context manager timing (and when enabled, profiling) the enclosed code as the given stage.
+
+        Args:
+            name (str): The name of the stage, used for the output file names.
+        """
+        if not self.enabled:
+            start = perf_counter()
+            try:
+                yield
+            finally:
+                self.timings[name] += perf_counter() - start
+            return
+
+        profile = self._profiles.setdefault(name, Profile())
+        sampler = _StackSampler(
+            thread_id=get_ident(),
+            interval=self.sample_interval,
+            stacks=self._stacks[name],
+        )
+        sampler.start()
+        start = perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.timings[name] += perf_counter() - start
+            sampler.stop()
+
+    def dump(self):
+        """
+        Logs the stage timings and, when profiling is enabled, writes the profiles to the output directory.
+        """
+        for name, seconds in self.timings.items():
+            LOGGER.info(f"Stage {name} took {seconds:.3f} s.")
+        if not self.enabled:
+            return
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for name, profile in self._profiles.items():
+            profile.dump_stats(str(self.output_dir / f"{name}.pstats"))
+            with open(self.output_dir / f"{name}.collapsed", "w") as collapsed_file:
+                for stack, count in self._stacks[name].items():
+                    collapsed_file.write(f"{stack} {count}\n")
+        with open(self.output_dir / "timings.json", "w") as timings_file:
+            json.dump(dict(self.timings), timings_file, indent=2)
+        LOGGER.info(f"Wrote stage profiles to {self.output_dir}.")
+
+
+class _StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval, counting the collapsed stacks.
+    """
+
+    def __init__(self, thread_id: int, interval: float, stacks: Counter):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = stacks
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
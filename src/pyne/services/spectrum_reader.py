@@ -1,12 +1,32 @@
-from typing import List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Condition, Event, Thread
+from typing import Dict, Iterator, List, Optional
 
 import pandas as pd
+from numpy import float64
+from numpy.typing import DTypeLike
+from pyne.models.region import RegionOfInterest
 from pyne.models.spectrum import Spectrum
 
+from .compressed_io import open_source
 
-def read_spectra(source_files: List[str]) -> List[Spectrum]:
+_POLL_INTERVAL = 0.1
+
+
+def read_spectra(
+    source_files: List[str],
+    sparsify_threshold: Optional[float] = None,
+    sparsify_pad: int = 5,
+    intensity_dtype: DTypeLike = float64,
+    region: Optional[RegionOfInterest] = None,
+    read_workers: int = 1,
+) -> List[Spectrum]:
     """
-    Returns a Spectrum list from the given source files. The source files are .csv files.
+    Returns a Spectrum list from the given source files. The source files are .csv files, optionally gzip, zstd,
+    bz2 or xz compressed: the compression is detected from the file content and decompressed while parsing.
     The .csv files should have the following columns:
         - 'RT': Retention Time (float)
         - 'mzarray': List of mass-to-charge ratios (List[float] as str)
@@ -14,22 +34,249 @@ def read_spectra(source_files: List[str]) -> List[Spectrum]:
 
     Args:
         source_files (List[str]): A list of .csv files to perform data preprocessing on.
+        sparsify_threshold (Optional[float]): When set, only the scan segments above this intensity are kept
+                                              (see Spectrum.sparsify).
+        sparsify_pad (int): The number of points kept around each non-empty region.
+        intensity_dtype (DTypeLike): The dtype the scan intensities are stored in (float32 saves about a quarter of the
+                                     scan memory, m/z values stay float64).
+        region (Optional[RegionOfInterest]): When set, only the scans inside its retention time windows are parsed,
+                                             and their arrays are sliced to its m/z ranges.
+        read_workers (int): The number of files read (and decompressed) at the same time, by threads. Only the
+                            file reads and the decompression release the GIL, the .csv parsing (its list
+                            converters are Python code) runs one file at a time. More workers therefore only help
+                            when reading waits on slow storage, or on decompression with idle cores.
+    Raises:
+        ValueError: Several source files belong to the same sample (see check_sample_names).
+    """
+    check_sample_names(source_files)
+
+    def read(file: str) -> Spectrum:
+        return read_spectrum(
+            source_file=file,
+            sparsify_threshold=sparsify_threshold,
+            sparsify_pad=sparsify_pad,
+            intensity_dtype=intensity_dtype,
+            region=region,
+        )
+
+    if read_workers <= 1:
+        return [read(file) for file in source_files]
+    with ThreadPoolExecutor(max_workers=read_workers) as executor:
+        return list(executor.map(read, source_files))
+
+
+def read_spectrum(
+    source_file: str,
+    sparsify_threshold: Optional[float] = None,
+    sparsify_pad: int = 5,
+    intensity_dtype: DTypeLike = float64,
+    region: Optional[RegionOfInterest] = None,
+) -> Spectrum:
     """
-    spectrum_list = list()
-    for file in source_files:
+    Returns the Spectrum of one source file. See read_spectra for the expected .csv format.
+
+    Args:
+        source_file (str): A .csv file to perform data preprocessing on, optionally compressed.
+        sparsify_threshold (Optional[float]): When set, only the scan segments above this intensity are kept.
+        sparsify_pad (int): The number of points kept around each non-empty region.
+        intensity_dtype (DTypeLike): The dtype the scan intensities are stored in (float32 saves about a quarter of the
+                                     scan memory, m/z values stay float64).
+        region (Optional[RegionOfInterest]): When set, only the scans inside its retention time windows are parsed,
+                                             and their arrays are sliced to its m/z ranges.
+    """
+    select_rows = region is not None and region.rt_windows is not None
+    if select_rows:
+        # Only the RT column is parsed for every scan, the m/z and intensity lists only for the selected ones
+        with open_source(source_file) as source:
+            retention_times = pd.read_csv(source, usecols=["RT"])["RT"].to_numpy()
+        selected_rows = set(region.retention_time_indexes(retention_times).tolist())
+
+        def skip_unselected(line: int) -> bool:
+            return line > 0 and line - 1 not in selected_rows
+
+    with open_source(source_file) as source:
         data_frame = pd.read_csv(
-            file,
+            source,
+            skiprows=skip_unselected if select_rows else None,
             converters={
                 "mzarray": convert_str_to_float_list,
                 "intarray": convert_str_to_float_list,
             },
         )
-        data_frame = data_frame.rename(
-            columns={"mzarray": "mz_array", "intarray": "intensity_array"}
+    data_frame = data_frame.rename(
+        columns={"mzarray": "mz_array", "intarray": "intensity_array"}
+    )
+    spectrum = Spectrum(
+        data_frame,
+        sample_id=sample_name(source_file),
+        intensity_dtype=intensity_dtype,
+    )
+    if region is not None:
+        spectrum.select_region(region)
+    if sparsify_threshold is not None:
+        spectrum.sparsify(threshold=sparsify_threshold, pad=sparsify_pad)
+    return spectrum
+
+
+def iter_spectra(
+    source_files: List[str],
+    prefetch: int = 2,
+    max_buffered_bytes: Optional[int] = None,
+    sparsify_threshold: Optional[float] = None,
+    sparsify_pad: int = 5,
+    intensity_dtype: DTypeLike = float64,
+    region: Optional[RegionOfInterest] = None,
+    read_workers: int = 1,
+) -> Iterator[Spectrum]:
+    """
+    Yields the Spectrum of each source file in order, while a background thread reads and decodes
+    the next files. This way the disk is busy while the caller processes the current spectrum.
+    Compressed source files are decompressed while parsing, see read_spectra.
+
+    Args:
+        source_files (List[str]): A list of .csv files to perform data preprocessing on.
+        prefetch (int): The maximum number of decoded spectrums waiting to be consumed.
+                        With 0 the files are read synchronously, one at a time.
+        max_buffered_bytes (Optional[int]): Upper limit for the size of the waiting spectrums (see Spectrum.nbytes).
+                                            The limit is checked before a file is read, so it can be exceeded
+                                            by at most read_workers spectrums. A single spectrum is always
+                                            let through.
+        sparsify_threshold (Optional[float]): When set, only the scan segments above this intensity are kept.
+        sparsify_pad (int): The number of points kept around each non-empty region.
+        intensity_dtype (DTypeLike): The dtype the scan intensities are stored in (float32 saves about a quarter of the
+                                     scan memory, m/z values stay float64).
+        region (Optional[RegionOfInterest]): When set, only the scans inside its retention time windows are parsed,
+                                             and their arrays are sliced to its m/z ranges.
+        read_workers (int): The number of files read (and decompressed) at the same time when prefetching, by
+                            threads, which only overlap the file reads and the decompression (see read_spectra).
+    Raises:
+        ValueError: Several source files belong to the same sample (see check_sample_names), before any file is read.
+    """
+    check_sample_names(source_files)
+    if prefetch <= 0:
+        for file in source_files:
+            yield read_spectrum(
+                source_file=file,
+                sparsify_threshold=sparsify_threshold,
+                sparsify_pad=sparsify_pad,
+                intensity_dtype=intensity_dtype,
+                region=region,
+            )
+        return
+
+    queue = Queue(maxsize=prefetch)
+    buffer_changed = Condition()
+    stop = Event()
+    buffered = {"bytes": 0, "count": 0}
+
+    def has_room() -> bool:
+        return (
+            max_buffered_bytes is None
+            or buffered["count"] == 0
+            or buffered["bytes"] < max_buffered_bytes
         )
-        spectrum_list.append(Spectrum(data_frame))
 
-    return spectrum_list
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read(file: str) -> Spectrum:
+        return read_spectrum(
+            source_file=file,
+            sparsify_threshold=sparsify_threshold,
+            sparsify_pad=sparsify_pad,
+            intensity_dtype=intensity_dtype,
+            region=region,
+        )
+
+    def produce():
+        try:
+            with ThreadPoolExecutor(max_workers=max(read_workers, 1)) as executor:
+                if not read_files(executor):
+                    return
+            put((None, 0, None))
+        except Exception as error:
+            put((None, 0, error))
+
+    def read_files(executor: ThreadPoolExecutor) -> bool:
+        # up to read_workers files are read at the same time, their spectrums are queued in order
+        pending = deque()
+        files = deque(source_files)
+        while files or pending:
+            with buffer_changed:
+                while files and len(pending) < max(read_workers, 1) and has_room():
+                    pending.append(executor.submit(read, files.popleft()))
+                while not pending and not has_room() and not stop.is_set():
+                    buffer_changed.wait(_POLL_INTERVAL)
+            if stop.is_set():
+                return False
+            if not pending:
+                continue
+            spectrum = pending.popleft().result()
+            size = spectrum.nbytes
+            with buffer_changed:
+                buffered["bytes"] += size
+                buffered["count"] += 1
+            if not put((spectrum, size, None)):
+                return False
+        return True
+
+    reader = Thread(target=produce, name="spectrum-prefetch", daemon=True)
+    reader.start()
+    try:
+        while True:
+            try:
+                spectrum, size, error = queue.get(timeout=_POLL_INTERVAL)
+            except Empty:
+                if not reader.is_alive() and queue.empty():
+                    raise RuntimeError("Spectrum prefetch thread stopped unexpectedly.")
+                continue
+            if error is not None:
+                raise error
+            if spectrum is None:
+                return
+            with buffer_changed:
+                buffered["bytes"] -= size
+                buffered["count"] -= 1
+                buffer_changed.notify()
+            yield spectrum
+    finally:
+        stop.set()
+        reader.join()
+
+
+def sample_name(source_file: str) -> str:
+    """
+    Returns the sample ID belonging to a source file: its file name without extensions.
+    """
+    return Path(source_file).name.split(".")[0]
+
+
+def check_sample_names(source_files: List[str]):
+    """
+    Checks that every source file belongs to a different sample. The sample ID is taken from the file name
+    (see sample_name), so files with the same name in different directories, or with the same name before the
+    first dot, would be merged into one sample by the later stages.
+    Raises:
+        ValueError: Several source files have the same sample ID.
+    """
+    files_by_sample: Dict[str, List[str]] = {}
+    for source_file in source_files:
+        files_by_sample.setdefault(sample_name(source_file), []).append(
+            str(source_file)
+        )
+    duplicates = {
+        sample: files for sample, files in files_by_sample.items() if len(files) > 1
+    }
+    if duplicates:
+        raise ValueError(
+            f"Several source files belong to the same sample: {duplicates}."
+        )
 
 
 def convert_str_to_float_list(s: str):
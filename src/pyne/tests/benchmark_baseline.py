@@ -0,0 +1,21 @@
+"""
+Runtime benchmarks of the baseline engines on the same synthetic spectra, the output checks are in
+test_baseline_correction.py.
+Run with: pytest src/pyne/tests/benchmark_baseline.py
+"""
+import pytest
+from pyne.models.spectrum import Spectrum
+from pyne.services.baseline_correction import BASELINE_ENGINES, get_baseline_engine
+from pyne.tests.test_baseline_correction import FRAME, process
+
+
+@pytest.mark.parametrize("engine", sorted(BASELINE_ENGINES))
+def test_baseline_engine(benchmark, engine):
+    baseline = get_baseline_engine(engine)
+    scans = Spectrum(FRAME).scans
+    benchmark(lambda: [baseline(scan.intensity_array) for scan in scans])
+
+
+@pytest.mark.parametrize("engine", sorted(BASELINE_ENGINES))
+def test_scan_stages(benchmark, engine):
+    benchmark(process, engine)
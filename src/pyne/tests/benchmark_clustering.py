@@ -0,0 +1,21 @@
+"""
+Benchmarks of the partitioned clustering and deconvolution against the single process ones, the output checks are
+in test_peak_clustering.py.
+Run with: pytest src/pyne/tests/benchmark_clustering.py
+"""
+import pytest
+from pyne.services.deconvolution import deconvolve_peaks
+from pyne.services.peak_clustering import apply_dbscan_clustering
+from pyne.tests.test_peak_clustering import generate_peak_table
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_clustering(benchmark, workers):
+    peaks_df = generate_peak_table(5000)
+
+    def run():
+        return deconvolve_peaks(
+            apply_dbscan_clustering(peaks_df.copy(), workers), workers
+        )
+
+    benchmark(run)
@@ -0,0 +1,42 @@
+"""
+Benchmarks of compressed versus uncompressed ingest, the output checks are in test_compressed_io.py.
+Run with: pytest src/pyne/tests/benchmark_compression.py
+The throughput (MB of uncompressed .csv per second) is stored in each benchmark's extra_info.
+read_workers only overlaps the file reads and the decompression (the parsing holds the GIL), so on a single core
+more workers are not faster.
+"""
+from pathlib import Path
+
+import pytest
+from pyne.services.spectrum_reader import read_spectra
+from pyne.tests.test_compressed_io import OPENERS, write_samples
+
+SAMPLE_COUNT = 4
+
+
+@pytest.fixture(scope="module")
+def samples(tmp_path_factory):
+    return write_samples(
+        tmp_path_factory.mktemp("compression"), sample_count=SAMPLE_COUNT
+    )
+
+
+def _csv_megabytes(paths) -> float:
+    return sum(Path(path).stat().st_size for path in paths) / 1e6
+
+
+@pytest.mark.parametrize("read_workers", [1, SAMPLE_COUNT])
+@pytest.mark.parametrize("compression", [None, *OPENERS, "zstd"])
+def test_ingest(benchmark, samples, compression, read_workers):
+    if compression not in samples:
+        pytest.skip(f"{compression} is not available.")
+    files = samples[compression]
+    benchmark.extra_info["stored_mb"] = _csv_megabytes(files)
+    benchmark.pedantic(
+        read_spectra, args=(files,), kwargs={"read_workers": read_workers}, rounds=3
+    )
+    # there are no stats with --benchmark-disable
+    if benchmark.stats is not None:
+        benchmark.extra_info["csv_mb_per_s"] = (
+            _csv_megabytes(samples[None]) / benchmark.stats.stats.mean
+        )
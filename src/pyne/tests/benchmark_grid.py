@@ -0,0 +1,16 @@
+"""
+Benchmarks of the common m/z grid stages against the per-scan stages, the output checks are in test_mz_grid.py.
+Run with: pytest src/pyne/tests/benchmark_grid.py
+"""
+import pytest
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.tests.test_mz_grid import RESOLUTION, process
+
+
+@pytest.mark.parametrize("grid", [False, True])
+@pytest.mark.parametrize("engine", ["polynomial", "rolling_min"])
+def test_scan_stages(benchmark, engine, grid):
+    config = PipelineConfig(
+        baseline_engine=engine, mz_grid_resolution=RESOLUTION if grid else None
+    )
+    benchmark(process, config)
@@ -0,0 +1,12 @@
+"""
+Benchmarks of the float32 intensity mode against the float64 path, the accuracy checks are in test_precision.py.
+Run with: pytest src/pyne/tests/benchmark_precision.py
+"""
+import numpy as np
+import pytest
+from pyne.tests.test_precision import process
+
+
+@pytest.mark.parametrize("intensity_dtype", [np.float64, np.float32])
+def test_scan_stages(benchmark, intensity_dtype):
+    benchmark(process, intensity_dtype)
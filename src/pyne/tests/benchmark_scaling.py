@@ -0,0 +1,376 @@
+"""
+Scaling curves and memory budgets of the pipeline stages.
+Every stage runs on synthetic inputs growing geometrically in size. For each size the best wall time of a few
+runs and the tracemalloc peak of one more run are recorded, and the empirical complexity exponent is fitted as the
+slope of log(time) over log(size). The resident memory growth of the run is measured in a forked process, since
+tracemalloc misses the buffers of compiled extensions (Linux only, it reads /proc/self/status). A stage fails when
+the exponent exceeds its declared scaling class, or when its peak memory per unit of input at the largest size
+exceeds its budget. The curves are printed with -s and saved as test
+properties (--junitxml).
+Run with: pytest src/pyne/tests/benchmark_scaling.py
+"""
+import gc
+import multiprocessing
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, List, Sequence, Tuple
+
+import numpy as np
+import pytest
+from pandas import DataFrame
+from pyne.models.spectrum import Spectrum
+from pyne.services.baseline_correction import get_baseline_engine
+from pyne.services.deconvolution import deconvolve_peaks
+from pyne.services.feature_detection import detect_mass_traces
+from pyne.services.feature_grouping import group_features
+from pyne.services.peak_alignment import align_peaks, transform_peaks
+from pyne.services.peak_clustering import apply_dbscan_clustering
+from pyne.services.peak_normalization import normalize_peaks
+from pyne.services.spectrum_reader import read_spectrum
+from pyne.tests.synthetic import (
+    generate_cohort_peaks,
+    generate_spectrum_frame,
+    write_spectrum_csv,
+)
+
+# The size factors of the curve, relative to each stage's base size
+GROWTH = (1, 2, 4, 8)
+REPEATS = 3
+# Allowed excess of the fitted exponent over the declared one: fixed costs flatten the small end of the curve
+# and timing noise bends it either way
+EXPONENT_TOLERANCE = 0.25
+
+LINEAR = 1.0
+LINEARITHMIC = 1.2
+QUADRATIC = 2.0
+
+POINT_COUNT = 1000
+SCANS = "scans"
+PEAKS = "peaks"
+
+# The resident memory of a stage is measured in a forked copy of the test process
+PIPE_CONTEXT = multiprocessing.get_context("fork")
+
+
+@dataclass
+class StageCase:
+    """
+    A stage of the scaling suite.
+    Args:
+        name (str): The stage name.
+        setup (Callable[[int, Path], Any]): Builds the input of the given size, outside of the measurements.
+        run (Callable[[Any], Any]): Runs the stage on a fresh input.
+        base_size (int): The smallest size of the curve.
+        unit (str): What the size counts.
+        scaling (float): The declared complexity exponent.
+        bytes_per_unit (float): The budget of the tracemalloc peak per unit of size.
+    """
+
+    name: str
+    setup: Callable[[int, Path], Any]
+    run: Callable[[Any], Any]
+    base_size: int
+    unit: str
+    scaling: float
+    bytes_per_unit: float
+
+
+def _spectrum(size: int, _: Path) -> Spectrum:
+    return Spectrum(
+        generate_spectrum_frame(scan_count=size, point_count=POINT_COUNT),
+        sample_id="sample_0",
+    )
+
+
+def _filtered_spectrum(size: int, directory: Path) -> Spectrum:
+    spectrum = _spectrum(size, directory)
+    spectrum.align_baselines(baseline=get_baseline_engine("polynomial"))
+    spectrum.filter_noise(sigma=1)
+    return spectrum
+
+
+def _detected_spectrum(size: int, directory: Path) -> Spectrum:
+    spectrum = _filtered_spectrum(size, directory)
+    spectrum.detect_peaks(thres=0.1, min_dist=10)
+    return spectrum
+
+
+def _spectrum_file(size: int, directory: Path) -> str:
+    path = directory / f"spectrum_{size}.csv"
+    write_spectrum_csv(str(path), scan_count=size, point_count=POINT_COUNT)
+    return str(path)
+
+
+def _cohort(size: int, _: Path) -> List[Spectrum]:
+    # four samples of size / 4 peaks each
+    return generate_cohort_peaks(compound_count=size // 4)
+
+
+def _cohort_peaks(size: int, directory: Path) -> list:
+    return [peak for spectrum in _cohort(size, directory) for peak in spectrum.peaks]
+
+
+def _peak_table(size: int, _: Path) -> DataFrame:
+    # the m/z density grows with the size, like the peaks of a growing cohort
+    rng = np.random.default_rng(0)
+    return DataFrame(
+        {
+            "RT": rng.uniform(0, 600, size),
+            "mz": 10 ** rng.uniform(2, 3, size),
+            "intensity": rng.lognormal(16.0, 1.0, size),
+        }
+    )
+
+
+def _clustered_table(size: int, directory: Path) -> DataFrame:
+    return apply_dbscan_clustering(_peak_table(size, directory))
+
+
+def _transform(spectrum_list: List[Spectrum]):
+    master_spectrum, *test_spectrums = spectrum_list
+    return transform_peaks(
+        mz_adj_win=0.2,
+        rt_adj_win=20,
+        master_spectrum=master_spectrum,
+        test_spectrums=test_spectrums,
+    )
+
+
+STAGES = [
+    StageCase(
+        name="read",
+        setup=_spectrum_file,
+        run=read_spectrum,
+        base_size=20,
+        unit=SCANS,
+        scaling=LINEAR,
+        bytes_per_unit=200e3,
+    ),
+    StageCase(
+        name="baseline_alignment",
+        setup=_spectrum,
+        run=lambda spectrum: spectrum.align_baselines(
+            baseline=get_baseline_engine("polynomial")
+        ),
+        base_size=20,
+        unit=SCANS,
+        scaling=LINEAR,
+        bytes_per_unit=50e3,
+    ),
+    StageCase(
+        name="noise_filtering",
+        setup=lambda size, directory: _spectrum(size, directory),
+        run=lambda spectrum: spectrum.filter_noise(sigma=1),
+        base_size=20,
+        unit=SCANS,
+        scaling=LINEAR,
+        bytes_per_unit=25e3,
+    ),
+    StageCase(
+        name="peak_detection",
+        setup=_filtered_spectrum,
+        run=lambda spectrum: spectrum.detect_peaks(thres=0.1, min_dist=10),
+        base_size=20,
+        unit=SCANS,
+        scaling=LINEAR,
+        bytes_per_unit=35e3,
+    ),
+    StageCase(
+        name="mass_traces",
+        setup=_detected_spectrum,
+        run=lambda spectrum: detect_mass_traces(spectrum.peaks),
+        base_size=20,
+        unit=SCANS,
+        scaling=LINEARITHMIC,
+        bytes_per_unit=30e3,
+    ),
+    StageCase(
+        name="peak_alignment",
+        setup=_cohort,
+        run=align_peaks,
+        base_size=2000,
+        unit=PEAKS,
+        scaling=LINEARITHMIC,
+        bytes_per_unit=500,
+    ),
+    StageCase(
+        name="normalization",
+        setup=_cohort_peaks,
+        run=normalize_peaks,
+        base_size=4000,
+        unit=PEAKS,
+        scaling=LINEARITHMIC,
+        bytes_per_unit=500,
+    ),
+    StageCase(
+        name="clustering",
+        setup=_peak_table,
+        # DBSCAN on the m/z values alone: every peak's neighborhood grows with the m/z density, and sklearn holds all
+        # of them at once, so its resident memory grows quadratically too
+        run=lambda peaks_df: apply_dbscan_clustering(peaks_df.copy()),
+        base_size=2000,
+        unit=PEAKS,
+        scaling=QUADRATIC,
+        bytes_per_unit=25e3,
+    ),
+    StageCase(
+        name="deconvolution",
+        setup=_clustered_table,
+        run=deconvolve_peaks,
+        base_size=4000,
+        unit=PEAKS,
+        scaling=LINEARITHMIC,
+        bytes_per_unit=200,
+    ),
+    StageCase(
+        name="feature_grouping",
+        setup=_peak_table,
+        run=group_features,
+        base_size=4000,
+        unit=PEAKS,
+        scaling=LINEARITHMIC,
+        bytes_per_unit=400,
+    ),
+]
+
+# The pairing of transform_peaks compares every master peak with every test peak. It is kept for plotting, the
+# pipeline pairs peaks with match_peak_pairs: this case shows that the suite catches the quadratic matching.
+QUADRATIC_MATCHING = StageCase(
+    name="peak_transformation",
+    setup=_cohort,
+    run=_transform,
+    base_size=400,
+    unit=PEAKS,
+    scaling=LINEARITHMIC,
+    bytes_per_unit=1e3,
+)
+
+
+def measure_stage(
+    case: StageCase, directory: Path
+) -> List[Tuple[int, float, int, int]]:
+    """
+    Returns:
+        (List[Tuple[int, float, int, int]]): The size, best wall time in seconds, tracemalloc peak in bytes and
+                                              resident memory growth in bytes of each point of the curve.
+    """
+    curve = []
+    for factor in GROWTH:
+        size = case.base_size * factor
+        elapsed = []
+        for _ in range(REPEATS):
+            stage_input = case.setup(size, directory)
+            gc.collect()
+            start = perf_counter()
+            case.run(stage_input)
+            elapsed.append(perf_counter() - start)
+            del stage_input
+
+        stage_input = case.setup(size, directory)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            case.run(stage_input)
+            _, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del stage_input
+        curve.append(
+            (
+                size,
+                min(elapsed),
+                traced_peak,
+                measure_resident_growth(case, size, directory),
+            )
+        )
+    return curve
+
+
+def measure_resident_growth(case: StageCase, size: int, directory: Path) -> int:
+    """
+    Runs the stage in a forked process and returns how far its peak resident memory rose above the resident memory
+    before the run. Unlike tracemalloc this counts the buffers of compiled extensions too, e.g. the neighborhoods of
+    DBSCAN.
+    """
+    receiver, sender = PIPE_CONTEXT.Pipe(duplex=False)
+    process = PIPE_CONTEXT.Process(
+        target=_resident_growth, args=(case, size, directory, sender)
+    )
+    process.start()
+    sender.close()
+    growth = receiver.recv()
+    process.join()
+    return growth
+
+
+def _resident_growth(case: StageCase, size: int, directory: Path, sender):
+    stage_input = case.setup(size, directory)
+    gc.collect()
+    # writing 5 resets the peak resident memory (VmHWM) of the process to its current resident memory
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    resident = _memory_status("VmRSS")
+    case.run(stage_input)
+    sender.send(max(_memory_status("VmHWM") - resident, 0))
+    sender.close()
+
+
+def _memory_status(field: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def fit_exponent(sizes: Sequence[float], values: Sequence[float]) -> float:
+    """
+    Returns:
+        (float): The slope of the least squares line through the log-log points, the empirical complexity exponent.
+    """
+    slope, _ = np.polyfit(np.log(sizes), np.log(values), 1)
+    return float(slope)
+
+
+def check_stage(case: StageCase, directory: Path, record_property: Callable):
+    curve = measure_stage(case, directory)
+    sizes, times, traced, resident = (
+        np.array(column, dtype=float) for column in zip(*curve)
+    )
+    exponent = fit_exponent(sizes, times)
+    # the budget holds at the largest size, where fixed costs and allocator noise weigh the least
+    bytes_per_unit = max(traced[-1], resident[-1]) / sizes[-1]
+
+    print(
+        f"\n{case.name}: exponent {exponent:.2f} (declared {case.scaling}), "
+        f"peak {bytes_per_unit:.0f} B/{case.unit[:-1]} (budget {case.bytes_per_unit:.0f})"
+    )
+    for size, elapsed, traced_peak, resident_growth in curve:
+        print(
+            f"  {size:>7} {case.unit}: {elapsed * 1000:9.2f} ms, traced {traced_peak / 2 ** 20:8.2f} MB, "
+            f"resident {resident_growth / 2 ** 20:8.2f} MB"
+        )
+    record_property(f"{case.name}_curve", curve)
+    record_property(f"{case.name}_exponent", exponent)
+
+    assert bytes_per_unit <= case.bytes_per_unit, (
+        f"{case.name} peaks at {bytes_per_unit:.0f} bytes per {case.unit[:-1]}, "
+        f"over its budget of {case.bytes_per_unit:.0f}."
+    )
+    assert (
+        exponent <= case.scaling + EXPONENT_TOLERANCE
+    ), f"{case.name} scales with exponent {exponent:.2f}, over its declared {case.scaling}."
+
+
+@pytest.mark.parametrize("case", STAGES, ids=[case.name for case in STAGES])
+def test_stage_scaling(case, tmp_path, record_property):
+    check_stage(case, tmp_path, record_property)
+
+
+@pytest.mark.xfail(
+    strict=True, reason="transform_spectrum_peaks compares every pair of peaks"
+)
+def test_quadratic_matching_is_caught(tmp_path, record_property):
+    check_stage(QUADRATIC_MATCHING, tmp_path, record_property)
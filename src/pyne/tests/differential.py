@@ -0,0 +1,526 @@
+"""
+Differential verification of the fast engines against their reference implementations.
+Each stage runs the reference engine and the optimized one side by side on the same input, and reports the
+speed ratio, the items found by only one of them (peaks, peak pairs, clustered rows) and the numeric deviation
+of the items found by both:
+    baseline_alignment:  Scan.align_baseline               vs the matrix engine of GriddedSpectrum
+    peak_detection:      Scan.get_peaks (peakutils)        vs GriddedSpectrum.detect_peaks
+    peak_matching:       transform_spectrum_peaks          vs match_peak_pairs
+    rt_correction:       LOESS over every matched pair     vs the knot table of fit_rt_correction
+    clustering:          apply_dbscan_clustering           vs apply_partitioned_dbscan_clustering
+Run the suite with: pytest src/pyne/tests/test_differential.py
+Recorded spectra are compared too when PYNE_RECORDED_SPECTRA lists .csv files or glob patterns (separated by
+os.pathsep). A report of any .csv files is printed with: python -m pyne.tests.differential FILE [FILE ...]
+"""
+import argparse
+import glob
+import os
+from collections import Counter
+from time import perf_counter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy import ndarray
+from pandas import DataFrame
+from pyne.models.gridded_spectrum import GriddedSpectrum
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.spectrum import Spectrum
+from pyne.services.baseline_correction import (
+    get_baseline_engine,
+    get_matrix_baseline_engine,
+)
+from pyne.services.peak_alignment import (
+    align_peaks,
+    find_master_spectrum,
+    find_test_spectrums,
+    fit_rt_correction,
+    match_peak_pairs,
+    transform_spectrum_peaks,
+)
+from pyne.services.peak_clustering import apply_dbscan_clustering
+from pyne.services.peak_normalization import normalize_peaks
+from pyne.services.preprocessor import retrieve_feature_matrix
+from pyne.services.spectrum_reader import read_spectrum
+from statsmodels.nonparametric.smoothers_lowess import lowess
+
+RECORDED_SPECTRA_VARIABLE = "PYNE_RECORDED_SPECTRA"
+
+# The largest relative deviation (see StageComparison) and fraction of differing items accepted per stage.
+# GriddedSpectrum.detect_peaks does not report flat-topped maxima, which peakutils does: a few may be missing.
+TOLERANCES: Dict[str, Tuple[float, float]] = {
+    "baseline_alignment": (1e-6, 0.0),
+    "peak_detection": (1e-6, 1e-3),
+    "peak_matching": (0.0, 0.0),
+    "rt_correction": (0.05, 0.0),
+    "clustering": (0.0, 0.0),
+}
+
+
+class StageComparison:
+    """
+    Represents the result of running the reference and the optimized engine of a stage on the same input.
+    Attributes:
+        stage (str): The stage name, one of TOLERANCES.
+        source (str): The input the stage ran on.
+        reference_seconds (float): The wall time of the reference engine.
+        candidate_seconds (float): The wall time of the optimized engine.
+        reference_count (int): The number of items (values, peaks, pairs or rows) produced by the reference.
+        missing (int): The items produced by the reference only.
+        extra (int): The items produced by the optimized engine only.
+        mismatched (int): The shared items whose values are not exactly equal.
+        max_abs_deviation (float): The largest absolute difference of the shared items' values.
+        max_rel_deviation (float): max_abs_deviation relative to the largest absolute reference value.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        source: str,
+        reference_seconds: float,
+        candidate_seconds: float,
+        reference_count: int,
+        missing: int = 0,
+        extra: int = 0,
+        mismatched: int = 0,
+        max_abs_deviation: float = 0.0,
+        max_rel_deviation: float = 0.0,
+    ):
+        self.stage = stage
+        self.source = source
+        self.reference_seconds = reference_seconds
+        self.candidate_seconds = candidate_seconds
+        self.reference_count = reference_count
+        self.missing = missing
+        self.extra = extra
+        self.mismatched = mismatched
+        self.max_abs_deviation = max_abs_deviation
+        self.max_rel_deviation = max_rel_deviation
+
+    @property
+    def speedup(self) -> float:
+        """
+        The reference wall time over the optimized one, above 1 when the optimized engine is faster.
+        """
+        return (
+            self.reference_seconds / self.candidate_seconds
+            if self.candidate_seconds
+            else float("inf")
+        )
+
+    @property
+    def difference_fraction(self) -> float:
+        return (self.missing + self.extra) / max(self.reference_count, 1)
+
+    def within_tolerance(self) -> bool:
+        max_rel_deviation, max_difference_fraction = TOLERANCES[self.stage]
+        return (
+            self.max_rel_deviation <= max_rel_deviation
+            and self.difference_fraction <= max_difference_fraction
+            and (max_rel_deviation > 0 or self.mismatched == 0)
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self.stage,
+            "source": self.source,
+            "reference_seconds": self.reference_seconds,
+            "candidate_seconds": self.candidate_seconds,
+            "speedup": self.speedup,
+            "reference_count": self.reference_count,
+            "missing": self.missing,
+            "extra": self.extra,
+            "mismatched": self.mismatched,
+            "max_abs_deviation": self.max_abs_deviation,
+            "max_rel_deviation": self.max_rel_deviation,
+            "within_tolerance": self.within_tolerance(),
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"StageComparison(stage={self.stage}, source={self.source}, speedup={self.speedup:.2f}, "
+            f"missing={self.missing}, extra={self.extra}, max_rel_deviation={self.max_rel_deviation:.3g})"
+        )
+
+
+def compare_baselines(
+    spectrum: Spectrum, source: str, engine: str = "polynomial", **params
+) -> StageComparison:
+    """
+    Compares the per-scan baseline alignment with the matrix engine, on the scans of the spectrum grouped by length.
+    The spectrum itself is aligned by the reference engine, so the next stages can run on it.
+    """
+    raw = [scan.intensity_array.astype(np.float64) for scan in spectrum.scans]
+    baseline = get_baseline_engine(engine, **params)
+    _, reference_seconds = timed(spectrum.align_baselines, baseline=baseline)
+
+    matrix_baseline = get_matrix_baseline_engine(engine, **params)
+
+    def align_groups() -> List[ndarray]:
+        aligned: List[Optional[ndarray]] = [None] * len(raw)
+        for rows in _rows_by_length(raw):
+            block = np.stack([raw[row] for row in rows])
+            block -= matrix_baseline(block)
+            for row, values in zip(rows, block):
+                aligned[row] = values
+        return aligned
+
+    candidate, candidate_seconds = timed(align_groups)
+    reference = [scan.intensity_array for scan in spectrum.scans]
+    return _compare_values(
+        "baseline_alignment",
+        source,
+        np.concatenate(reference) if reference else np.empty(0),
+        np.concatenate(candidate) if candidate else np.empty(0),
+        reference_seconds,
+        candidate_seconds,
+        scale=max(
+            (float(np.abs(values).max()) for values in raw if values.size), default=0.0
+        ),
+    )
+
+
+def compare_peak_detection(
+    spectrum: Spectrum, source: str, thres: float, min_dist: int
+) -> StageComparison:
+    """
+    Compares peakutils peak picking (Scan.get_peaks) with the vectorized GriddedSpectrum.detect_peaks on the same
+    intensities: the scans of each length are stacked into one matrix whose columns are the scan points.
+    The spectrum keeps the reference peaks, so the next stages can run on it.
+    """
+    scans = spectrum.scans
+
+    def detect_reference():
+        spectrum.peaks = []
+        spectrum.detect_peaks(thres=thres, min_dist=min_dist)
+        return spectrum.peaks
+
+    reference, reference_seconds = timed(detect_reference)
+
+    def detect_candidate():
+        peaks = []
+        for rows in _rows_by_length([scan.intensity_array for scan in scans]):
+            gridded = GriddedSpectrum(
+                retention_times=[scans[row].retention_time for row in rows],
+                mz_grid=scans[rows[0]].mz_array,
+                intensities=np.stack([scans[row].intensity_array for row in rows]),
+                scan_ids=[scans[row].scan_id for row in rows],
+                sample_id=spectrum.sample_id,
+            )
+            peaks.extend(gridded.detect_peaks(thres=thres, min_dist=min_dist))
+        return peaks
+
+    candidate, candidate_seconds = timed(detect_candidate)
+    return _compare_items(
+        "peak_detection",
+        source,
+        {(peak.scan_id, peak.peak_index): peak.intensity for peak in reference},
+        {(peak.scan_id, peak.peak_index): peak.intensity for peak in candidate},
+        reference_seconds,
+        candidate_seconds,
+    )
+
+
+def compare_peak_matching(
+    master_spectrum: Spectrum,
+    test_spectrum: Spectrum,
+    source: str,
+    mz_adj_win: float,
+    rt_adj_win: float,
+) -> StageComparison:
+    """
+    Compares the (Master Data peak, Test Data peak) pairs of the pairwise transform_spectrum_peaks with the
+    binary search of match_peak_pairs. A pair is identified by the master retention time and the drift.
+    """
+
+    def transform():
+        return [
+            (peak.retention_time, test_peak.retention_time)
+            for peak in master_spectrum.peaks
+            for _, test_peak in transform_spectrum_peaks(
+                mz_adj_win=mz_adj_win,
+                rt_adj_win=rt_adj_win,
+                peak=peak,
+                test_spectrums=[test_spectrum],
+            )
+        ]
+
+    reference, reference_seconds = timed(transform)
+    (master_rt, test_rt), candidate_seconds = timed(
+        match_peak_pairs,
+        mz_adj_win=mz_adj_win,
+        rt_adj_win=rt_adj_win,
+        master_spectrum=master_spectrum,
+        test_spectrum=test_spectrum,
+    )
+    candidate = Counter(zip(master_rt.tolist(), (master_rt - test_rt).tolist()))
+    reference = Counter(reference)
+    missing = sum((reference - candidate).values())
+    extra = sum((candidate - reference).values())
+    return StageComparison(
+        stage="peak_matching",
+        source=source,
+        reference_seconds=reference_seconds,
+        candidate_seconds=candidate_seconds,
+        reference_count=sum(reference.values()),
+        missing=missing,
+        extra=extra,
+    )
+
+
+def compare_rt_correction(
+    master_spectrum: Spectrum,
+    test_spectrum: Spectrum,
+    source: str,
+    mz_adj_win: float,
+    rt_adj_win: float,
+    frac: float = 0.3,
+) -> StageComparison:
+    """
+    Compares the drift of every matched pair smoothed by a full LOESS regression with the drift interpolated from
+    the knot table of fit_rt_correction. The deviations are in retention time units, relative to the largest drift.
+    (apply_loess_regression smooths the master retention time over the drift with frac 0.01 for plotting, a
+    different curve, so the reference is the same LOESS the pipeline fits.)
+    """
+    master_rt, test_rt = match_peak_pairs(
+        mz_adj_win=mz_adj_win,
+        rt_adj_win=rt_adj_win,
+        master_spectrum=master_spectrum,
+        test_spectrum=test_spectrum,
+    )
+    drift = master_rt - test_rt
+    if drift.size < 3:
+        return StageComparison("rt_correction", source, 0.0, 0.0, reference_count=0)
+
+    reference, reference_seconds = timed(
+        lowess, drift, test_rt, frac=frac, return_sorted=False
+    )
+
+    def correct():
+        correction = fit_rt_correction(
+            mz_adj_win=mz_adj_win,
+            rt_adj_win=rt_adj_win,
+            master_spectrum=master_spectrum,
+            test_spectrum=test_spectrum,
+            frac=frac,
+        )
+        return correction.drift(test_rt)
+
+    candidate, candidate_seconds = timed(correct)
+    return _compare_values(
+        "rt_correction",
+        source,
+        reference,
+        candidate,
+        reference_seconds,
+        candidate_seconds,
+    )
+
+
+def compare_clustering(
+    peaks_df: DataFrame, source: str, workers: int = 2
+) -> StageComparison:
+    """
+    Compares the DBSCAN labels of the whole peak table with those of the m/z partitioned clustering.
+    """
+    reference, reference_seconds = timed(apply_dbscan_clustering, peaks_df.copy())
+    candidate, candidate_seconds = timed(
+        apply_dbscan_clustering, peaks_df.copy(), workers=workers
+    )
+    return _compare_items(
+        "clustering",
+        source,
+        dict(zip(reference.index, reference["label"].to_numpy(dtype=float))),
+        dict(zip(candidate.index, candidate["label"].to_numpy(dtype=float))),
+        reference_seconds,
+        candidate_seconds,
+        numeric=False,
+    )
+
+
+def run_differential(
+    spectrum_list: List[Spectrum],
+    source: str,
+    config: Optional[PipelineConfig] = None,
+    mz_adj_win: float = 0.2,
+    rt_adj_win: float = 20,
+    cluster_workers: int = 2,
+) -> List[StageComparison]:
+    """
+    Runs the stages of the pipeline in order on the spectrums, comparing the engines of every stage. Each stage runs
+    on the output of the reference engine of the stage before, so a deviation is not carried over to later stages.
+    The spectrums are modified in place.
+    Returns:
+        (List[StageComparison]): One comparison per stage, merged over the spectrums.
+    """
+    if config is None:
+        config = PipelineConfig()
+    stages: Dict[str, List[StageComparison]] = {}
+    for spectrum in spectrum_list:
+        stages.setdefault("baseline_alignment", []).append(
+            compare_baselines(
+                spectrum, source, config.baseline_engine, **config.baseline_params
+            )
+        )
+        spectrum.filter_noise(sigma=config.noise_sigma)
+        stages.setdefault("peak_detection", []).append(
+            compare_peak_detection(
+                spectrum,
+                source,
+                thres=config.peak_threshold,
+                min_dist=config.peak_min_dist,
+            )
+        )
+
+    master_spectrum = find_master_spectrum(spectrum_list)
+    for test_spectrum in find_test_spectrums(spectrum_list, master_spectrum):
+        stages.setdefault("peak_matching", []).append(
+            compare_peak_matching(
+                master_spectrum, test_spectrum, source, mz_adj_win, rt_adj_win
+            )
+        )
+        stages.setdefault("rt_correction", []).append(
+            compare_rt_correction(
+                master_spectrum, test_spectrum, source, mz_adj_win, rt_adj_win
+            )
+        )
+
+    aligned_peaks = align_peaks(
+        spectrum_list, mz_adj_win=mz_adj_win, rt_adj_win=rt_adj_win
+    )
+    peaks_df = retrieve_feature_matrix(normalize_peaks(aligned_peaks))
+    if len(peaks_df):
+        stages["clustering"] = [
+            compare_clustering(peaks_df, source, workers=cluster_workers)
+        ]
+    return [merge_comparisons(comparisons) for comparisons in stages.values()]
+
+
+def merge_comparisons(comparisons: Sequence[StageComparison]) -> StageComparison:
+    """
+    Merges the comparisons of one stage on several inputs: the times and counts add up, the deviations are the largest.
+    """
+    return StageComparison(
+        stage=comparisons[0].stage,
+        source=comparisons[0].source,
+        reference_seconds=sum(
+            comparison.reference_seconds for comparison in comparisons
+        ),
+        candidate_seconds=sum(
+            comparison.candidate_seconds for comparison in comparisons
+        ),
+        reference_count=sum(comparison.reference_count for comparison in comparisons),
+        missing=sum(comparison.missing for comparison in comparisons),
+        extra=sum(comparison.extra for comparison in comparisons),
+        mismatched=sum(comparison.mismatched for comparison in comparisons),
+        max_abs_deviation=max(
+            comparison.max_abs_deviation for comparison in comparisons
+        ),
+        max_rel_deviation=max(
+            comparison.max_rel_deviation for comparison in comparisons
+        ),
+    )
+
+
+def comparison_report(comparisons: Sequence[StageComparison]) -> DataFrame:
+    return DataFrame([comparison.to_dict() for comparison in comparisons])
+
+
+def recorded_spectrum_files() -> List[str]:
+    """
+    Returns:
+        (List[str]): The files listed in the PYNE_RECORDED_SPECTRA environment variable, with the glob patterns expanded.
+    """
+    patterns = os.environ.get(RECORDED_SPECTRA_VARIABLE, "")
+    return sorted(
+        path
+        for pattern in patterns.split(os.pathsep)
+        if pattern
+        for path in (glob.glob(pattern) or [pattern])
+    )
+
+
+def timed(function: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    start = perf_counter()
+    result = function(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def _rows_by_length(arrays: Sequence[ndarray]) -> List[List[int]]:
+    groups: Dict[int, List[int]] = {}
+    for row, values in enumerate(arrays):
+        groups.setdefault(len(values), []).append(row)
+    return list(groups.values())
+
+
+def _compare_values(
+    stage: str,
+    source: str,
+    reference: ndarray,
+    candidate: ndarray,
+    reference_seconds: float,
+    candidate_seconds: float,
+    scale: Optional[float] = None,
+) -> StageComparison:
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    deviation = np.abs(reference - candidate)
+    max_abs_deviation = float(deviation.max()) if deviation.size else 0.0
+    if scale is None:
+        scale = float(np.abs(reference).max()) if reference.size else 0.0
+    return StageComparison(
+        stage=stage,
+        source=source,
+        reference_seconds=reference_seconds,
+        candidate_seconds=candidate_seconds,
+        reference_count=int(reference.size),
+        mismatched=int(np.count_nonzero(deviation)),
+        max_abs_deviation=max_abs_deviation,
+        max_rel_deviation=max_abs_deviation / scale if scale else max_abs_deviation,
+    )
+
+
+def _compare_items(
+    stage: str,
+    source: str,
+    reference: Dict[Hashable, float],
+    candidate: Dict[Hashable, float],
+    reference_seconds: float,
+    candidate_seconds: float,
+    numeric: bool = True,
+) -> StageComparison:
+    shared = [key for key in reference if key in candidate]
+    comparison = _compare_values(
+        stage,
+        source,
+        np.array([reference[key] for key in shared]),
+        np.array([candidate[key] for key in shared]),
+        reference_seconds,
+        candidate_seconds,
+    )
+    comparison.reference_count = len(reference)
+    comparison.missing = len(reference) - len(shared)
+    comparison.extra = len(candidate) - len(shared)
+    if not numeric:
+        # labels are identifiers, only whether they are equal counts
+        comparison.max_abs_deviation = comparison.max_rel_deviation = float(
+            comparison.mismatched > 0
+        )
+    return comparison
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source_files", nargs="+", help="The .csv files of one cohort.")
+    parser.add_argument("-o", "--output", help="Write the report to this .csv file.")
+    args = parser.parse_args(argv)
+
+    spectrum_list = [read_spectrum(source_file) for source_file in args.source_files]
+    report = comparison_report(run_differential(spectrum_list, source="recorded"))
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+    return 0 if report["within_tolerance"].all() else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
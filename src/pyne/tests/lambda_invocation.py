@@ -0,0 +1,34 @@
+"""
+One cold invocation of the Lambda handler (pyne.main.handler) for loadtest_pipeline, in a fresh interpreter:
+reads the event as JSON from stdin and writes the timings as JSON on the last line of stdout.
+Only the standard library is imported before the handler import is timed, like in a new Lambda container.
+Run with: python -m pyne.tests.lambda_invocation < event.json
+"""
+import json
+import sys
+from resource import RUSAGE_SELF, getrusage
+from time import perf_counter
+
+
+def main() -> int:
+    event = json.load(sys.stdin)
+    start = perf_counter()
+    from pyne.main import handler
+
+    imported = perf_counter()
+    response = handler(event)
+    end = perf_counter()
+    record = {
+        "import": imported - start,
+        "duration": end - imported,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_memory_mb": getrusage(RUSAGE_SELF).ru_maxrss / 1024,
+        "feature_count": response["feature_count"],
+        "timings": response["timings"],
+    }
+    sys.stdout.write("\n" + json.dumps(record) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+Concurrency load test of the Lambda handler (pyne.main.handler).
+Generates synthetic sample files, uploads them to a local moto S3 server and fires concurrent invocations,
+each in a fresh interpreter like a Lambda container (see lambda_invocation.py), then writes a report with the
+throughput, the latency percentiles and the peak memory of the invocations. The latency of an invocation runs from
+the start of its interpreter to its exit, the time it waited for a free concurrency slot is reported as queue_wait.
+A previous report can be given to compare against.
+Run with:
+    python -m pyne.tests.loadtest_pipeline --invocations 16 --concurrency 4 -o report.json [--baseline old.json]
+Without moto (dev dependency) use --endpoint-url of another S3 compatible server, or --local to skip S3.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .synthetic import write_spectrum_csv
+
+BUCKET = "pyne-loadtest"
+# The per-invocation values summarized in the report
+METRICS = ("latency", "queue_wait", "import", "duration", "peak_memory_mb")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-n", "--invocations", type=int, default=16, help="Number of invocations."
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=4, help="Invocations running at once."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=2, help="Samples per invocation."
+    )
+    parser.add_argument(
+        "--samples", type=int, default=8, help="Number of distinct synthetic samples."
+    )
+    parser.add_argument(
+        "--scans", type=int, default=60, help="Scans per synthetic sample."
+    )
+    parser.add_argument("--points", type=int, default=3000, help="Points per scan.")
+    parser.add_argument(
+        "--endpoint-url",
+        help="An S3 compatible server to use instead of starting moto.",
+    )
+    parser.add_argument(
+        "--local", action="store_true", help="Read the samples from disk instead of S3."
+    )
+    parser.add_argument("-o", "--output", help="Write the report to this .json file.")
+    parser.add_argument("--baseline", help="A previous report to compare against.")
+    args = parser.parse_args(argv)
+
+    with TemporaryDirectory() as work_dir:
+        files = [
+            write_spectrum_csv(
+                str(Path(work_dir) / f"sample_{index}.csv"),
+                scan_count=args.scans,
+                point_count=args.points,
+                rt_shift=0.7 * index,
+                seed=index,
+            )
+            for index in range(args.samples)
+        ]
+        batches = [
+            [
+                files[(invocation * args.batch_size + offset) % len(files)]
+                for offset in range(args.batch_size)
+            ]
+            for invocation in range(args.invocations)
+        ]
+        if args.local:
+            events = [{"source_files": batch} for batch in batches]
+            report = run_load(events, args.concurrency)
+        else:
+            server = None
+            endpoint_url = args.endpoint_url
+            if endpoint_url is None:
+                server, endpoint_url = start_moto_server()
+            try:
+                os.environ["AWS_ENDPOINT_URL_S3"] = endpoint_url
+                for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+                    os.environ.setdefault(name, "testing")
+                os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+                upload_samples(files)
+                events = [
+                    {
+                        "bucket": BUCKET,
+                        "keys": [Path(path).name for path in batch],
+                        "output_key": f"features/{invocation}.csv",
+                    }
+                    for invocation, batch in enumerate(batches)
+                ]
+                report = run_load(events, args.concurrency)
+            finally:
+                if server is not None:
+                    server.stop()
+
+    report["parameters"] = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "baseline")
+    }
+    print_report(report)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            print_comparison(json.load(baseline_file), report)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    return 0 if not report["failures"] else 1
+
+
+def start_moto_server():
+    """
+    Starts a moto S3 server on a free local port.
+    Returns:
+        The server and its endpoint URL.
+    """
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit("moto is not installed: use --endpoint-url or --local.")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def upload_samples(files: List[str]):
+    import boto3
+
+    client = boto3.client("s3")
+    client.create_bucket(Bucket=BUCKET)
+    for path in files:
+        client.upload_file(path, BUCKET, Path(path).name)
+
+
+def run_load(events: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    """
+    Runs every event through the handler, at most concurrency at the same time, each in a new interpreter.
+    Returns:
+        (Dict[str, Any]): The report: throughput, latency, queue wait and memory statistics and the per-invocation
+                          records.
+    """
+    invocations = []
+    failures = []
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(invoke, event, perf_counter()) for event in events]
+        for future in as_completed(futures):
+            try:
+                invocations.append(future.result())
+            except Exception as error:
+                failures.append(repr(error))
+    wall_time = perf_counter() - start
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "wall_time": wall_time,
+        "throughput": len(invocations) / wall_time,
+        **{
+            name: _percentiles([record[name] for record in invocations])
+            for name in METRICS
+        },
+        "failures": failures,
+        "invocations": invocations,
+    }
+
+
+def invoke(event: Dict[str, Any], submitted: float) -> Dict[str, Any]:
+    """
+    Runs one invocation in a new interpreter (see lambda_invocation.py), so that its imports are a cold start and
+    its peak RSS is its own.
+    Args:
+        event (Dict[str, Any]): The handler event.
+        submitted (float): The perf_counter time the invocation was submitted at, for its queue wait.
+    Returns:
+        (Dict[str, Any]): The record of the invocation: its queue wait, latency, import time, handler duration,
+                          peak memory, feature count and stage timings.
+    """
+    started = perf_counter()
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        filter(
+            None,
+            [str(Path(__file__).resolve().parents[2]), environment.get("PYTHONPATH")],
+        )
+    )
+    process = subprocess.run(
+        [sys.executable, "-m", "pyne.tests.lambda_invocation"],
+        input=json.dumps(event),
+        capture_output=True,
+        text=True,
+        env=environment,
+    )
+    latency = perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"Invocation failed: {process.stderr.strip().splitlines()[-1:]}"
+        )
+    record = json.loads(process.stdout.strip().splitlines()[-1])
+    return {"queue_wait": started - submitted, "latency": latency, **record}
+
+
+def print_report(report: Dict[str, Any]):
+    print(
+        f"{len(report['invocations'])} invocations in {report['wall_time']:.2f} s, "
+        f"{report['throughput']:.2f} invocations/s, {len(report['failures'])} failed"
+    )
+    print(f"{'':<16} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}")
+    for name in METRICS:
+        stats = report.get(name, {})
+        print(
+            f"{name:<16} "
+            + " ".join(
+                f"{stats.get(key, float('nan')):>10.3f}"
+                for key in ("p50", "p95", "p99", "max")
+            )
+        )
+
+
+def print_comparison(baseline: Dict[str, Any], report: Dict[str, Any]):
+    print(f"Change against {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    print(f"{'throughput':<24} {_change(baseline['throughput'], report['throughput'])}")
+    for name in METRICS:
+        for key in ("p50", "p95", "p99"):
+            if key in baseline.get(name, {}) and key in report.get(name, {}):
+                print(
+                    f"{name + ' ' + key:<24} {_change(baseline[name][key], report[name][key])}"
+                )
+
+
+def _change(before: float, after: float) -> str:
+    relative = (after - before) / before * 100 if before else float("nan")
+    return f"{before:>10.3f} -> {after:>10.3f} ({relative:+.1f}%)"
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(np.mean(values)),
+        "max": float(np.max(values)),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from pandas import DataFrame
+from pyne.models.peak import Peak
+from pyne.models.spectrum import Spectrum
+from pyne.services.mzml_converter import format_float_list
+
+# (m/z, retention time) of the compounds present in every synthetic sample
+DEFAULT_COMPOUNDS = [
+    (150.0, 20.0),
+    (180.0, 44.0),
+    (220.0, 35.0),
+    (300.0, 50.0),
+    (350.0, 28.0),
+]
+
+
+def generate_compounds(count: int, seed: int = 0) -> List[Tuple[float, float]]:
+    rng = np.random.default_rng(seed)
+    return list(
+        zip(
+            rng.uniform(110.0, 390.0, count).tolist(),
+            rng.uniform(5.0, 55.0, count).tolist(),
+        )
+    )
+
+
+def generate_spectrum_frame(
+    scan_count: int = 60,
+    point_count: int = 3000,
+    compounds: Optional[List[Tuple[float, float]]] = None,
+    rt_shift: float = 0.0,
+    seed: int = 0,
+) -> DataFrame:
+    """
+    Generates one LC-MS profile sample: scans one RT unit apart, on an m/z axis from 100 to 400,
+    with a broad baseline, half-normal noise and a Gaussian (RT x m/z) peak for each compound.
+    Returns a DataFrame with the columns Spectrum expects: 'RT', 'mz_array', 'intensity_array'.
+    """
+    rng = np.random.default_rng(seed)
+    compounds = DEFAULT_COMPOUNDS if compounds is None else compounds
+    mz_array = np.linspace(100.0, 400.0, point_count)
+    retention_times = np.arange(scan_count, dtype=float) * 60.0 / scan_count + rt_shift
+    rows = []
+    for retention_time in retention_times:
+        intensity = np.abs(rng.normal(0.0, 2e5, point_count))
+        intensity += 1e6 * np.exp(-(((mz_array - 250.0) / 200.0) ** 2))
+        for compound_mz, compound_rt in compounds:
+            height = 5e7 * np.exp(
+                -(((retention_time - compound_rt - rt_shift) / 3.0) ** 2)
+            )
+            if height > 1.0:
+                intensity += height * np.exp(-(((mz_array - compound_mz) / 0.5) ** 2))
+        rows.append(
+            {"RT": retention_time, "mz_array": mz_array, "intensity_array": intensity}
+        )
+    return DataFrame(rows, columns=["RT", "mz_array", "intensity_array"])
+
+
+def generate_spectrum(sample_id: Optional[str] = None, **kwargs) -> Spectrum:
+    """
+    Generates a Spectrum, see generate_spectrum_frame for the keyword arguments.
+    """
+    return Spectrum(generate_spectrum_frame(**kwargs), sample_id=sample_id)
+
+
+def generate_cohort(
+    sample_count: int = 4, rt_drift: float = 0.7, **kwargs
+) -> List[Spectrum]:
+    """
+    Generates sample_count spectrums of the same compounds, each shifted by rt_drift more than the previous.
+    """
+    return [
+        generate_spectrum(
+            sample_id=f"sample_{index}", rt_shift=index * rt_drift, seed=index, **kwargs
+        )
+        for index in range(sample_count)
+    ]
+
+
+def write_spectrum_csv(path: str, **kwargs) -> str:
+    """
+    Writes a generated sample in the .csv format read by read_spectra, see generate_spectrum_frame
+    for the keyword arguments.
+    """
+    frame = generate_spectrum_frame(**kwargs)
+    DataFrame(
+        {
+            "RT": frame["RT"],
+            "intarray": [
+                format_float_list(values) for values in frame["intensity_array"]
+            ],
+            "mzarray": [format_float_list(values) for values in frame["mz_array"]],
+        }
+    ).to_csv(path, index=False)
+    return str(Path(path))
+
+
+def generate_cohort_peaks(
+    compound_count: int, sample_count: int = 4, rt_drift: float = 0.7, seed: int = 0
+) -> List[Spectrum]:
+    """
+    Generates detected peaks directly, without profile data: every sample has one peak per compound, shifted
+    by rt_drift more than the previous sample, with a little m/z and retention time jitter.
+    Returns spectrums without scans (see Spectrum.from_peaks), for the cohort-level stages.
+    """
+    rng = np.random.default_rng(seed)
+    compound_mz = rng.uniform(100.0, 1000.0, compound_count)
+    compound_rt = rng.uniform(0.0, 600.0, compound_count)
+    spectrum_list = []
+    for index in range(sample_count):
+        sample_id = f"sample_{index}"
+        retention_times = (
+            compound_rt + index * rt_drift + rng.normal(0.0, 0.05, compound_count)
+        )
+        mz_values = compound_mz + rng.normal(0.0, 0.001, compound_count)
+        intensities = rng.lognormal(16.0, 1.0, compound_count)
+        peaks = [
+            Peak(
+                scan_id=f"{sample_id}_{position}",
+                peak_index=position,
+                retention_time=float(retention_times[position]),
+                intensity=float(intensities[position]),
+                mz=float(mz_values[position]),
+                sample_id=sample_id,
+            )
+            for position in range(compound_count)
+        ]
+        spectrum_list.append(Spectrum.from_peaks(peaks, sample_id=sample_id))
+    return spectrum_list
@@ -0,0 +1,101 @@
+"""
+The baseline engines: their fit of the synthetic background, their peaks against the polynomial engine, the ALS
+solver and the matrix engines on blocks with empty scans. See benchmark_baseline.py for the timings.
+"""
+import warnings
+
+import numpy as np
+import pytest
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.spectrum import Spectrum
+from pyne.services.baseline_correction import (
+    BASELINE_ENGINES,
+    get_baseline_engine,
+    polynomial_baseline,
+    polynomial_baseline_matrix,
+)
+from pyne.services.preprocessor import detect_spectrum_peaks
+from pyne.tests.synthetic import generate_spectrum_frame
+from scipy.sparse import diags
+from scipy.sparse.linalg import spsolve
+
+FRAME = generate_spectrum_frame(scan_count=60, point_count=3000)
+MZ_ARRAY = np.linspace(100.0, 400.0, 3000)
+# The background of generate_spectrum_frame: the broad hump plus the mean of the half-normal noise
+TRUE_BASELINE = 1e6 * np.exp(-(((MZ_ARRAY - 250.0) / 200.0) ** 2)) + 2e5 * np.sqrt(
+    2 / np.pi
+)
+
+# Largest accepted median deviation from the true baseline, relative to the weakest peak (5e7 at the apex)
+BASELINE_TOLERANCE = 0.01
+
+
+def process(engine: str) -> Spectrum:
+    return detect_spectrum_peaks(
+        Spectrum(FRAME), config=PipelineConfig(baseline_engine=engine)
+    )
+
+
+@pytest.mark.parametrize("engine", sorted(BASELINE_ENGINES))
+def test_engine_follows_background(engine):
+    baseline = get_baseline_engine(engine)
+    deviations = [
+        np.median(np.abs(baseline(scan.intensity_array) - TRUE_BASELINE))
+        for scan in Spectrum(FRAME).scans
+    ]
+    assert max(deviations) <= BASELINE_TOLERANCE * 5e7
+
+
+@pytest.mark.parametrize("engine", sorted(BASELINE_ENGINES))
+def test_engine_peaks_match_polynomial(engine):
+    reference = process("polynomial")
+    candidate = process(engine)
+
+    assert [(peak.retention_time, peak.peak_index) for peak in candidate.peaks] == [
+        (peak.retention_time, peak.peak_index) for peak in reference.peaks
+    ]
+    np.testing.assert_allclose(
+        [peak.intensity for peak in candidate.peaks],
+        [peak.intensity for peak in reference.peaks],
+        rtol=0.02,
+    )
+
+
+def test_als_banded_solver_matches_sparse_solve():
+    values = FRAME["intensity_array"][0]
+    lam, p = 1e5, 0.01
+    size = values.size
+    difference = diags([1.0, -2.0, 1.0], [0, 1, 2], shape=(size - 2, size))
+    penalty = lam * (difference.T @ difference)
+    weights = np.ones(size)
+    for _ in range(10):
+        expected = spsolve((diags(weights) + penalty).tocsc(), weights * values)
+        weights = np.where(values > expected, p, 1.0 - p)
+
+    np.testing.assert_allclose(
+        get_baseline_engine("als", lam=lam, p=p)(values),
+        expected,
+        rtol=1e-6,
+        atol=1e-3,
+    )
+
+
+def test_polynomial_matrix_skips_all_zero_rows():
+    frame = generate_spectrum_frame(scan_count=4, point_count=500)
+    block = np.stack(frame["intensity_array"].tolist())
+    block[[0, 2]] = 0.0
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        baseline = polynomial_baseline_matrix(block)
+
+    assert not baseline[[0, 2]].any()
+    for row in (1, 3):
+        np.testing.assert_allclose(
+            baseline[row], polynomial_baseline(block[row]), rtol=1e-9
+        )
+
+
+def test_polynomial_matrix_of_empty_blocks():
+    assert polynomial_baseline_matrix(np.zeros((0, 10))).shape == (0, 10)
+    assert polynomial_baseline_matrix(np.zeros((3, 0))).shape == (3, 0)
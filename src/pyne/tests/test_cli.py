@@ -0,0 +1,116 @@
+"""
+Resuming (see JobManifest) and profiling the batch commands of the pyne CLI.
+"""
+import logging
+from pathlib import Path
+from pstats import Stats
+
+import pytest
+from pyne.cli import main
+from pyne.services.job_manifest import JobManifest
+from pyne.tests.synthetic import write_spectrum_csv
+
+
+@pytest.fixture
+def source_files(tmp_path):
+    return [
+        write_spectrum_csv(
+            str(tmp_path / f"sample_{index}.csv"),
+            scan_count=20,
+            point_count=500,
+            rt_shift=0.5 * index,
+            seed=index,
+        )
+        for index in range(3)
+    ]
+
+
+def preprocess(tmp_path: Path, source_files, *options) -> int:
+    output = str(tmp_path / "features.csv")
+    return main(["preprocess", *source_files, "-o", output, "-j", "1", *options])
+
+
+def finished_count(caplog) -> int:
+    [message] = [
+        record.getMessage()
+        for record in caplog.records
+        if "Detecting peaks" in record.getMessage()
+    ]
+    caplog.clear()
+    return int(message.split(", ")[1].split()[0])
+
+
+def test_changed_options_redo_finished_samples(tmp_path, source_files, caplog):
+    caplog.set_level(logging.INFO, logger="pyne.cli")
+
+    assert preprocess(tmp_path, source_files) == 0
+    assert finished_count(caplog) == 0
+    assert preprocess(tmp_path, source_files) == 0
+    assert finished_count(caplog) == 3
+
+    assert preprocess(tmp_path, source_files, "--sparsify-threshold", "1e6") == 0
+    assert finished_count(caplog) == 0
+    assert (
+        preprocess(
+            tmp_path, source_files, "--sparsify-threshold", "1e6", "--baseline", "als"
+        )
+        == 0
+    )
+    assert finished_count(caplog) == 0
+    assert (
+        preprocess(
+            tmp_path, source_files, "--sparsify-threshold", "1e6", "--baseline", "als"
+        )
+        == 0
+    )
+    assert finished_count(caplog) == 3
+
+
+def test_manifest_options_hash(tmp_path, source_files):
+    manifest = JobManifest(str(tmp_path / "manifest.jsonl"))
+    output = source_files[1]
+    manifest.mark_done(source_files[0], output, {"a": 1, "b": [1.0, 2.0]})
+
+    reloaded = JobManifest(str(tmp_path / "manifest.jsonl"))
+    assert reloaded.is_done(source_files[0], {"b": [1.0, 2.0], "a": 1})
+    assert not reloaded.is_done(source_files[0], {"a": 2, "b": [1.0, 2.0]})
+    assert not reloaded.is_done(source_files[0])
+
+
+@pytest.mark.parametrize("names", [("a/x.mzML", "b/x.mzML"), ("x.1.mzML", "x.2.mzML")])
+def test_convert_rejects_colliding_sample_names(tmp_path, names):
+    inputs = []
+    for name in names:
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.touch()
+        inputs.append(str(path))
+
+    assert main(["convert", *inputs, "-o", str(tmp_path / "csv"), "-j", "1"]) == 1
+    assert not (tmp_path / "csv" / "x.csv").exists()
+
+
+def test_profile_dir_splits_the_sample_stages(tmp_path, source_files):
+    profile_dir = tmp_path / "profiles"
+    output = str(tmp_path / "features.csv")
+
+    assert (
+        main(
+            ["preprocess", *source_files, "-o", output, "-j", "2"]
+            + ["--profile-dir", str(profile_dir)]
+        )
+        == 0
+    )
+
+    functions = {
+        stage: {
+            name for _, _, name in Stats(str(profile_dir / f"{stage}.pstats")).stats
+        }
+        for stage in ("read", "baseline_alignment", "noise_filtering", "peak_detection")
+    }
+    assert "convert_str_to_float_list" in functions["read"]
+    assert "align_baseline" in functions["baseline_alignment"]
+    assert "filter_noise" in functions["noise_filtering"]
+    assert "get_peaks" in functions["peak_detection"]
+    assert "align_baseline" not in functions["read"]
+    assert not (profile_dir / "sample_peaks.pstats").exists()
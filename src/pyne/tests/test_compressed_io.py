@@ -0,0 +1,86 @@
+"""
+Compressed versus uncompressed ingest: the same spectra from every compression format, see
+benchmark_compression.py for the throughput.
+"""
+import bz2
+import gzip
+import lzma
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pytest
+from pyne.services.compressed_io import detect_compression
+from pyne.services.spectrum_reader import read_spectrum
+from pyne.tests.synthetic import write_spectrum_csv
+
+OPENERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+
+def _zstd_open(path: str, mode: str):
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.open(path, mode)
+
+
+@pytest.fixture(scope="module")
+def samples(tmp_path_factory):
+    return write_samples(
+        tmp_path_factory.mktemp("compression"),
+        sample_count=2,
+        scan_count=20,
+        point_count=500,
+    )
+
+
+def write_samples(
+    directory: Path, sample_count: int, **kwargs
+) -> Dict[Optional[str], List[str]]:
+    """
+    Writes the same synthetic samples, uncompressed and in every available compression format, without telling
+    extensions. See generate_spectrum_frame for the keyword arguments.
+    Returns:
+        (Dict[Optional[str], List[str]]): The files of each compression format, None for the uncompressed ones.
+    """
+    plain = [
+        write_spectrum_csv(str(directory / f"plain_{index}.csv"), seed=index, **kwargs)
+        for index in range(sample_count)
+    ]
+    files = {None: plain}
+    for compression, opener in [*OPENERS.items(), ("zstd", _zstd_open)]:
+        try:
+            files[compression] = [
+                _compress(path, str(directory / f"{compression}_{index}.csv"), opener)
+                for index, path in enumerate(plain)
+            ]
+        except pytest.skip.Exception:
+            continue
+    return files
+
+
+def _compress(source: str, destination: str, opener) -> str:
+    with open(source, "rb") as source_file, opener(
+        destination, "wb"
+    ) as destination_file:
+        shutil.copyfileobj(source_file, destination_file)
+    return destination
+
+
+@pytest.mark.parametrize("compression", [*OPENERS, "zstd"])
+def test_compressed_read_matches_plain(samples, compression):
+    if compression not in samples:
+        pytest.skip(f"{compression} is not available.")
+    for plain, compressed in zip(samples[None], samples[compression]):
+        assert detect_compression(compressed) == compression
+        expected = read_spectrum(plain)
+        candidate = read_spectrum(compressed)
+        assert [scan.retention_time for scan in candidate.scans] == [
+            scan.retention_time for scan in expected.scans
+        ]
+        for candidate_scan, expected_scan in zip(candidate.scans, expected.scans):
+            np.testing.assert_array_equal(
+                candidate_scan.mz_array, expected_scan.mz_array
+            )
+            np.testing.assert_array_equal(
+                candidate_scan.intensity_array, expected_scan.intensity_array
+            )
@@ -0,0 +1,72 @@
+"""
+Differential suite: the optimized engines against their reference implementations, see differential.py.
+Set PYNE_RECORDED_SPECTRA to also run it on a recorded cohort.
+"""
+from functools import lru_cache
+from typing import Dict
+
+import numpy as np
+import pytest
+from pyne.services.baseline_correction import BASELINE_ENGINES
+from pyne.services.spectrum_reader import read_spectrum
+from pyne.tests.differential import (
+    TOLERANCES,
+    StageComparison,
+    _compare_items,
+    compare_baselines,
+    comparison_report,
+    recorded_spectrum_files,
+    run_differential,
+)
+from pyne.tests.synthetic import generate_cohort, generate_compounds, generate_spectrum
+
+SOURCES = ["generated", "generated_dense", "recorded"]
+
+
+@lru_cache(maxsize=None)
+def stage_comparisons(source: str) -> Dict[str, StageComparison]:
+    if source == "generated":
+        spectrum_list = generate_cohort(sample_count=4)
+    elif source == "generated_dense":
+        spectrum_list = generate_cohort(
+            sample_count=4, compounds=generate_compounds(40, seed=3)
+        )
+    else:
+        spectrum_list = [read_spectrum(path) for path in recorded_spectrum_files()]
+    comparisons = run_differential(spectrum_list, source=source)
+    print(f"\n{comparison_report(comparisons).to_string(index=False)}")
+    return {comparison.stage: comparison for comparison in comparisons}
+
+
+@pytest.mark.parametrize("stage", sorted(TOLERANCES))
+@pytest.mark.parametrize("source", SOURCES)
+def test_stage_within_tolerance(source, stage, record_property):
+    if source == "recorded" and len(recorded_spectrum_files()) < 2:
+        pytest.skip("Set PYNE_RECORDED_SPECTRA to at least two recorded .csv files.")
+    comparison = stage_comparisons(source)[stage]
+    record_property("comparison", comparison.to_dict())
+
+    assert comparison.reference_count > 0
+    assert comparison.within_tolerance(), comparison.to_dict()
+
+
+@pytest.mark.parametrize("engine", sorted(BASELINE_ENGINES))
+def test_matrix_baseline_engine(engine):
+    comparison = compare_baselines(
+        generate_spectrum(scan_count=20), "generated", engine
+    )
+    assert comparison.within_tolerance(), comparison.to_dict()
+
+
+def test_differences_are_reported():
+    reference = {("scan", 1): 10.0, ("scan", 2): 20.0, ("scan", 3): 30.0}
+    candidate = {("scan", 1): 10.0, ("scan", 2): 20.5, ("scan", 4): 40.0}
+    comparison = _compare_items(
+        "peak_detection", "test", reference, candidate, 2.0, 1.0
+    )
+
+    assert (comparison.missing, comparison.extra, comparison.mismatched) == (1, 1, 1)
+    assert comparison.reference_count == 3
+    assert comparison.speedup == 2.0
+    assert np.isclose(comparison.max_rel_deviation, 0.5 / 20.0)
+    assert not comparison.within_tolerance()
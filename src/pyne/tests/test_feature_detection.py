@@ -0,0 +1,100 @@
+"""
+Linking the peaks of consecutive scans into mass traces, see detect_mass_traces.
+"""
+from typing import List
+
+from pyne.models.peak import Peak
+from pyne.services.feature_detection import detect_mass_traces, mass_trace_peaks
+from scipy.integrate import trapezoid
+
+SCAN_RETENTION_TIMES = [float(scan) for scan in range(8)]
+
+
+def peak(scan: int, mz: float, intensity: float) -> Peak:
+    return Peak(
+        scan_id=f"scan_{scan}",
+        peak_index=int(mz * 10),
+        retention_time=SCAN_RETENTION_TIMES[scan],
+        intensity=intensity,
+        mz=mz,
+        sample_id="sample",
+    )
+
+
+def sample_peaks() -> List[Peak]:
+    return [
+        # an elution profile at m/z 100 with a little m/z jitter, next to one at m/z 100.2
+        *(
+            peak(scan, 100.0 + 0.01 * (-1) ** scan, intensity)
+            for scan, intensity in enumerate([1, 4, 9, 4, 1])
+        ),
+        *(peak(scan, 100.2, 2.0) for scan in (1, 2, 3)),
+        # m/z 200 misses scans 2 and 3, more than max_gap, so it is split into two traces
+        *(peak(scan, 200.0, 5.0) for scan in (0, 1, 4, 5)),
+        # a single-scan feature
+        peak(2, 300.0, 50.0),
+    ]
+
+
+def test_peaks_of_consecutive_scans_are_linked():
+    traces = detect_mass_traces(
+        sample_peaks(), scan_retention_times=SCAN_RETENTION_TIMES
+    )
+
+    assert [(round(trace.mean_mz, 3), trace.length) for trace in traces] == [
+        (100.002, 5),
+        (100.2, 3),
+        (200.0, 2),
+        (200.0, 2),
+    ]
+    assert [peak.scan_id for peak in traces[0].peaks] == [
+        f"scan_{scan}" for scan in range(5)
+    ]
+    assert traces[0].apex.retention_time == 2.0
+    assert traces[0].area == trapezoid([1, 4, 9, 4, 1], SCAN_RETENTION_TIMES[:5])
+
+
+def test_min_length_drops_single_scan_features():
+    traces = detect_mass_traces(
+        sample_peaks(), scan_retention_times=SCAN_RETENTION_TIMES
+    )
+    assert all(trace.mean_mz != 300.0 for trace in traces)
+
+    traces = detect_mass_traces(
+        sample_peaks(), min_length=1, scan_retention_times=SCAN_RETENTION_TIMES
+    )
+    [single] = [trace for trace in traces if trace.mean_mz == 300.0]
+    assert single.length == 1
+    assert single.area == 50.0
+
+    traces = detect_mass_traces(
+        sample_peaks(), min_length=3, scan_retention_times=SCAN_RETENTION_TIMES
+    )
+    assert [trace.length for trace in traces] == [5, 3]
+
+
+def test_scans_without_peaks_count_towards_max_gap():
+    peaks = [peak(scan, 200.0, 5.0) for scan in (0, 1, 4, 5)]
+    assert [trace.length for trace in detect_mass_traces(peaks)] == [4]
+    assert [
+        trace.length
+        for trace in detect_mass_traces(
+            peaks, scan_retention_times=SCAN_RETENTION_TIMES
+        )
+    ] == [2, 2]
+
+
+def test_one_peak_per_trace():
+    peaks = mass_trace_peaks(sample_peaks(), scan_retention_times=SCAN_RETENTION_TIMES)
+
+    assert len(peaks) == 4
+    assert [peak.retention_time for peak in peaks] == sorted(
+        peak.retention_time for peak in peaks
+    )
+    [apex] = [peak for peak in peaks if abs(peak.mz - 100.0) < 0.1]
+    assert (apex.retention_time, apex.scan_id, apex.sample_id) == (
+        2.0,
+        "scan_2",
+        "sample",
+    )
+    assert apex.intensity == trapezoid([1, 4, 9, 4, 1], SCAN_RETENTION_TIMES[:5])
@@ -0,0 +1,134 @@
+"""
+Grouping isotopologue and adduct features, see group_features, checked against a pairwise reference.
+"""
+from itertools import combinations
+from typing import List
+
+import numpy as np
+import pytest
+from pandas import DataFrame
+from pyne.services.feature_grouping import (
+    ADDUCT_DELTAS,
+    ISOTOPE_SPACING,
+    collapse_feature_groups,
+    group_features,
+)
+
+
+def reference_groups(
+    features: DataFrame,
+    mz_tolerance: float = 0.01,
+    rt_tolerance: float = 2.0,
+    max_isotopes: int = 3,
+    charges=(1,),
+) -> List[int]:
+    """
+    The groups of group_features from an O(n²) comparison of every pair of features, numbered in the order of
+    their first feature.
+    """
+    deltas = [
+        isotope * ISOTOPE_SPACING / charge
+        for charge in charges
+        for isotope in range(1, max_isotopes + 1)
+    ] + list(ADDUCT_DELTAS.values())
+    mz = features["mz"].to_numpy(dtype=float)
+    retention_times = features["RT"].to_numpy(dtype=float)
+    parents = list(range(len(features)))
+
+    def root(index: int) -> int:
+        while parents[index] != index:
+            index = parents[index]
+        return index
+
+    for first, second in combinations(range(len(features)), 2):
+        lighter, heavier = sorted((first, second), key=lambda index: mz[index])
+        related = abs(
+            retention_times[first] - retention_times[second]
+        ) <= rt_tolerance and any(
+            mz[lighter] + delta - mz_tolerance
+            <= mz[heavier]
+            <= mz[lighter] + delta + mz_tolerance
+            for delta in deltas
+        )
+        if related:
+            parents[root(first)] = root(second)
+
+    labels = {}
+    return [
+        labels.setdefault(root(index), len(labels)) for index in range(len(features))
+    ]
+
+
+def feature_table(seed: int) -> DataFrame:
+    """
+    A random feature table with planted 13C isotopologue and adduct partners of some features.
+    """
+    rng = np.random.default_rng(seed)
+    count = 150
+    mz = rng.uniform(100, 400, count)
+    retention_times = rng.uniform(0, 60, count)
+    planted_mz, planted_rt = [], []
+    for index in rng.choice(count, 30, replace=False):
+        delta = rng.choice(
+            [
+                ISOTOPE_SPACING,
+                2 * ISOTOPE_SPACING,
+                ISOTOPE_SPACING / 2,
+                *ADDUCT_DELTAS.values(),
+            ]
+        )
+        planted_mz.append(mz[index] + delta + rng.uniform(-0.005, 0.005))
+        planted_rt.append(retention_times[index] + rng.uniform(-1.5, 1.5))
+    return DataFrame(
+        {
+            "RT": np.concatenate([retention_times, planted_rt]),
+            "mz": np.concatenate([mz, planted_mz]),
+            "intensity": rng.uniform(1e3, 1e6, count + len(planted_mz)),
+        }
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("charges", [(1,), (1, 2)])
+def test_groups_match_pairwise_reference(seed, charges):
+    features = feature_table(seed)
+
+    grouped = group_features(features, charges=charges)
+
+    assert grouped["group"].tolist() == reference_groups(features, charges=charges)
+    assert grouped["group"].nunique() < len(features)
+
+
+def test_planted_partners_share_a_group():
+    features = DataFrame(
+        {
+            "RT": [10.0, 10.4, 9.7, 40.0, 40.2, 41.0],
+            "mz": [
+                200.0,
+                200.0 + ISOTOPE_SPACING,
+                200.0 + ADDUCT_DELTAS["[M+Na]+"],
+                300.0,
+                300.0 + ISOTOPE_SPACING,
+                300.0 + ADDUCT_DELTAS["[M+K]+"],
+            ],
+            "intensity": [5.0, 2.0, 1.0, 3.0, 1.0, 1.0],
+        }
+    )
+
+    grouped = group_features(features, rt_tolerance=0.5)
+    collapsed = collapse_feature_groups(grouped)
+
+    # the last adduct elutes 1 min after its monoisotopic feature, outside the RT tolerance
+    assert grouped["group"].tolist() == [0, 0, 0, 1, 1, 2]
+    assert collapsed["mz"].tolist() == [200.0, 300.0, 300.0 + ADDUCT_DELTAS["[M+K]+"]]
+    assert collapsed["group_size"].tolist() == [3, 2, 1]
+
+
+def test_empty_table():
+    features = DataFrame({"RT": [], "mz": [], "intensity": []})
+
+    grouped = group_features(features)
+    collapsed = collapse_feature_groups(grouped)
+
+    assert grouped.empty and "group" in grouped
+    assert collapsed.empty and "group_size" in collapsed
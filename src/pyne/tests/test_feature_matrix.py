@@ -0,0 +1,94 @@
+"""
+The wide feature matrix: its pivot of the clustered peaks, and its round trip through every file format.
+"""
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+from pyne.models.peak import Peak
+from pyne.services.deconvolution import deconvolve_peaks
+from pyne.services.feature_matrix import (
+    FILE_FORMATS,
+    build_feature_matrix,
+    read_feature_matrix,
+    write_feature_matrix,
+)
+from pyne.services.peak_clustering import apply_dbscan_clustering
+from pyne.services.preprocessor import retrieve_feature_matrix
+from pyne.tests.synthetic import generate_cohort_peaks
+
+SAMPLE_IDS = ["sample_0", "sample_1", "sample_2", "sample_empty"]
+
+
+@pytest.fixture(scope="module")
+def clustered_peaks():
+    spectrum_list = generate_cohort_peaks(compound_count=60, sample_count=3)
+    # every other compound is missing from sample_1, so its row has empty cells
+    spectrum_list[1].peaks = spectrum_list[1].peaks[::2]
+    # and sample_0 has a weaker second peak for some compounds, only the strongest one is kept
+    spectrum_list[0].peaks += [
+        Peak(
+            scan_id=peak.scan_id,
+            peak_index=peak.peak_index,
+            retention_time=peak.retention_time + 1.0,
+            intensity=peak.intensity / 2,
+            mz=peak.mz + 0.001,
+            sample_id=peak.sample_id,
+        )
+        for peak in spectrum_list[0].peaks[:10]
+    ]
+    peaks = [peak for spectrum in spectrum_list for peak in spectrum.peaks]
+    # a narrow eps (about 0.3 m/z units here) gives one cluster per compound
+    return apply_dbscan_clustering(retrieve_feature_matrix(peaks), eps=0.001)
+
+
+def test_pivot_matches_the_long_peak_table(clustered_peaks):
+    feature_matrix = build_feature_matrix(clustered_peaks, sample_ids=SAMPLE_IDS)
+
+    expected = (
+        clustered_peaks.pivot_table(
+            index="sample", columns="label", values="intensity", aggfunc="max"
+        )
+        .reindex(SAMPLE_IDS)
+        .fillna(0.0)
+    )
+    assert feature_matrix.sample_ids == SAMPLE_IDS
+    assert feature_matrix.shape == expected.shape
+    labels = expected.columns.tolist()
+    assert feature_matrix.features["label"].tolist() == labels
+    np.testing.assert_array_equal(feature_matrix.values.toarray(), expected.to_numpy())
+    assert feature_matrix.values.nnz == np.count_nonzero(expected.to_numpy())
+    assert feature_matrix.values[SAMPLE_IDS.index("sample_empty")].nnz == 0
+    assert 0 < feature_matrix.values[SAMPLE_IDS.index("sample_1")].nnz < len(labels)
+    assert_frame_equal(
+        feature_matrix.features.drop(columns="label"),
+        deconvolve_peaks(peaks_df=clustered_peaks),
+    )
+
+
+def test_samples_missing_from_sample_ids_are_rejected(clustered_peaks):
+    with pytest.raises(ValueError):
+        build_feature_matrix(clustered_peaks, sample_ids=["sample_0"])
+
+
+@pytest.mark.parametrize("file_format", FILE_FORMATS)
+def test_round_trip(clustered_peaks, tmp_path, file_format):
+    if file_format != "npz":
+        pytest.importorskip("pyarrow")
+    feature_matrix = build_feature_matrix(clustered_peaks, sample_ids=SAMPLE_IDS)
+    path = str(tmp_path / f"features.{file_format}")
+
+    write_feature_matrix(feature_matrix, path)
+    loaded = read_feature_matrix(path)
+
+    assert loaded.sample_ids == feature_matrix.sample_ids
+    assert_frame_equal(loaded.features, feature_matrix.features)
+    np.testing.assert_array_equal(
+        loaded.values.toarray(), feature_matrix.values.toarray()
+    )
+    assert_frame_equal(loaded.to_dataframe(), feature_matrix.to_dataframe())
+
+
+def test_unknown_formats_are_rejected(clustered_peaks, tmp_path):
+    feature_matrix = build_feature_matrix(clustered_peaks)
+    with pytest.raises(ValueError, match="Unsupported"):
+        write_feature_matrix(feature_matrix, str(tmp_path / "features.xlsx"))
@@ -0,0 +1,155 @@
+"""
+The warm job service: its queue, the rejected submissions, the HTTP interface and a worker crash.
+"""
+import json
+import os
+import signal
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+from threading import Thread
+from time import sleep
+
+import pytest
+from pyne.models.job import Job
+from pyne.services.job_service import JobQueueFull, JobService, _handler_class
+from pyne.tests.synthetic import write_spectrum_csv
+
+
+@pytest.fixture(scope="module")
+def source_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("jobs")
+    return [
+        write_spectrum_csv(
+            str(directory / f"sample_{index}.csv"),
+            scan_count=20,
+            point_count=500,
+            rt_shift=0.5 * index,
+            seed=index,
+        )
+        for index in range(3)
+    ]
+
+
+@pytest.fixture
+def service():
+    service = JobService(workers=1, max_queued=1)
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def client(service):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler_class(service))
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def request(method: str, path: str, body=None):
+        connection = HTTPConnection("127.0.0.1", server.server_port, timeout=60)
+        connection.request(
+            method, path, body=None if body is None else json.dumps(body)
+        )
+        response = connection.getresponse()
+        reply = json.loads(response.read())
+        connection.close()
+        return response.status, reply
+
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def test_job_runs_in_a_warm_worker(service, source_files):
+    job = service.wait(service.submit({"source_files": source_files}), timeout=60)
+
+    assert job.status == Job.DONE, job.error
+    assert job.result["feature_count"] == len(job.result["features"]) > 0
+    assert {"read", "clustering", "output", "total"} <= set(job.timings)
+    assert service.summary() == {
+        "workers": 1,
+        Job.QUEUED: 0,
+        Job.RUNNING: 0,
+        Job.DONE: 1,
+        Job.FAILED: 0,
+    }
+
+
+def test_submissions_beyond_max_queued_are_rejected(service, source_files):
+    job = service.submit({"source_files": source_files})
+    try:
+        with pytest.raises(JobQueueFull):
+            service.submit({"source_files": source_files})
+    finally:
+        service.wait(job, timeout=60)
+    assert job.status == Job.DONE, job.error
+    service.wait(service.submit({"source_files": source_files}), timeout=60)
+
+
+@pytest.mark.parametrize(
+    "request_body",
+    [
+        [],
+        {"source_files": []},
+        {"source_files": ["missing.csv"]},
+        {"source_files": ["sample.csv"], "unknown": 1},
+    ],
+)
+def test_invalid_requests_are_rejected(service, request_body):
+    with pytest.raises(ValueError):
+        service.submit(request_body)
+    assert service.list_jobs() == []
+
+
+def test_http_interface(client, source_files):
+    status, job = client("POST", "/jobs", {"source_files": source_files})
+    assert status == 202
+    assert job["status"] in (Job.QUEUED, Job.RUNNING)
+
+    assert client("POST", "/jobs", {"source_files": source_files})[0] == 503
+    assert client("POST", "/jobs", {"source_files": []})[0] == 400
+    assert client("GET", "/jobs/unknown")[0] == 404
+
+    status, finished = client("GET", f"/jobs/{job['job_id']}?wait=60")
+    assert status == 200
+    assert finished["status"] == Job.DONE, finished["error"]
+    assert finished["result"]["feature_count"] > 0
+
+    status, listing = client("GET", "/jobs")
+    assert [known["job_id"] for known in listing["jobs"]] == [job["job_id"]]
+    assert listing["jobs"][0]["result"] is None
+    status, health = client("GET", "/health")
+    assert (status, health["status"], health[Job.DONE]) == (200, "ok", 1)
+
+
+def test_service_recovers_from_a_worker_crash(source_files):
+    service = JobService(workers=1, max_queued=3)
+    try:
+        running = service.submit({"source_files": source_files})
+        queued = service.submit({"source_files": source_files})
+        assert queued.status == Job.QUEUED
+        while not running.future.running():
+            sleep(0.01)
+        for process in list(service._executor._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+
+        # only the job running during the crash fails, the queued job runs in the new pool
+        service.wait(running, timeout=60)
+        service.wait(queued, timeout=60)
+        later = service.wait(service.submit({"source_files": source_files}), timeout=60)
+        assert running.status == Job.FAILED
+        assert "BrokenProcessPool" in running.error
+        assert queued.status == Job.DONE, queued.error
+        assert later.status == Job.DONE, later.error
+        assert service.summary()[Job.FAILED] == 1
+    finally:
+        service.shutdown()
+
+
+def test_idle_worker_crash_fails_no_job(service, source_files):
+    for process in list(service._executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    while not service._executor._broken:
+        sleep(0.01)
+
+    job = service.wait(service.submit({"source_files": source_files}), timeout=60)
+
+    assert job.status == Job.DONE, job.error
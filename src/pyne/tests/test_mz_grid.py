@@ -0,0 +1,66 @@
+"""
+The common m/z grid stages against the per-scan stages, see benchmark_grid.py for the timings.
+"""
+import numpy as np
+import pytest
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.spectrum import Spectrum
+from pyne.services.baseline_correction import (
+    BASELINE_ENGINES,
+    get_baseline_engine,
+    get_matrix_baseline_engine,
+)
+from pyne.services.mz_grid import resample_cohort, resample_spectrum
+from pyne.services.preprocessor import detect_spectrum_peaks
+from pyne.tests.synthetic import generate_cohort, generate_spectrum_frame
+
+FRAME = generate_spectrum_frame(scan_count=60, point_count=3001)
+# The native spacing of the synthetic scans, so the grid points are the original points
+RESOLUTION = 0.1
+
+
+def process(config: PipelineConfig) -> Spectrum:
+    return detect_spectrum_peaks(Spectrum(FRAME), config=config)
+
+
+@pytest.mark.parametrize("engine", sorted(BASELINE_ENGINES))
+def test_matrix_engine_matches_scan_engine(engine):
+    matrix = np.stack(FRAME["intensity_array"].to_list())
+    expected = np.stack([get_baseline_engine(engine)(row) for row in matrix])
+    np.testing.assert_allclose(
+        get_matrix_baseline_engine(engine)(matrix), expected, rtol=1e-9, atol=1e-3
+    )
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_gridded_peaks_match_scan_peaks(sparse):
+    reference = process(PipelineConfig())
+    candidate = process(
+        PipelineConfig(mz_grid_resolution=RESOLUTION, sparse_grid=sparse)
+    )
+
+    assert [(peak.retention_time, peak.peak_index) for peak in candidate.peaks] == [
+        (peak.retention_time, peak.peak_index) for peak in reference.peaks
+    ]
+    np.testing.assert_allclose(
+        [peak.mz for peak in candidate.peaks], [peak.mz for peak in reference.peaks]
+    )
+    np.testing.assert_allclose(
+        [peak.intensity for peak in candidate.peaks],
+        [peak.intensity for peak in reference.peaks],
+        rtol=1e-6,
+    )
+
+
+def test_cohort_shares_grid():
+    gridded = resample_cohort(generate_cohort(sample_count=3), resolution=RESOLUTION)
+    assert len({spectrum.mz_grid.tobytes() for spectrum in gridded}) == 1
+
+
+def test_sparse_grid_of_sparsified_spectrum_is_smaller():
+    spectrum = Spectrum(FRAME)
+    spectrum.sparsify(threshold=2e6)
+    dense = resample_spectrum(spectrum, resolution=RESOLUTION)
+    sparse = resample_spectrum(spectrum, resolution=RESOLUTION, sparse=True)
+    np.testing.assert_array_equal(sparse.to_dense(), dense.to_dense())
+    assert sparse.nbytes < dense.nbytes / 4
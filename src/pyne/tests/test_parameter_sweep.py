@@ -0,0 +1,105 @@
+"""
+Parameter sweeps: every configuration against preprocess_data, and the stages shared between configurations.
+"""
+from collections import Counter
+
+import pytest
+from pandas.testing import assert_frame_equal
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.services import parameter_sweep
+from pyne.services.parameter_sweep import sweep_parameters
+from pyne.services.peak_clustering import EPS
+from pyne.services.preprocessor import preprocess_data
+from pyne.tests.synthetic import write_spectrum_csv
+
+
+@pytest.fixture(scope="module")
+def source_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("sweep")
+    return [
+        write_spectrum_csv(
+            str(directory / f"sample_{index}.csv"),
+            scan_count=20,
+            point_count=500,
+            rt_shift=0.5 * index,
+            seed=index,
+        )
+        for index in range(3)
+    ]
+
+
+def test_rows_match_preprocess_data(source_files):
+    grid = {"baseline_engine": ["polynomial", "rolling_min"], "noise_sigma": [0.7, 2.0]}
+
+    results = sweep_parameters(source_files, grid, keep_features=True)
+
+    assert results[list(grid)].values.tolist() == [
+        ["polynomial", 0.7],
+        ["polynomial", 2.0],
+        ["rolling_min", 0.7],
+        ["rolling_min", 2.0],
+    ]
+    for _, row in results.iterrows():
+        expected = preprocess_data(
+            source_files,
+            prefetch=0,
+            config=PipelineConfig(
+                baseline_engine=row["baseline_engine"], noise_sigma=row["noise_sigma"]
+            ),
+        )
+        assert row["features"] == len(expected) > 0
+        assert_frame_equal(
+            row["feature_table"].reset_index(drop=True),
+            expected.reset_index(drop=True),
+        )
+
+
+def test_stages_run_once_per_parameter_prefix(source_files, monkeypatch):
+    runs = Counter()
+
+    def counted(stage, function):
+        def run(*args, **kwargs):
+            runs[stage] += 1
+            return function(*args, **kwargs)
+
+        return run
+
+    for stage, function in list(parameter_sweep.STAGE_FUNCTIONS.items()):
+        monkeypatch.setitem(
+            parameter_sweep.STAGE_FUNCTIONS, stage, counted(stage, function)
+        )
+    monkeypatch.setattr(
+        parameter_sweep,
+        "_cluster_and_deconvolve",
+        counted("clustering", parameter_sweep._cluster_and_deconvolve),
+    )
+    grid = {
+        "noise_sigma": [0.7, 2.0],
+        "peak_min_dist": [30, 60],
+        "eps": [EPS, 2 * EPS],
+    }
+
+    results = sweep_parameters(source_files, grid)
+
+    assert len(results) == 8
+    assert runs == {
+        "baseline_alignment": 1,
+        "noise_filtering": 2,
+        "peak_detection": 4,
+        "peak_alignment": 4,
+        "clustering": 8,
+    }
+    # a shared stage reports the same time in every configuration that uses it
+    assert results["baseline_alignment"].nunique() == 1
+    assert results.groupby("noise_sigma")["noise_filtering"].nunique().eq(1).all()
+    assert (
+        results.groupby(["noise_sigma", "peak_min_dist"])["peak_detection"]
+        .nunique()
+        .eq(1)
+        .all()
+    )
+
+
+def test_unknown_parameters_are_rejected(source_files):
+    with pytest.raises(ValueError):
+        sweep_parameters(source_files, {"unknown": [1, 2]})
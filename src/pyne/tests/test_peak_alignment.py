@@ -0,0 +1,145 @@
+"""
+Per-spectrum retention time drift models of align_peaks and fit_rt_correction.
+"""
+import warnings
+
+import numpy as np
+import pytest
+from pyne.services.peak_alignment import (
+    align_peaks,
+    estimate_coarse_rt_alignment,
+    fit_rt_correction,
+)
+from pyne.tests.synthetic import (
+    generate_cohort,
+    generate_cohort_peaks,
+    generate_compounds,
+)
+
+RT_DRIFT = 0.7
+
+
+def test_constant_drift_is_recovered():
+    master_spectrum, test_spectrum = generate_cohort_peaks(
+        compound_count=400, sample_count=2, rt_drift=RT_DRIFT
+    )
+    correction = fit_rt_correction(
+        mz_adj_win=0.01,
+        rt_adj_win=5,
+        master_spectrum=master_spectrum,
+        test_spectrum=test_spectrum,
+    )
+    retention_times = np.linspace(50.0, 550.0, 11)
+
+    assert correction.pair_count >= 390
+    assert correction.master_spectrum_id == master_spectrum.spectrum_id
+    assert np.allclose(correction.drift(retention_times), -RT_DRIFT, atol=0.05)
+
+
+def test_align_peaks_fits_one_model_per_spectrum():
+    spectrum_list = generate_cohort_peaks(
+        compound_count=400, sample_count=4, rt_drift=RT_DRIFT
+    )
+    aligned_peaks = align_peaks(spectrum_list, mz_adj_win=0.01, rt_adj_win=5)
+
+    assert len(aligned_peaks) == 4 * 400
+    assert spectrum_list[0].rt_correction is None
+    for index, spectrum in enumerate(spectrum_list[1:], start=1):
+        drift = spectrum.rt_correction.drift(np.linspace(50.0, 550.0, 11))
+        assert np.allclose(drift, -index * RT_DRIFT, atol=0.05)
+
+
+def test_no_pairs_gives_zero_drift_without_warnings():
+    master_spectrum, test_spectrum = generate_cohort_peaks(
+        compound_count=50, sample_count=2
+    )
+    for peak in test_spectrum.peaks:
+        peak.mz += 5000.0
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        correction = fit_rt_correction(
+            mz_adj_win=0.01,
+            rt_adj_win=5,
+            master_spectrum=master_spectrum,
+            test_spectrum=test_spectrum,
+        )
+
+    assert correction.pair_count == 0
+    assert correction.drift(123.0) == 0.0
+
+
+@pytest.mark.parametrize("rt_shift", [2.5, -3.3, 6.0])
+def test_coarse_alignment_recovers_planted_shift(rt_shift):
+    master_spectrum, test_spectrum = generate_cohort(
+        sample_count=2, rt_drift=rt_shift, compounds=generate_compounds(20)
+    )
+    retention_times = np.linspace(5.0, 55.0, 11)
+
+    scale, shift = estimate_coarse_rt_alignment(
+        master_spectrum, test_spectrum, max_shift=10.0
+    )
+
+    assert type(scale) is float and type(shift) is float
+    # scale and shift trade off over a short run, the mapped retention times are within one scan interval
+    assert (
+        np.abs(scale * (retention_times + rt_shift) + shift - retention_times).max()
+        < 1.0
+    )
+
+
+def test_coarse_alignment_on_detected_peaks():
+    rt_shift = 2.5
+    spectrum_list = generate_cohort(
+        sample_count=2, rt_drift=rt_shift, compounds=generate_compounds(20)
+    )
+    for spectrum in spectrum_list:
+        spectrum.align_baselines()
+        spectrum.filter_noise(sigma=0.7)
+        spectrum.detect_peaks(thres=7e6, min_dist=60)
+    master_spectrum, test_spectrum = spectrum_list
+    retention_times = np.array([peak.retention_time for peak in test_spectrum.peaks])
+
+    errors = {}
+    for coarse_alignment in (False, True):
+        correction = fit_rt_correction(
+            mz_adj_win=0.01,
+            rt_adj_win=5,
+            master_spectrum=master_spectrum,
+            test_spectrum=test_spectrum,
+            coarse_alignment=coarse_alignment,
+        )
+        errors[coarse_alignment] = np.abs(
+            correction.drift(retention_times) + rt_shift
+        ).max()
+
+    assert type(correction.rt_shift) is float
+    # every scan of an eluting compound holds a peak at its m/z, which pairs up across scans without pre-alignment
+    assert errors[True] < 1.0
+    assert errors[True] < errors[False] / 2
+
+
+def test_cached_models_are_refitted_when_their_inputs_change():
+    spectrum_list = generate_cohort_peaks(compound_count=200, sample_count=2)
+    test_spectrum = spectrum_list[1]
+
+    align_peaks(spectrum_list, mz_adj_win=0.01, rt_adj_win=5)
+    first = test_spectrum.rt_correction
+    align_peaks(spectrum_list, mz_adj_win=0.01, rt_adj_win=5)
+    assert test_spectrum.rt_correction is first
+
+    align_peaks(spectrum_list, mz_adj_win=0.01, rt_adj_win=5, frac=0.5)
+    refitted = test_spectrum.rt_correction
+    assert refitted is not first
+
+    # detecting the peaks again gives other retention times
+    for peak in test_spectrum.peaks:
+        peak.retention_time += 1.0
+    aligned_peaks = align_peaks(spectrum_list, mz_adj_win=0.01, rt_adj_win=5, frac=0.5)
+    assert test_spectrum.rt_correction is not refitted
+    assert np.allclose(
+        test_spectrum.rt_correction.drift(np.linspace(50.0, 550.0, 11)),
+        -RT_DRIFT - 1.0,
+        atol=0.05,
+    )
+    assert len(aligned_peaks) == 2 * 200
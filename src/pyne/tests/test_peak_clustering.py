@@ -0,0 +1,38 @@
+"""
+The partitioned clustering and deconvolution against the single process ones, see benchmark_clustering.py for the
+timings.
+"""
+import numpy as np
+import pytest
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+from pyne.services.deconvolution import deconvolve_peaks
+from pyne.services.peak_clustering import apply_dbscan_clustering
+
+
+def generate_peak_table(peak_count: int, seed: int = 0) -> DataFrame:
+    """
+    Peaks spread over log-uniform m/z values, so the table has clusters of many sizes, gaps and noise peaks.
+    """
+    rng = np.random.default_rng(seed)
+    return DataFrame(
+        {
+            "RT": rng.uniform(0, 600, peak_count),
+            "mz": 10 ** rng.uniform(1, 4.5, peak_count),
+            # few distinct values, so deconvolution has to break intensity ties the same way
+            "intensity": rng.integers(1, 5, peak_count).astype(float),
+        }
+    )
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("workers", [2, 3])
+def test_partitioned_matches_single_process(seed, workers):
+    peaks_df = generate_peak_table(200, seed=seed)
+    expected = apply_dbscan_clustering(peaks_df.copy())
+    candidate = apply_dbscan_clustering(peaks_df.copy(), workers=workers)
+
+    assert_frame_equal(candidate, expected)
+    assert_frame_equal(
+        deconvolve_peaks(candidate, workers=workers), deconvolve_peaks(expected)
+    )
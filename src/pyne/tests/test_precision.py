@@ -0,0 +1,62 @@
+"""
+Accuracy of the float32 intensity mode against the float64 path, see benchmark_precision.py for the timings.
+"""
+import numpy as np
+from pyne.models.spectrum import Spectrum
+from pyne.services.peak_normalization import normalize_peaks
+from pyne.tests.synthetic import generate_spectrum_frame
+
+# Largest accepted deviation of a float32 intensity from the float64 one, relative to the scan maximum.
+RELATIVE_TOLERANCE = 1e-6
+
+FRAME = generate_spectrum_frame(scan_count=60, point_count=3000)
+
+
+def process(intensity_dtype) -> Spectrum:
+    spectrum = Spectrum(FRAME, intensity_dtype=intensity_dtype)
+    spectrum.align_baselines(deg=6)
+    spectrum.filter_noise(sigma=0.7)
+    spectrum.detect_peaks(thres=7000000, min_dist=60)
+    return spectrum
+
+
+def test_float32_intensities_match_float64():
+    reference = process(np.float64)
+    candidate = process(np.float32)
+
+    for reference_scan, scan in zip(reference.scans, candidate.scans):
+        assert scan.intensity_array.dtype == np.float32
+        deviation = np.abs(
+            reference_scan.intensity_array - scan.intensity_array.astype(np.float64)
+        ).max()
+        assert (
+            deviation
+            <= RELATIVE_TOLERANCE * np.abs(reference_scan.intensity_array).max()
+        )
+
+
+def test_float32_peaks_match_float64():
+    reference = process(np.float64)
+    candidate = process(np.float32)
+
+    assert [(peak.retention_time, peak.peak_index) for peak in candidate.peaks] == [
+        (peak.retention_time, peak.peak_index) for peak in reference.peaks
+    ]
+    np.testing.assert_allclose(
+        [peak.intensity for peak in candidate.peaks],
+        [peak.intensity for peak in reference.peaks],
+        rtol=RELATIVE_TOLERANCE,
+    )
+    np.testing.assert_allclose(
+        [peak.intensity for peak in normalize_peaks(candidate.peaks, dtype=np.float32)],
+        [peak.intensity for peak in normalize_peaks(reference.peaks)],
+        atol=RELATIVE_TOLERANCE,
+    )
+
+
+def test_float32_saves_a_quarter_of_scan_memory():
+    # the intensities take half the bytes, the m/z values stay float64
+    assert (
+        Spectrum(FRAME, intensity_dtype=np.float32).nbytes
+        == 0.75 * Spectrum(FRAME, intensity_dtype=np.float64).nbytes
+    )
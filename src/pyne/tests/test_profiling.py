@@ -0,0 +1,63 @@
+"""
+The per-stage timings and profiles of StageProfiler.
+"""
+import json
+from pstats import Stats
+from time import perf_counter
+
+from pyne.services.profiling import StageProfiler
+
+
+def busy_first_stage(seconds: float):
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        pass
+
+
+def busy_second_stage(seconds: float):
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        pass
+
+
+def test_each_stage_gets_its_own_profiles(tmp_path):
+    profiler = StageProfiler(output_dir=str(tmp_path), sample_interval=0.001)
+
+    with profiler.stage("first"):
+        busy_first_stage(0.1)
+    for _ in range(2):
+        with profiler.stage("second"):
+            busy_second_stage(0.05)
+    profiler.dump()
+
+    with open(tmp_path / "timings.json") as timings_file:
+        timings = json.load(timings_file)
+    assert set(timings) == {"first", "second"}
+    assert timings["first"] >= 0.1 and timings["second"] >= 0.1
+    for stage, other in (("first", "second"), ("second", "first")):
+        functions = {
+            name for _, _, name in Stats(str(tmp_path / f"{stage}.pstats")).stats
+        }
+        assert f"busy_{stage}_stage" in functions
+        assert f"busy_{other}_stage" not in functions
+
+        stacks = (tmp_path / f"{stage}.collapsed").read_text().splitlines()
+        assert stacks
+        for line in stacks:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+        assert any(f"busy_{stage}_stage" in line for line in stacks)
+        assert not any(f"busy_{other}_stage" in line for line in stacks)
+
+
+def test_disabled_profiler_only_times(tmp_path):
+    profiler = StageProfiler()
+
+    with profiler.stage("first"):
+        busy_first_stage(0.01)
+    profiler.dump()
+
+    assert not profiler.enabled
+    assert set(profiler.timings) == {"first"}
+    assert profiler.timings["first"] >= 0.01
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,96 @@
+"""
+Targeted runs on a region of interest: a region run must equal the full run restricted to the region.
+"""
+import numpy as np
+import pytest
+from pyne.models.pipeline_config import PipelineConfig
+from pyne.models.region import RegionOfInterest, merge_ranges
+from pyne.services.baseline_correction import BASELINE_ENGINES
+from pyne.services.preprocessor import detect_spectrum_peaks
+from pyne.services.spectrum_reader import read_spectrum
+from pyne.tests.synthetic import write_spectrum_csv
+
+REGION = RegionOfInterest(
+    rt_windows=[(15.0, 40.0)], mz_ranges=[(280.0, 320.0), (130.0, 170.0)]
+)
+
+
+@pytest.fixture(scope="module")
+def source_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp("region") / "sample.csv"
+    return write_spectrum_csv(str(path), scan_count=60, point_count=3000)
+
+
+def in_region(retention_time: float, mz: float) -> bool:
+    return any(
+        low <= retention_time <= high for low, high in REGION.rt_windows
+    ) and any(low <= mz <= high for low, high in REGION.mz_ranges)
+
+
+def test_ranges_are_sorted_and_merged():
+    assert merge_ranges([(5.0, 8.0), (1.0, 2.0), (1.5, 3.0)]) == [
+        (1.0, 3.0),
+        (5.0, 8.0),
+    ]
+    with pytest.raises(ValueError):
+        merge_ranges([(2.0, 1.0)])
+
+
+def test_retention_time_indexes_of_unsorted_scans():
+    region = RegionOfInterest(rt_windows=[(1.0, 2.0), (4.0, 4.0)])
+    assert region.retention_time_indexes([4.0, 0.5, 2.0, 3.0, 1.0]).tolist() == [
+        0,
+        2,
+        4,
+    ]
+
+
+def test_region_read_equals_restricted_full_read(source_file):
+    full = read_spectrum(source_file)
+    spectrum = read_spectrum(source_file, region=REGION)
+
+    expected_scans = [
+        scan for scan in full.scans if 15.0 <= scan.retention_time <= 40.0
+    ]
+    assert [scan.retention_time for scan in spectrum.scans] == [
+        scan.retention_time for scan in expected_scans
+    ]
+    for scan, full_scan in zip(spectrum.scans, expected_scans):
+        keep = np.zeros(full_scan.mz_array.size, dtype=bool)
+        for low, high in REGION.mz_ranges:
+            keep |= (full_scan.mz_array >= low) & (full_scan.mz_array <= high)
+        np.testing.assert_array_equal(scan.mz_array, full_scan.mz_array[keep])
+        np.testing.assert_array_equal(
+            scan.intensity_array, full_scan.intensity_array[keep]
+        )
+        assert scan.segment_offsets.tolist() == [
+            int(np.flatnonzero(full_scan.mz_array >= low)[0])
+            for low, _ in REGION.mz_ranges
+        ]
+
+
+@pytest.mark.parametrize("engine", sorted(BASELINE_ENGINES))
+def test_region_peaks_equal_restricted_full_peaks(source_file, engine):
+    config = PipelineConfig(baseline_engine=engine)
+    full = detect_spectrum_peaks(read_spectrum(source_file), config=config)
+    spectrum = detect_spectrum_peaks(
+        read_spectrum(source_file, region=REGION), config=config
+    )
+
+    expected_peaks = sorted(
+        (peak for peak in full.peaks if in_region(peak.retention_time, peak.mz)),
+        key=lambda peak: (peak.retention_time, peak.peak_index),
+    )
+    peaks = sorted(
+        spectrum.peaks, key=lambda peak: (peak.retention_time, peak.peak_index)
+    )
+    assert expected_peaks
+    assert [(peak.retention_time, peak.peak_index, peak.mz) for peak in peaks] == [
+        (peak.retention_time, peak.peak_index, peak.mz) for peak in expected_peaks
+    ]
+    # the baseline is fitted on each m/z range separately, which moves the intensities slightly
+    np.testing.assert_allclose(
+        [peak.intensity for peak in peaks],
+        [peak.intensity for peak in expected_peaks],
+        rtol=0.01,
+    )
@@ -0,0 +1,50 @@
+"""
+Segments of sparsified scans, see Scan.sparsify.
+"""
+import numpy as np
+from pyne.models.scan import Scan
+
+
+def single_run_scan() -> Scan:
+    # one Gaussian peak on a sloped background, the only region above the threshold
+    mz_array = np.linspace(100.0, 300.0, 200)
+    intensity_array = (
+        1e3 + 10.0 * np.arange(200) + 1e6 * np.exp(-(((mz_array - 160.0) / 5.0) ** 2))
+    )
+    return Scan(retention_time=1.0, mz_array=mz_array, intensity_array=intensity_array)
+
+
+def test_single_segment_scan_is_sparse():
+    scan = single_run_scan()
+    assert not scan.is_sparse
+
+    scan.sparsify(threshold=1e4, pad=5)
+
+    assert scan.is_sparse
+    assert scan.segment_offsets.size == 1
+    assert scan.segment_offsets[0] > 0
+    assert scan.segment_bounds.tolist() == [0, scan.mz_array.size]
+
+
+def test_single_segment_baseline_is_segment_minimum():
+    scan = single_run_scan()
+    scan.sparsify(threshold=1e4, pad=5)
+    segment = scan.intensity_array.copy()
+
+    scan.align_baseline()
+
+    assert np.allclose(scan.intensity_array, segment - segment.min())
+
+
+def test_single_segment_peaks_keep_profile_index():
+    profile_scan = single_run_scan()
+    scan = single_run_scan()
+    scan.sparsify(threshold=1e4, pad=5)
+    for each in (profile_scan, scan):
+        each.filter_noise(sigma=1)
+
+    [profile_peak] = profile_scan.get_peaks(thres=1e5, min_dist=10)
+    [peak] = scan.get_peaks(thres=1e5, min_dist=10)
+
+    assert peak.peak_index == profile_peak.peak_index
+    assert peak.mz == profile_peak.mz
@@ -0,0 +1,85 @@
+"""
+The scan-level QC prefilter (see Spectrum.prefilter_scans) and its ScanQCReport.
+"""
+import numpy as np
+import pytest
+from pandas import DataFrame
+from pyne.models.spectrum import Spectrum
+
+MZ = [100.0, 101.0, 102.0, 103.0, 104.0]
+THRESHOLD = 10.0
+SATURATION_INTENSITY = 1000.0
+
+# (retention time, m/z values, intensities) of one scan per QC outcome
+SCANS = [
+    (1.0, MZ, [1.0, 50.0, 2.0, 3.0, 1.0]),  # kept
+    (2.0, MZ, [1.0, 2.0, 3.0, 2.0, 1.0]),  # below the threshold
+    (3.0, [], []),  # empty
+    (
+        4.0,
+        [100.0, 102.0, 101.0, 103.0, 104.0],
+        [1.0, 50.0, 2.0, 3.0, 1.0],
+    ),  # m/z not ascending
+    (5.0, MZ, [1.0, 50.0, 2.0, 3.0]),  # length mismatch
+    (6.0, MZ, [1.0, 80.0, 80.0, 80.0, 1.0]),  # clipped, flat top
+    (7.0, MZ, [1.0, SATURATION_INTENSITY, 2.0, 3.0, 1.0]),  # detector maximum
+    (8.0, MZ, [1.0, np.nan, 50.0, 3.0, 1.0]),  # non-finite
+    (9.0, MZ, [2.0, 3.0, 40.0, 3.0, 2.0]),  # kept
+]
+
+
+def spectrum() -> Spectrum:
+    return Spectrum(
+        DataFrame(
+            [
+                {"RT": rt, "mz_array": mz, "intensity_array": intensity}
+                for rt, mz, intensity in SCANS
+            ]
+        )
+    )
+
+
+def flagged(mask) -> list:
+    return [rt for (rt, _, _), flag in zip(SCANS, mask) if flag]
+
+
+@pytest.mark.parametrize("drop_saturated", [False, True])
+def test_prefilter_flags_and_drops_scans(drop_saturated):
+    filtered = spectrum()
+
+    report = filtered.prefilter_scans(
+        thres=THRESHOLD,
+        saturation_intensity=SATURATION_INTENSITY,
+        drop_saturated=drop_saturated,
+    )
+
+    assert report is filtered.qc_report
+    assert flagged(report.malformed) == [3.0, 4.0, 5.0, 8.0]
+    assert flagged(report.below_threshold) == [2.0]
+    assert flagged(report.saturated) == [6.0, 7.0]
+    dropped = [2.0, 3.0, 4.0, 5.0, 8.0] + ([6.0, 7.0] if drop_saturated else [])
+    skipped_points = 29 if drop_saturated else 19
+    assert flagged(report.dropped) == sorted(dropped)
+    kept = [rt for rt, _, _ in SCANS if rt not in dropped]
+    assert [scan.retention_time for scan in filtered.scans] == kept
+
+    np.testing.assert_array_equal(report.lengths, [5, 5, 0, 5, 4, 5, 5, 5, 5])
+    assert report.max_intensity[0] == 50.0 and report.tic[0] == 57.0
+    assert report.summary() == {
+        "scans": 9,
+        "below_threshold": 1,
+        "saturated": 2,
+        "malformed": 4,
+        "skipped_scans": len(dropped),
+        "skipped_points": skipped_points,
+        "skipped_fraction": skipped_points / 39,
+    }
+
+
+def test_saturation_needs_a_flat_top_without_a_detector_maximum():
+    filtered = spectrum()
+
+    report = filtered.prefilter_scans(thres=THRESHOLD, saturation_run=3)
+
+    assert flagged(report.saturated) == [6.0]
+    assert flagged(report.dropped) == [2.0, 3.0, 4.0, 5.0, 8.0]
@@ -0,0 +1,67 @@
+"""
+The scan-level stages of a Spectrum: split across threads (see Spectrum.workers) and on sparsified scans.
+"""
+import logging
+
+import numpy as np
+import pytest
+from pyne.models.spectrum import Spectrum
+from pyne.tests.synthetic import generate_spectrum_frame
+
+FRAME = generate_spectrum_frame(scan_count=30, point_count=1000)
+
+
+def process(workers: int, sparsify_threshold=None) -> Spectrum:
+    spectrum = Spectrum(FRAME, workers=workers)
+    if sparsify_threshold is not None:
+        spectrum.sparsify(threshold=sparsify_threshold)
+    spectrum.align_baselines(deg=6)
+    spectrum.filter_noise(sigma=0.7)
+    spectrum.detect_peaks(thres=7000000, min_dist=60)
+    return spectrum
+
+
+@pytest.mark.parametrize("workers", [2, 3, 64])
+@pytest.mark.parametrize("sparsify_threshold", [None, 2e6])
+def test_threaded_stages_match_a_single_thread(workers, sparsify_threshold):
+    reference = process(1, sparsify_threshold)
+    candidate = process(workers, sparsify_threshold)
+
+    assert reference.peak_count > 0
+    assert [
+        (peak.retention_time, peak.peak_index, peak.mz, peak.intensity)
+        for peak in candidate.peaks
+    ] == [
+        (peak.retention_time, peak.peak_index, peak.mz, peak.intensity)
+        for peak in reference.peaks
+    ]
+    for scan, reference_scan in zip(candidate.scans, reference.scans):
+        np.testing.assert_array_equal(
+            scan.intensity_array, reference_scan.intensity_array
+        )
+
+
+def test_map_scans_keeps_the_scan_order():
+    spectrum = Spectrum(FRAME, workers=4)
+
+    assert spectrum._map_scans(lambda scan: scan.retention_time) == FRAME["RT"].tolist()
+
+
+def test_baseline_engine_of_sparsified_scans_is_ignored_with_a_warning(caplog):
+    plain, sparsified = Spectrum(FRAME), Spectrum(FRAME)
+    sparsified.sparsify(threshold=2e6)
+    reference = Spectrum(FRAME)
+    reference.sparsify(threshold=2e6)
+
+    caplog.set_level(logging.WARNING, logger="pyne.models.spectrum")
+    plain.align_baselines(baseline=np.zeros_like)
+    assert caplog.records == []
+    sparsified.align_baselines(baseline=np.zeros_like)
+    reference.align_baselines()
+
+    [record] = caplog.records
+    assert "baseline engine is ignored" in record.getMessage()
+    for scan, reference_scan in zip(sparsified.scans, reference.scans):
+        np.testing.assert_array_equal(
+            scan.intensity_array, reference_scan.intensity_array
+        )
@@ -0,0 +1,166 @@
+"""
+Sample IDs of the source files (see check_sample_names), and the background reader of iter_spectra.
+"""
+import threading
+from time import sleep
+
+import numpy as np
+import pytest
+from pyne.services import spectrum_reader
+from pyne.services.preprocessor import preprocess_data
+from pyne.services.spectrum_reader import (
+    check_sample_names,
+    iter_spectra,
+    read_spectra,
+    sample_name,
+)
+from pyne.tests.synthetic import write_spectrum_csv
+
+
+@pytest.mark.parametrize(
+    "source_files",
+    [
+        ["a/sample.csv", "b/sample.csv"],
+        ["sample.1.csv", "sample.2.csv"],
+        ["sample.csv", "sample.csv.gz"],
+    ],
+)
+def test_colliding_sample_names_are_rejected(source_files):
+    assert len({sample_name(source_file) for source_file in source_files}) == 1
+    with pytest.raises(ValueError, match="same sample"):
+        check_sample_names(source_files)
+
+
+def test_distinct_sample_names_are_accepted():
+    check_sample_names(["a/sample_1.csv", "b/sample_2.csv.gz", "sample_3.csv"])
+
+
+@pytest.fixture
+def colliding_files(tmp_path):
+    source_files = []
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        source_files.append(
+            write_spectrum_csv(
+                str(tmp_path / directory / "sample.csv"), scan_count=5, point_count=50
+            )
+        )
+    return source_files
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_readers_reject_colliding_files(colliding_files, prefetch):
+    with pytest.raises(ValueError, match="same sample"):
+        read_spectra(source_files=colliding_files)
+    with pytest.raises(ValueError, match="same sample"):
+        next(iter_spectra(source_files=colliding_files, prefetch=prefetch))
+
+
+def test_preprocess_data_rejects_colliding_files(colliding_files):
+    with pytest.raises(ValueError, match="same sample"):
+        preprocess_data(source_files=colliding_files)
+
+
+@pytest.fixture
+def source_files(tmp_path):
+    return [
+        write_spectrum_csv(
+            str(tmp_path / f"sample_{index}.csv"),
+            scan_count=5,
+            point_count=200,
+            rt_shift=0.5 * index,
+            seed=index,
+        )
+        for index in range(6)
+    ]
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """
+    Counts the started reads of iter_spectra.
+    """
+    started = []
+    read_spectrum = spectrum_reader.read_spectrum
+
+    def counted(source_file, **kwargs):
+        started.append(source_file)
+        return read_spectrum(source_file, **kwargs)
+
+    monkeypatch.setattr(spectrum_reader, "read_spectrum", counted)
+    return started
+
+
+def prefetch_threads():
+    return [
+        thread for thread in threading.enumerate() if thread.name == "spectrum-prefetch"
+    ]
+
+
+@pytest.mark.parametrize("prefetch, read_workers", [(0, 1), (1, 1), (2, 1), (2, 3)])
+def test_iter_spectra_matches_read_spectra(source_files, prefetch, read_workers):
+    expected = read_spectra(source_files)
+
+    spectra = list(
+        iter_spectra(source_files, prefetch=prefetch, read_workers=read_workers)
+    )
+
+    assert [spectrum.sample_id for spectrum in spectra] == [
+        sample_name(source_file) for source_file in source_files
+    ]
+    for spectrum, reference in zip(spectra, expected):
+        assert len(spectrum.scans) == len(reference.scans)
+        for scan, reference_scan in zip(spectrum.scans, reference.scans):
+            assert scan.retention_time == reference_scan.retention_time
+            np.testing.assert_array_equal(scan.mz_array, reference_scan.mz_array)
+            np.testing.assert_array_equal(
+                scan.intensity_array, reference_scan.intensity_array
+            )
+    assert not prefetch_threads()
+
+
+@pytest.mark.parametrize("read_workers", [1, 2])
+def test_read_errors_reach_the_consumer(source_files, read_workers):
+    broken = source_files[:2] + [source_files[2] + ".missing"] + source_files[3:]
+
+    spectra = iter_spectra(broken, prefetch=2, read_workers=read_workers)
+
+    assert [next(spectra).sample_id for _ in range(2)] == ["sample_0", "sample_1"]
+    with pytest.raises(FileNotFoundError):
+        next(spectra)
+    assert not prefetch_threads()
+
+
+def test_closing_early_stops_the_reader(source_files, reads):
+    spectra = iter_spectra(source_files, prefetch=1)
+    assert next(spectra).sample_id == "sample_0"
+    sleep(0.5)
+
+    spectra.close()
+
+    assert not prefetch_threads()
+    # the first spectrum, one waiting in the queue and one blocked on the full queue
+    assert len(reads) <= 3 < len(source_files)
+
+
+@pytest.mark.parametrize("read_workers", [1, 2])
+def test_buffer_stays_within_max_buffered_bytes(source_files, reads, read_workers):
+    size = read_spectra(source_files[:1])[0].nbytes
+    max_buffered_bytes = 2 * size
+    waiting = []
+
+    for consumed, _ in enumerate(
+        iter_spectra(
+            source_files,
+            prefetch=len(source_files),
+            max_buffered_bytes=max_buffered_bytes,
+            read_workers=read_workers,
+        ),
+        start=1,
+    ):
+        # give the reader time to fill the buffer, the started reads bound the waiting spectrums
+        sleep(0.3)
+        waiting.append(len(reads) - consumed)
+
+    assert max(waiting) >= 2
+    assert max(waiting) * size <= max_buffered_bytes + read_workers * size
@@ -0,0 +1,79 @@
+"""
+The extracted-ion chromatograms of XICIndex against a brute-force scan over every point.
+"""
+import numpy as np
+import pytest
+from pyne.models.spectrum import Spectrum
+from pyne.models.xic_index import XICIndex
+from pyne.tests.synthetic import generate_spectrum_frame
+
+BIN_WIDTH = 0.01
+SCANS = Spectrum(generate_spectrum_frame(scan_count=20, point_count=800)).scans
+
+
+def brute_force_chromatogram(scans, mz: float, tolerance: float, aggregate: str):
+    retention_times, intensities = [], []
+    for scan in scans:
+        inside = (scan.mz_array >= mz - tolerance) & (scan.mz_array <= mz + tolerance)
+        if inside.any():
+            values = scan.intensity_array[inside].astype(np.float64)
+            retention_times.append(scan.retention_time)
+            intensities.append(values.sum() if aggregate == "sum" else values.max())
+    return np.asarray(retention_times, dtype=np.float64), np.asarray(intensities)
+
+
+def queries():
+    rng = np.random.default_rng(0)
+    mz = np.concatenate([scan.mz_array for scan in SCANS])
+    # random windows, windows centred on a bin edge, windows spanning several bins
+    # and windows whose lower bound falls on a point
+    random = [
+        (center, tolerance)
+        for center, tolerance in zip(
+            rng.uniform(mz.min() - 1, mz.max() + 1, 60),
+            rng.uniform(0.0005, 0.05, 60),
+        )
+    ]
+    edges = [
+        (edge * BIN_WIDTH, tolerance)
+        for edge in np.floor(rng.choice(mz, 20) / BIN_WIDTH)
+        for tolerance in (0.0001, BIN_WIDTH / 2, BIN_WIDTH, 3.5 * BIN_WIDTH)
+    ]
+    on_points = [
+        (point + tolerance, tolerance)
+        for point in rng.choice(mz, 20)
+        for tolerance in (0.0, BIN_WIDTH)
+    ]
+    return random + edges + on_points
+
+
+@pytest.mark.parametrize("aggregate", ["sum", "max"])
+def test_chromatograms_match_a_brute_force_scan(aggregate):
+    index = XICIndex(SCANS, bin_width=BIN_WIDTH)
+
+    found = 0
+    for mz, tolerance in queries():
+        retention_times, intensities = index.chromatogram(mz, tolerance, aggregate)
+        expected_times, expected = brute_force_chromatogram(
+            SCANS, mz, tolerance, aggregate
+        )
+        np.testing.assert_array_equal(retention_times, expected_times)
+        np.testing.assert_allclose(intensities, expected, rtol=1e-12)
+        found += retention_times.size > 0
+    assert found > 50
+
+
+def test_empty_index_returns_empty_chromatograms():
+    index = XICIndex([], bin_width=BIN_WIDTH)
+
+    for aggregate in ("sum", "max"):
+        retention_times, intensities = index.chromatogram(500.0, 0.1, aggregate)
+        assert retention_times.size == intensities.size == 0
+    assert index.postings(500.0, 0.1).size == 0
+
+
+def test_invalid_arguments_are_rejected():
+    with pytest.raises(ValueError):
+        XICIndex(SCANS, bin_width=0)
+    with pytest.raises(ValueError):
+        XICIndex(SCANS).chromatogram(500.0, 0.1, aggregate="mean")